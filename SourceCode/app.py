@@ -22,16 +22,59 @@
 # Import Dependencies
 import numpy as np
 import pandas as pd
+import bisect
+import threading
 import datetime as dt
 import flask
-from flask import jsonify, Flask
+from flask import jsonify, Flask, request
 
 # Reflect Tables into SQLAlchemy ORM
 # Import - Python SQL toolkit and Object Relational Mapper
 import sqlalchemy
-from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, func, alias, and_
+from sqlalchemy import func, alias, and_
+
+# Shared database layer: engine, pooled sessions and the reflected Measurement / Station classes
+import db
+from db import Measurement, Station, DailySummary
+
+# Optional in-process columnar store for the date range routes (HAWAII_USE_STORE=1)
+import store
+
+# Storage backend of the core routes: sqlite, numpy (the store) or duckdb (HAWAII_BACKEND)
+import backends
+
+# Response cache for the API routes (HAWAII_CACHE=0 to disable)
+from cache import ResponseCache
+
+# Chunked JSON / NDJSON responses for large results (?stream=1 or ?stream=ndjson)
+import streaming
+
+# Per-request timings (Server-Timing header), /metrics and the optional cProfile sampling (HAWAII_PROFILE=1)
+import instrument
+
+# Compiled Core statements and JSON encoders specialized to the row shapes of the routes
+import queries
+
+# Many ranges / month-day keys evaluated in one query
+import batch
+
+# Station registry: slots records, integer ids, the /api/v1.0/stations document serialized once
+import stations as stations_db
+
+# Grid index over the station coordinates: nearest / radius / bounding box queries
+import spatial
+
+# Resampled (week / month / year) and rolling time series of tobs / prcp
+import timeseries
+
+# Daily normals of every month-day key, computed in one vectorized pass
+import climatology
+
+# Negotiated compression (gzip / br) and compact formats (?format=columnar|msgpack|csv|arrow or the Accept header)
+import wire
+
+# Keyset pages, station filters, sub-windows and projection (?limit=, ?cursor=, ?station=, ?from=, ?to=, ?fields=)
+import paging
 
 ###======================================================================================================================================================###
 
@@ -41,20 +84,14 @@ from sqlalchemy import create_engine, func, alias, and_
 ###======================================================================================================================================================###
 # Query to retrieve the last 12 months of precipitation 
 
-def q_precipitation():
-
-    # Connection syntax for sqlite://<nohostname>/<path> where <path> is relative: So in this case use .. to go one folder up
-    engine = create_engine("sqlite:///../Resources/hawaii.sqlite")
-    # Reflect an existing database into a new model
-    Base = automap_base()
-    Base.prepare(engine, reflect=True)
-    # Save references to each table
-    Measurement = Base.classes.measurement
-    # Create our session (link) from Python to the DB
-    session = Session(engine)
+@instrument.timed("q_precipitation")
+def q_precipitation(stream=False):
 
-    # Calculate the date 1 year ago from the last data point in the database
-    maxdate_str = session.query(func.max(Measurement.date)).first()[0]
+    # Calculate the date 1 year ago from the last data point in the database (read through the configured backend)
+    maxdate_str = data_backend.max_date()
+    # No measurement yet (every backend returns None then): nothing in the last 12 months
+    if maxdate_str is None:
+        return []
     # Convert to date (use dt.datetime.strptime().date())
     maxdate = dt.datetime.strptime(maxdate_str, '%Y-%m-%d').date()
     maxdate_1yearago = maxdate - dt.timedelta(days=365)
@@ -62,10 +99,10 @@ def q_precipitation():
 
     # Perform a query to retrieve the data and precipitation scores
     # Dropped where precipitation is NULL (can be done in Pandas Datframe also)
-    precip_scores_result = session.query(Measurement.date, Measurement.prcp).filter(Measurement.date >= maxdate_1yearago_str).filter(Measurement.prcp.isnot(None)).all()
-    
-    # Close the connection & Return 
-    session.close()
+    # Streaming: yield the rows in batches instead of building the full list
+    precip_scores_result = data_backend.precipitation(maxdate_1yearago_str, streaming.STREAM_BATCH_SIZE if stream else None)
+
+    # Return (the session is closed by the Flask teardown hook)
     return precip_scores_result
 
 
@@ -74,24 +111,62 @@ def q_precipitation():
 ###======================================================================================================================================================###
 # Query to retrieve the stations
 
+# Loaded on the first request, reloaded when the station table changes (stations.py)
+station_registry = None
+station_registry_lock = threading.Lock()
+
+@instrument.timed("q_stationRegistry")
+def q_stationRegistry():
+    global station_registry
+
+    # Request-scoped session from the shared database layer (engine & reflected classes are created once in db.py)
+    session = db.session()
+    dbapi_conn = queries.dbapi_connection(session)
+
+    # One (count, max(id)) query instead of reading and serializing every station row
+    version = stations_db.registry_version(dbapi_conn)
+    with station_registry_lock:
+        if station_registry is None or station_registry.version != version:
+            station_registry = stations_db.load_registry(dbapi_conn)
+        return station_registry
+
+
+@instrument.timed("q_stations")
 def q_stations():
 
-    # Connection syntax for sqlite://<nohostname>/<path> where <path> is relative: So in this case use .. to go one folder up
-    engine = create_engine("sqlite:///../Resources/hawaii.sqlite")
-    # Reflect an existing database into a new model
-    Base = automap_base()
-    Base.prepare(engine, reflect=True)
-    # Save references to each table
-    Station = Base.classes.station
-    # Create our session (link) from Python to the DB
-    session = Session(engine)
+    # Perform a query to retrieve the stations data (rows of the registry, for every backend)
+    return data_backend.stations()
+
+
+# Rebuilt with the registry
+station_index = None
+
+@instrument.timed("q_stationIndex")
+def q_stationIndex():
+    global station_index
 
-    # Perform a query to retrieve the stations data 
-    stations_result = session.query(Station.station, Station.name, Station.latitude, Station.longitude, Station.elevation).all()
+    registry = q_stationRegistry()
+    with station_registry_lock:
+        if station_index is None or station_index.version != registry.version:
+            station_index = spatial.StationIndex(registry.records, registry.version)
+        return station_index
 
-    # Close the connection & Return 
-    session.close()
-    return stations_result
+
+@instrument.timed("q_stationStats")
+def q_stationStats(codes, date_range):
+
+    # tobs / prcp aggregates of the located stations over the ?start=&end= range
+    start, end = date_range
+    measurement_store = q_store()
+    if measurement_store is not None:
+        return spatial.station_stats_store(measurement_store, codes, start, end)
+
+    session = db.session()
+    dbapi_conn = queries.dbapi_connection(session)
+    station_ids = q_stationRegistry().ids_of(codes) if STATION_IDS else None
+    if station_ids is not None and len(station_ids) != len(codes):
+        station_ids = None
+    return spatial.station_stats_sql(dbapi_conn, codes, start, end, station_ids)
 
 
 ###======================================================================================================================================================###
@@ -99,30 +174,24 @@ def q_stations():
 ###======================================================================================================================================================###
 # Query to retrieve the last 12 months of tobs
 
-def q_tobs():
+@instrument.timed("q_tobs")
+def q_tobs(stream=False):
 
-    # Connection syntax for sqlite://<nohostname>/<path> where <path> is relative: So in this case use .. to go one folder up
-    engine = create_engine("sqlite:///../Resources/hawaii.sqlite")
-    # Reflect an existing database into a new model
-    Base = automap_base()
-    Base.prepare(engine, reflect=True)
-    # Save references to each table
-    Measurement = Base.classes.measurement
-    # Create our session (link) from Python to the DB
-    session = Session(engine)
-
-    # Calculate the date 1 year ago from the last data point in the database
-    maxdate_str = session.query(func.max(Measurement.date)).first()[0]
+    # Calculate the date 1 year ago from the last data point in the database (read through the configured backend)
+    maxdate_str = data_backend.max_date()
+    # No measurement yet (every backend returns None then): nothing in the last 12 months
+    if maxdate_str is None:
+        return []
     # Convert to date (use dt.datetime.strptime().date())
     maxdate = dt.datetime.strptime(maxdate_str, '%Y-%m-%d').date()
     maxdate_1yearago = maxdate - dt.timedelta(days=365)
     maxdate_1yearago_str = maxdate_1yearago.strftime('%Y-%m-%d')
 
     # Perform a query to retrieve the data 
-    tobsscores_result = session.query(Measurement.date, Measurement.tobs).filter(Measurement.date >= maxdate_1yearago_str).all()
-    
-    # Close the connection & Return 
-    session.close()
+    # Streaming: yield the rows in batches instead of building the full list
+    tobsscores_result = data_backend.tobs(maxdate_1yearago_str, streaming.STREAM_BATCH_SIZE if stream else None)
+
+    # Return (the session is closed by the Flask teardown hook)
     return tobsscores_result
 
 
@@ -131,38 +200,176 @@ def q_tobs():
 ###======================================================================================================================================================###
 # Query to retrieve by start date (and end date if provided)
 
-def q_byDate(sdate, edate=None):
+# measurement.station_id added by "python stations.py migrate"
+STATION_IDS = stations_db.has_station_ids(db.engine)
 
-    # Connection syntax for sqlite://<nohostname>/<path> where <path> is relative: So in this case use .. to go one folder up
-    engine = create_engine("sqlite:///../Resources/hawaii.sqlite")
-    # Reflect an existing database into a new model
-    Base = automap_base()
-    Base.prepare(engine, reflect=True)
-    # Save references to each table
-    Measurement = Base.classes.measurement
-    # Create our session (link) from Python to the DB
-    session = Session(engine)
+# Loaded at startup when HAWAII_USE_STORE=1 or HAWAII_BACKEND=numpy and reloaded when the measurement data changes, None otherwise
+store_loader = None
+if store.USE_STORE or backends.BACKEND == "numpy":
+    store_loader = store.Reloader(lambda: store.load_store(db.router.reader(), Measurement), db.data_version)
+
+
+def q_store():
+
+    # The current in-memory store, None when it is disabled
+    return None if store_loader is None else store_loader.get()
 
-    # If not end date: (start only), calculate TMIN, TAVG, and TMAX for all dates greater than and equal to the start date.
-    if edate == None:
-        startdate = dt.datetime.strptime(sdate, '%Y%m%d').strftime('%Y-%m-%d')
-        searchdate_result = session.query(Measurement.date, func.min(Measurement.tobs), func.avg(Measurement.tobs), func.max(Measurement.tobs))\
-            .filter(Measurement.date>=startdate)\
-            .group_by(Measurement.date).all()
 
+# Backend of q_precipitation, q_tobs, q_stations and q_byDate (backends.py)
+data_backend = backends.make_backend(backends.BACKEND, q_stationRegistry, db.engine, q_store, db.data_version)
+
+@instrument.timed("q_byDate")
+def q_byDate(sdate, edate=None, stream=False):
+
+    # Dates come in as %Y%m%d, the database stores %Y-%m-%d
+    startdate = dt.datetime.strptime(sdate, '%Y%m%d').strftime('%Y-%m-%d')
+    enddate = None if edate == None else dt.datetime.strptime(edate, '%Y%m%d').strftime('%Y-%m-%d')
+
+    # If not end date: (start only), calculate TMIN, TAVG, and TMAX for all dates greater than and equal to the start date.
     # When given the start and the end date, calculate the TMIN, TAVG, and TMAX for dates between the start and end date inclusive.
-    else:
-        startdate = dt.datetime.strptime(sdate, '%Y%m%d').strftime('%Y-%m-%d')
-        enddate = dt.datetime.strptime(edate, '%Y%m%d').strftime('%Y-%m-%d')
-        searchdate_result = session.query(Measurement.date, func.min(Measurement.tobs), func.avg(Measurement.tobs), func.max(Measurement.tobs))\
-            .filter(Measurement.date>=startdate).filter(Measurement.date<=enddate)\
-            .group_by(Measurement.date).all()
-
-    # Close the connection & Return
-    session.close()
+    # The backend reads daily_summary, the in-memory store or DuckDB depending on the configuration
+    # Streaming: yield the rows in batches instead of building the full list
+    searchdate_result = data_backend.daily_temps(startdate, enddate, streaming.STREAM_BATCH_SIZE if stream else None)
+
+    # Return (the session is closed by the Flask teardown hook)
     return searchdate_result
 
 
+###======================================================================================================================================================###
+# Pages
+###======================================================================================================================================================###
+# Query to retrieve one page of a route's result (see paging.py)
+
+def q_yearAgo(dbapi_conn):
+
+    # Calculate the date 1 year ago from the last data point in the database (None when there is no measurement)
+    maxdate_str = queries.QUERIES["max_date"].scalar(dbapi_conn)
+    if maxdate_str is None:
+        return None
+    maxdate = dt.datetime.strptime(maxdate_str, '%Y-%m-%d').date()
+    return (maxdate - dt.timedelta(days=365)).strftime('%Y-%m-%d')
+
+
+@instrument.timed("q_precipitationPage")
+def q_precipitationPage(page):
+
+    dbapi_conn = queries.dbapi_connection(db.session())
+    start = q_yearAgo(dbapi_conn)
+    if start is None:
+        return []
+    return paging.fetch_readings(dbapi_conn, page, "prcp", start, not_null=True)
+
+
+@instrument.timed("q_tobsPage")
+def q_tobsPage(page):
+
+    dbapi_conn = queries.dbapi_connection(db.session())
+    start = q_yearAgo(dbapi_conn)
+    if start is None:
+        return []
+    return paging.fetch_readings(dbapi_conn, page, "tobs", start)
+
+
+@instrument.timed("q_byDatePage")
+def q_byDatePage(sdate, edate, page):
+
+    # Dates come in as %Y%m%d, the database stores %Y-%m-%d
+    startdate = dt.datetime.strptime(sdate, '%Y%m%d').strftime('%Y-%m-%d')
+    enddate = None if edate == None else dt.datetime.strptime(edate, '%Y%m%d').strftime('%Y-%m-%d')
+
+    # The in-memory store covers every station: slice its daily values after the cursor
+    measurement_store = q_store()
+    if measurement_store is not None and not page.stations:
+        daily = measurement_store.daily_temps(*page.window(startdate, enddate))
+        first = 0 if page.after is None else bisect.bisect_right(daily, page.after[0], key=lambda row: row[0])
+        return daily[first:first + page.limit + 1]
+
+    dbapi_conn = queries.dbapi_connection(db.session())
+    return paging.fetch_daily(dbapi_conn, page, startdate, enddate, use_summary=DailySummary is not None)
+
+
+###======================================================================================================================================================###
+# Normals
+###======================================================================================================================================================###
+# Query to retrieve the daily normals (TMIN, TAVG, TMAX, smoothed TAVG and percentile bands) of every date of a range
+
+# Lookup table of climatology.py, loaded on the first request and rebuilt when the measurement data changes
+normals_table = None
+normals_lock = threading.Lock()
+
+@instrument.timed("q_normals")
+def q_normals(sdate, edate, station=None):
+    global normals_table
+
+    # Dates come in as %Y%m%d, the lookup table takes %Y-%m-%d
+    startdate = dt.datetime.strptime(sdate, '%Y%m%d').strftime('%Y-%m-%d')
+    enddate = dt.datetime.strptime(edate, '%Y%m%d').strftime('%Y-%m-%d')
+
+    with normals_lock:
+        if normals_table is None or normals_table.data_version != db.data_version():
+            normals_table = climatology.load(db.router.reader(), Measurement)
+        table = normals_table
+
+    # Unknown station
+    if station is not None and station not in table.groups:
+        return None
+
+    # Two array lookups per date
+    return table.dates(startdate, enddate, station)
+
+
+###======================================================================================================================================================###
+# Time series
+###======================================================================================================================================================###
+# Query to resample tobs / prcp to week / month / year buckets or to N-day rolling windows (for every station or a station filter)
+
+@instrument.timed("q_series")
+def q_series(column, sdate, edate, every="month", window=None, stations=None):
+
+    # A rolling window needs the window - 1 days before the start
+    fetch_start = sdate
+    if window is not None:
+        fetch_start = store.to_date_str(store.to_day(sdate) - window + 1)
+
+    # Daily aggregates from the in-memory store when it is enabled, otherwise one GROUP BY date query
+    measurement_store = q_store()
+    if measurement_store is not None:
+        daily = timeseries.daily_store(measurement_store, column, fetch_start, edate, stations)
+    else:
+        session = db.session()
+        dbapi_conn = queries.dbapi_connection(session)
+        daily = timeseries.daily_sql(dbapi_conn, column, fetch_start, edate, stations)
+
+    if window is not None:
+        return timeseries.rolling(daily, window, sdate, edate, every)
+    return timeseries.resample(daily, every)
+
+
+###======================================================================================================================================================###
+# Batch
+###======================================================================================================================================================###
+# Query to retrieve TMIN, TAVG and TMAX for many (stations, start, end) ranges, or many month-day keys, in one pass
+
+@instrument.timed("q_batchTemps")
+def q_batchTemps(ranges):
+
+    # Vectorized over the in-memory store when it is enabled, otherwise one VALUES-joined SQL statement
+    measurement_store = q_store()
+    if measurement_store is not None:
+        return batch.range_stats_store(measurement_store, ranges)
+
+    session = db.session()
+    return batch.range_stats_sql(queries.dbapi_connection(session), ranges)
+
+
+@instrument.timed("q_batchNormals")
+def q_batchNormals(keys, stations=None):
+
+    # day_of_year_normals (summary.py) answers every key with one row when no station filter is given
+    session = db.session()
+    return batch.normals_stats_sql(queries.dbapi_connection(session), keys, stations, use_summary=DailySummary is not None)
+
+
 ###======================================================================================================================================================###
 
 # Main app code for API:
@@ -172,6 +379,55 @@ def q_byDate(sdate, edate=None):
 
 # Flask Setup:
 app = Flask(__name__)
+# Remove the request-scoped session at the end of each request
+db.init_app(app)
+# Cached responses are dropped whenever the measurement data changes
+response_cache = ResponseCache(db.data_version)
+# SQL / helper timings per request and the /metrics route
+instrument.init_app(app, db.engine)
+# Compression of the responses (registered after the instrumentation: /metrics sees the bytes sent)
+wire.init_app(app)
+# Read engines swapped in later (HAWAII_DB_SNAPSHOT) are timed too
+if instrument.METRICS_ENABLED:
+    db.router.hooks.append(instrument.instrument_engine)
+instrument.startup.update(db.startup_ms)
+
+
+# Column names of the row routes, for the formats other than json
+PRECIPITATION_FIELDS = ("date", "prcp")
+STATION_FIELDS = ("station", "name", "latitude", "longitude", "elevation")
+TOBS_FIELDS = ("date", "tobs")
+DATE_STATS_FIELDS = ("date", "tmin", "tavg", "tmax")
+
+
+def rows_response(rows, fields, json_body, wire_format):
+    """Response of the rows in the negotiated format: json_body (the route's encoder) for json, wire.encode() otherwise."""
+
+    if wire_format == "json":
+        return app.response_class(json_body(rows), mimetype="application/json")
+    body, mimetype = wire.encode(rows, fields, wire_format)
+    return app.response_class(body, mimetype=mimetype)
+
+
+def format_conflict(wire_format, page=None, stream_format=None):
+    """406 response when the negotiated wire format cannot be used for the page or the stream, None otherwise."""
+
+    if page is not None and wire_format not in wire.PAGE_FORMATS:
+        return jsonify({"error": f"pages are available as {', '.join(wire.PAGE_FORMATS)}, not {wire_format}"}), 406
+    if stream_format and wire_format != "json":
+        return jsonify({"error": f"streamed responses are JSON or NDJSON, not {wire_format}"}), 406
+    return None
+
+
+def invalid_dates(*dates):
+    """400 response when a date of the URL is not %Y%m%d, None otherwise."""
+
+    try:
+        for d in dates:
+            dt.datetime.strptime(d, '%Y%m%d')
+    except ValueError:
+        return jsonify({"error": "Dates must be given as YYYYMMDD."}), 400
+    return None
 
 
 # Flask Routes:
@@ -192,10 +448,21 @@ def welcome():
         f"<br/>"
         f"/api/v1.0//api/v1.0/stations"
         f"<br/>"
+        f"/api/v1.0/stations/nearest?lat=&lon=&k= OR /api/v1.0/stations/within?lat=&lon=&radius= OR /api/v1.0/stations/bbox?south=&west=&north=&east="
+        f"<br/>"
         f"/api/v1.0/tobs"
         f"<br/>"
         f"/api/v1.0/<start> OR /api/v1.0/<start>/<end>"
         f"<br/>"
+        f"/api/v1.0/normals/<start>/<end>"
+        f"<br/>"
+        f"/api/v1.0/series/<start>/<end>?column=&every=&rolling="
+        f"<br/>"
+        f"POST /api/v1.0/batch/temps OR POST /api/v1.0/batch/normals"
+        f"<br/>"
+        f"<br/>"
+        f"Row routes also answer ?format=columnar, msgpack, csv or arrow (or the matching Accept header)"
+        f"<br/>"
     )
 
 ###=============================###
@@ -204,15 +471,41 @@ def welcome():
 ###=============================###
 
 @app.route("/api/v1.0/precipitation")
+@response_cache.cached
 def precipitation():
     """Fetch the precipitation data, or a 404 if not found."""
 
+    # Wire format of the full result (?format= or the Accept header)
+    try:
+        wire_format = wire.requested_format()
+    except wire.NotAcceptable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # One page of the result when the client asks for it (?limit=, ?cursor=, ?station=, ?from=, ?to=, ?fields=)
+    try:
+        page = paging.requested_page(paging.PRECIPITATION)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is not None:
+        error = format_conflict(wire_format, page=page)
+        if error:
+            return error
+        return paging.page_response(q_precipitationPage(page), page, wire_format)
+
+    # Chunked response when the client asks for it (?stream=1 or ?stream=ndjson)
+    stream_format = streaming.requested_format()
+    if stream_format:
+        error = format_conflict(wire_format, stream_format=stream_format)
+        if error:
+            return error
+        return streaming.stream_response(q_precipitation(stream=True), stream_format)
+
     # Use the function defined above to get the answer 
     p_rseult = q_precipitation()
     if p_rseult == None:
         return jsonify({"error": f"Not found."}), 404
     else:
-        return jsonify(p_rseult)
+        return rows_response(p_rseult, PRECIPITATION_FIELDS, queries.encode_date_value, wire_format)
 
 ###=============================###
 ### Stations Results (JSON)
@@ -220,15 +513,80 @@ def precipitation():
 ###=============================###
 
 @app.route("/api/v1.0/stations")
+@response_cache.cached
 def stations():
     """Fetch the stations data, or a 404 if not found."""
 
-    # Use the function defined above to get the answer 
-    s_rseult = q_stations()
+    # Wire format of the full result (?format= or the Accept header)
+    try:
+        wire_format = wire.requested_format()
+    except wire.NotAcceptable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # Use the function defined above to get the answer (the registry holds the serialized document)
+    s_rseult = q_stationRegistry()
     if s_rseult == None:
         return jsonify({"error": f"Not found."}), 404
     else:
-        return jsonify(s_rseult)
+        return rows_response(s_rseult.rows(), STATION_FIELDS, lambda rows: s_rseult.body, wire_format)
+
+###=============================###
+### Stations by location (JSON)
+### "/api/v1.0/stations/nearest?lat=&lon=&k="
+### "/api/v1.0/stations/within?lat=&lon=&radius="           (km)
+### "/api/v1.0/stations/bbox?south=&west=&north=&east="
+###     (&start=&end= adds count, tmin, tavg, tmax and total prcp of every station over the range)
+###=============================###
+
+def located_stations(found):
+    """JSON response of the (record, distance_km) pairs, with their aggregates when ?start= is given."""
+
+    date_range = spatial.date_range_arg(request.args)
+    stats = None if date_range is None else q_stationStats([record.code for record, _ in found], date_range)
+    return jsonify({"stations": spatial.station_entries(found, stats)})
+
+
+@app.route("/api/v1.0/stations/nearest")
+@response_cache.cached
+def stations_nearest():
+    """Fetch the k stations nearest to lat / lon, or a 400 if the parameters are invalid."""
+
+    try:
+        lat = spatial.float_arg(request.args, "lat", -90, 90)
+        lon = spatial.float_arg(request.args, "lon", -180, 180)
+        k = spatial.int_arg(request.args, "k", 1, spatial.MAX_NEAREST, 1)
+        return located_stations(q_stationIndex().nearest(lat, lon, k))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/v1.0/stations/within")
+@response_cache.cached
+def stations_within():
+    """Fetch the stations within radius km of lat / lon, or a 400 if the parameters are invalid."""
+
+    try:
+        lat = spatial.float_arg(request.args, "lat", -90, 90)
+        lon = spatial.float_arg(request.args, "lon", -180, 180)
+        radius = spatial.float_arg(request.args, "radius", 0, spatial.HALF_CIRCUMFERENCE_KM)
+        return located_stations(q_stationIndex().within(lat, lon, radius))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/v1.0/stations/bbox")
+@response_cache.cached
+def stations_bbox():
+    """Fetch the stations inside the south / west / north / east box, or a 400 if the parameters are invalid."""
+
+    try:
+        south = spatial.float_arg(request.args, "south", -90, 90)
+        north = spatial.float_arg(request.args, "north", south, 90)
+        west = spatial.float_arg(request.args, "west", -180, 180)
+        east = spatial.float_arg(request.args, "east", -180, 180)
+        return located_stations([(record, None) for record in q_stationIndex().bbox(south, west, north, east)])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 ###=============================###
 ### Temperature Results (JSON)
@@ -236,15 +594,41 @@ def stations():
 ###=============================###
 
 @app.route("/api/v1.0/tobs")
+@response_cache.cached
 def tobs():
     """Fetch the temperature data, or a 404 if not found."""
 
+    # Wire format of the full result (?format= or the Accept header)
+    try:
+        wire_format = wire.requested_format()
+    except wire.NotAcceptable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # One page of the result when the client asks for it (?limit=, ?cursor=, ?station=, ?from=, ?to=, ?fields=)
+    try:
+        page = paging.requested_page(paging.TOBS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is not None:
+        error = format_conflict(wire_format, page=page)
+        if error:
+            return error
+        return paging.page_response(q_tobsPage(page), page, wire_format)
+
+    # Chunked response when the client asks for it (?stream=1 or ?stream=ndjson)
+    stream_format = streaming.requested_format()
+    if stream_format:
+        error = format_conflict(wire_format, stream_format=stream_format)
+        if error:
+            return error
+        return streaming.stream_response(q_tobs(stream=True), stream_format)
+
     # Use the function defined above to get the answer 
     t_rseult = q_tobs()
     if t_rseult == None:
         return jsonify({"error": f"Not found."}), 404
     else:
-        return jsonify(t_rseult)
+        return rows_response(t_rseult, TOBS_FIELDS, queries.encode_date_value, wire_format)
 
 ###=============================###
 ### Temperature Results (JSON)
@@ -252,14 +636,44 @@ def tobs():
 ###=============================###
 
 @app.route("/api/v1.0/<start>")
+@response_cache.cached
 def by_sdate(start):
     """Fetch the temperature based on date """
-    
+
+    error = invalid_dates(start)
+    if error:
+        return error
+
+    # Wire format of the full result (?format= or the Accept header)
+    try:
+        wire_format = wire.requested_format()
+    except wire.NotAcceptable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # One page of the result when the client asks for it (?limit=, ?cursor=, ?station=, ?from=, ?to=, ?fields=)
+    try:
+        page = paging.requested_page(paging.DAILY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is not None:
+        error = format_conflict(wire_format, page=page)
+        if error:
+            return error
+        return paging.page_response(q_byDatePage(start, None, page), page, wire_format)
+
+    # Chunked response when the client asks for it (?stream=1 or ?stream=ndjson)
+    stream_format = streaming.requested_format()
+    if stream_format:
+        error = format_conflict(wire_format, stream_format=stream_format)
+        if error:
+            return error
+        return streaming.stream_response(q_byDate(start, stream=True), stream_format)
+
     td_rseult = q_byDate(start)
     if td_rseult == None:
         return jsonify({"error": f"Not found."}), 404
     else:
-        return jsonify(td_rseult)
+        return rows_response(td_rseult, DATE_STATS_FIELDS, queries.encode_date_stats, wire_format)
 
 ###=============================###
 ### Temperature Results (JSON)
@@ -267,15 +681,137 @@ def by_sdate(start):
 ###=============================###
 
 @app.route("/api/v1.0/<start>/<end>")
+@response_cache.cached
 def by_date(start,end):
     """Fetch the temperature based on date """
-    
+
+    error = invalid_dates(start, end)
+    if error:
+        return error
+
+    # Wire format of the full result (?format= or the Accept header)
+    try:
+        wire_format = wire.requested_format()
+    except wire.NotAcceptable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # One page of the result when the client asks for it (?limit=, ?cursor=, ?station=, ?from=, ?to=, ?fields=)
+    try:
+        page = paging.requested_page(paging.DAILY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is not None:
+        error = format_conflict(wire_format, page=page)
+        if error:
+            return error
+        return paging.page_response(q_byDatePage(start, end, page), page, wire_format)
+
+    # Chunked response when the client asks for it (?stream=1 or ?stream=ndjson)
+    stream_format = streaming.requested_format()
+    if stream_format:
+        error = format_conflict(wire_format, stream_format=stream_format)
+        if error:
+            return error
+        return streaming.stream_response(q_byDate(start, end, stream=True), stream_format)
+
     td_rseult = q_byDate(start, end)
     if td_rseult == None:
         return jsonify({"error": f"Not found."}), 404
     else:
-        return jsonify(td_rseult)
+        return rows_response(td_rseult, DATE_STATS_FIELDS, queries.encode_date_stats, wire_format)
     
+###=============================###
+### Daily Normals (JSON)
+### "/api/v1.0/normals/<start>/<end>"       (?station=USC00519281 for one station)
+###=============================###
+
+@app.route("/api/v1.0/normals/<start>/<end>")
+@response_cache.cached
+def normals(start, end):
+    """Fetch the daily normals of every date from start to end, or a 404 if the station is not found."""
+
+    try:
+        n_rseult = q_normals(start, end, request.args.get("station"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if n_rseult == None:
+        return jsonify({"error": f"Not found."}), 404
+    else:
+        return jsonify(n_rseult)
+
+###=============================###
+### Time series (JSON)
+### "/api/v1.0/series/<start>/<end>"    (?column=tobs|prcp, ?every=day|week|month|year, ?rolling=N days, ?station=A,B)
+###=============================###
+
+@app.route("/api/v1.0/series/<start>/<end>")
+@response_cache.cached
+def series(start, end):
+    """Fetch tobs / prcp resampled or rolled over the date range, or a 400 if the parameters are invalid."""
+
+    try:
+        column, every, window, stations = timeseries.requested_series(request.args)
+        startdate, enddate = timeseries.series_window(start, end, every)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ts_rseult = q_series(column, startdate, enddate, every, window, stations)
+    return jsonify({
+        "column": column, "every": every, "rolling": window,
+        "fields": timeseries.ROLLING_FIELDS if window else timeseries.RESAMPLE_FIELDS,
+        "data": ts_rseult,
+    })
+
+###=============================###
+### Batch Temperature Results (JSON)
+### POST "/api/v1.0/batch/temps"    {"ranges": [{"start": "2017-01-01", "end": "2017-01-07", "stations": ["USC00519281"]}, ...]}
+###=============================###
+
+@app.route("/api/v1.0/batch/temps", methods=["POST"])
+def batch_temps():
+    """Fetch TMIN, TAVG and TMAX for every requested range, or a 400 if the request is invalid."""
+
+    body = request.get_json(silent=True)
+    try:
+        if not isinstance(body, dict):
+            raise ValueError("the body must be a JSON object")
+        ranges = batch.parse_ranges(body.get("ranges"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    b_rseult = q_batchTemps(ranges)
+    return jsonify({"results": [
+        {"stations": None if stations is None else list(stations), "start": start, "end": end, "tmin": tmin, "tavg": tavg, "tmax": tmax}
+        for (stations, start, end), (tmin, tavg, tmax) in zip(ranges, b_rseult)
+    ]})
+
+###=============================###
+### Batch Daily Normals (JSON)
+### POST "/api/v1.0/batch/normals"  {"keys": ["01-01", "01-02", ...], "stations": ["USC00519281"]}   (stations optional)
+###=============================###
+
+@app.route("/api/v1.0/batch/normals", methods=["POST"])
+def batch_normals():
+    """Fetch the daily normals for every requested month-day key, or a 400 if the request is invalid."""
+
+    body = request.get_json(silent=True)
+    try:
+        if not isinstance(body, dict):
+            raise ValueError("the body must be a JSON object")
+        keys = body.get("keys")
+        if not isinstance(keys, list) or not keys or len(keys) > batch.BATCH_MAX_ITEMS:
+            raise ValueError(f"keys must be a list of 1 to {batch.BATCH_MAX_ITEMS} month-day strings")
+        keys = [batch.normalize_month_day(k) for k in keys]
+        stations = batch.parse_stations(body.get("stations"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    b_rseult = q_batchNormals(keys, stations)
+    return jsonify({"results": [
+        {"key": key, "tmin": tmin, "tavg": tavg, "tmax": tmax} for key, (tmin, tavg, tmax) in zip(keys, b_rseult)
+    ]})
+
 ###=============================###
 ### Main
 ###=============================###
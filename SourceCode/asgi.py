@@ -0,0 +1,193 @@
+###======================================================================================================================================================###
+# Async (ASGI) entry point for the API
+###======================================================================================================================================================###
+
+# app.run() serves one request per worker thread and every route blocks its thread for the whole SQLite query.
+# This module serves the Flask app of app.py to an ASGI server: each request runs the WSGI app in a bounded thread pool and the
+# event loop awaits it, so one process keeps many range queries in flight while the loop keeps accepting requests. Every route
+# and hook of app.py (response cache, ETags, compression, paging, streaming, /metrics) behaves exactly as under WSGI.
+
+# Usage (from the SourceCode folder, with any ASGI server):
+#    # uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+# Configuration (environment):
+#    # HAWAII_ASYNC_WORKERS        threads running requests (default 8), keep it <= the db pool size + overflow
+#    # HAWAII_ASYNC_MAX_PENDING    requests waiting for a thread before new ones get a 503 (default 256)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import io
+import os
+import sys
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# The Flask app
+import app as flask_app
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+ASYNC_WORKERS = int(os.environ.get("HAWAII_ASYNC_WORKERS", "8"))
+ASYNC_MAX_PENDING = int(os.environ.get("HAWAII_ASYNC_MAX_PENDING", "256"))
+
+executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="hawaii-query")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# WSGI bridge
+###======================================================================================================================================================###
+
+def wsgi_environ(scope, body):
+    """WSGI environ of an ASGI http scope and its request body."""
+
+    script_name = scope.get("root_path", "").encode("utf-8").decode("latin-1")
+    path_info = scope["path"].encode("utf-8").decode("latin-1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        # Repeated headers are joined, as a WSGI server does
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def run_wsgi(scope, body, send, loop):
+    """Run the Flask app for one request in a pool thread, forwarding the status, headers and body chunks to send."""
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started.get("sent"):
+            raise exc_info[1].with_traceback(exc_info[2])
+        started["message"] = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        }
+
+    def forward(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def send_start():
+        if not started.get("sent"):
+            started["sent"] = True
+            forward(started["message"])
+
+    # Streamed responses are iterated here chunk by chunk; close() runs the Flask teardown (session removal)
+    result = flask_app.app(wsgi_environ(scope, body), start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                send_start()
+                forward({"type": "http.response.body", "body": chunk, "more_body": True})
+        send_start()
+        forward({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# ASGI application
+###======================================================================================================================================================###
+
+# Requests currently waiting for or running on the thread pool
+pending = 0
+
+
+async def send_json(send, status, payload):
+    body = (json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    # Shut the thread pool down with the server
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point serving the Flask app of app.py."""
+
+    global pending
+
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    # Shed load instead of queueing without bound
+    if pending >= ASYNC_MAX_PENDING:
+        return await send_json(send, 503, {"error": "Too many requests in flight."})
+
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    pending += 1
+    try:
+        await loop.run_in_executor(executor, run_wsgi, scope, body, send, loop)
+    finally:
+        pending -= 1
+
+###======================================================================================================================================================###
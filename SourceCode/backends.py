@@ -0,0 +1,388 @@
+###======================================================================================================================================================###
+# Storage backends of the core routes
+###======================================================================================================================================================###
+
+# q_precipitation, q_tobs, q_stations and q_byDate in app.py read through one of these interchangeable backends, selected with
+# HAWAII_BACKEND:
+#    # sqlite   (default) the compiled statements of queries.py on the request's connection, daily_summary when it exists
+#    # numpy    the in-process store.MeasurementStore (also the default when HAWAII_USE_STORE=1): binary search + reduceat
+#    # duckdb   an in-memory DuckDB copy of measurement loaded from the same database at startup, for scan-heavy GROUP BY
+#               queries on large tables (needs the duckdb package)
+# The numpy and duckdb copies are rebuilt when db.data_version() changes (checked at most every HAWAII_STORE_VERSION_CHECK
+# seconds, as the store and the response cache do), so rows loaded by ingest.py show up without a restart.
+# Every backend returns the same rows: (date, prcp), (date, tobs), (date, tmin, tavg, tmax) one row per date, and the station
+# rows. Their order is not part of the contract: sqlite returns readings in table order (the statements have no ORDER BY),
+# numpy and duckdb by date. The station table is small and served from the station registry (stations.py) by every backend.
+
+# "python backends.py check" runs the same queries on every available backend against one database, reports any difference
+# (rows are compared in sorted order; averages to 1e-9) and the median time of each query per backend.
+
+# Usage (from the SourceCode folder):
+#    # HAWAII_BACKEND=duckdb python app.py
+#    # python backends.py check                                   (Resources/hawaii.sqlite, every available backend)
+#    # python backends.py check --db sqlite:////tmp/bench.sqlite --backends sqlite,numpy --repeat 5
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime as dt
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+import batch
+import store
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+BACKENDS = ("sqlite", "numpy", "duckdb")
+BACKEND = os.environ.get("HAWAII_BACKEND") or ("numpy" if store.USE_STORE else "sqlite")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Backends
+###======================================================================================================================================================###
+
+class Backend(ABC):
+    """Data of the core routes. batch_size turns a result into an iterator fetching that many rows at a time."""
+
+    name = None
+
+    def __init__(self, registry):
+        # Callable returning the current stations.StationRegistry
+        self.registry = registry
+
+    def stations(self):
+        """(station, name, latitude, longitude, elevation) rows."""
+
+        return self.registry().rows()
+
+    @abstractmethod
+    def max_date(self):
+        """Latest date as YYYY-MM-DD, None when there is no measurement."""
+
+    @abstractmethod
+    def precipitation(self, start, batch_size=None):
+        """(date, prcp) of every non-NULL prcp from start on."""
+
+    @abstractmethod
+    def tobs(self, start, batch_size=None):
+        """(date, tobs) from start on."""
+
+    @abstractmethod
+    def daily_temps(self, start, end=None, batch_size=None):
+        """(date, tmin, tavg, tmax) per date for start <= date <= end (no end: every later date)."""
+
+
+class SQLiteBackend(Backend):
+    """The database behind db.py, through the compiled statements of queries.py."""
+
+    name = "sqlite"
+
+    def __init__(self, registry, connection=None):
+        super().__init__(registry)
+        # Request-scoped sessions of db.py (imported here: the check command sets HAWAII_DB_URL before db.py reads it)
+        import db
+        import queries
+        self.queries = queries.QUERIES
+        # DBAPI connection of the request's session by default
+        self.connection = connection or (lambda: queries.dbapi_connection(db.session()))
+        self.use_summary = "summary_by_date" in self.queries
+
+    def _run(self, name, batch_size, **params):
+        query = self.queries[name]
+        if batch_size:
+            return query.iterate(self.connection(), batch_size, **params)
+        return query.fetchall(self.connection(), **params)
+
+    def max_date(self):
+        return self.queries["max_date"].scalar(self.connection())
+
+    def precipitation(self, start, batch_size=None):
+        return self._run("precipitation", batch_size, start=start)
+
+    def tobs(self, start, batch_size=None):
+        return self._run("tobs", batch_size, start=start)
+
+    def daily_temps(self, start, end=None, batch_size=None):
+        # One daily_summary row per day instead of every measurement row when summary.py built it
+        if end is None:
+            return self._run("summary_by_date" if self.use_summary else "by_date", batch_size, start=start)
+        return self._run("summary_by_date_range" if self.use_summary else "by_date_range", batch_size, start=start, end=end)
+
+
+class NumpyBackend(Backend):
+    """The date-sorted arrays of store.MeasurementStore."""
+
+    name = "numpy"
+
+    def __init__(self, registry, measurement_store):
+        super().__init__(registry)
+        # Callable returning the current store.MeasurementStore (app.q_store, rebuilt when the data changes)
+        self.measurement_store = measurement_store
+
+    @property
+    def store(self):
+        return self.measurement_store()
+
+    def max_date(self):
+        s = self.store
+        return store.to_date_str(s.day[-1]) if len(s) else None
+
+    def _readings(self, column, start, not_null, batch_size):
+        s = self.store
+        lo, hi = s.day_range(store.to_day(start))
+        day, values = s.day[lo:hi], getattr(s, column)[lo:hi]
+        if not_null:
+            keep = ~np.isnan(values)
+            day, values = day[keep], values[keep]
+        if batch_size:
+            return self._iterate(day, values, batch_size)
+        return _reading_rows(day, values)
+
+    def _iterate(self, day, values, batch_size):
+        # Only batch_size rows are turned into Python objects at a time, as a cursor's fetchmany would
+        for i in range(0, len(day), batch_size):
+            yield from _reading_rows(day[i:i + batch_size], values[i:i + batch_size])
+
+    def precipitation(self, start, batch_size=None):
+        return self._readings("prcp", start, not_null=True, batch_size=batch_size)
+
+    def tobs(self, start, batch_size=None):
+        return self._readings("tobs", start, not_null=False, batch_size=batch_size)
+
+    def daily_temps(self, start, end=None, batch_size=None):
+        # One row per date, computed in a single reduceat pass: batch_size only changes the result into an iterator
+        rows = self.store.daily_temps(start, end)
+        return iter(rows) if batch_size else rows
+
+
+def _reading_rows(day, values):
+    """(date, value) tuples of store day numbers and float32 values (NaN as None)."""
+
+    dates = day.astype("datetime64[D]").astype(str).tolist()
+    # float32 back to its shortest decimal form, the value the database holds (0.08, not 0.07999999821186066)
+    values = [None if v == "nan" else float(v) for v in values.astype(str).tolist()]
+    return list(zip(dates, values))
+
+
+class DuckDBBackend(Backend):
+    """An in-memory DuckDB copy of measurement, loaded from the database again when version_func() changes."""
+
+    name = "duckdb"
+
+    def __init__(self, registry, engine, version_func=None):
+        super().__init__(registry)
+        import duckdb
+        self.duckdb = duckdb
+        self.engine = engine
+        # No version_func: loaded once
+        self.copy = store.Reloader(self._load, version_func or (lambda: None))
+
+    def _load(self):
+        import pandas as pd
+
+        with self.engine.connect() as conn:
+            frame = pd.read_sql_query("SELECT station, date, prcp, tobs FROM measurement", conn)
+        conn = self.duckdb.connect(":memory:")
+        conn.register("measurement_frame", frame)
+        # Dates stay ISO strings, so comparisons and output match the SQLite table; sorted by date for the range scans
+        conn.execute("CREATE TABLE measurement AS SELECT CAST(station AS VARCHAR) AS station, CAST(date AS VARCHAR) AS date, "
+                     "CAST(prcp AS DOUBLE) AS prcp, CAST(tobs AS DOUBLE) AS tobs FROM measurement_frame ORDER BY date")
+        conn.unregister("measurement_frame")
+        return conn
+
+    @property
+    def conn(self):
+        # The current copy; a request already reading the previous one keeps it until its cursor is done
+        return self.copy.get()
+
+    def _run(self, sql, params, batch_size):
+        # fetch_sql opens a cursor (a DuckDB connection of its own) per statement: safe to share between threads
+        if batch_size:
+            return self._iterate(sql, params, batch_size)
+        return batch.fetch_sql(self.conn, sql, params)
+
+    def _iterate(self, sql, params, batch_size):
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    def max_date(self):
+        return batch.fetch_sql(self.conn, "SELECT max(date) FROM measurement", [])[0][0]
+
+    def precipitation(self, start, batch_size=None):
+        return self._run("SELECT date, prcp FROM measurement WHERE date >= ? AND prcp IS NOT NULL ORDER BY date", [start],
+                         batch_size)
+
+    def tobs(self, start, batch_size=None):
+        return self._run("SELECT date, tobs FROM measurement WHERE date >= ? ORDER BY date", [start], batch_size)
+
+    def daily_temps(self, start, end=None, batch_size=None):
+        where, params = ("date >= ?", [start]) if end is None else ("date >= ? AND date <= ?", [start, end])
+        return self._run(f"SELECT date, min(tobs), avg(tobs), max(tobs) FROM measurement WHERE {where} "
+                         f"GROUP BY date ORDER BY date", params, batch_size)
+
+
+def make_backend(name, registry, engine=None, measurement_store=None, version_func=None):
+    """Backend called name ("sqlite", "numpy" or "duckdb").
+
+    measurement_store is a callable returning the current store.MeasurementStore (numpy), version_func the data version
+    whose changes rebuild the DuckDB copy (duckdb).
+    """
+
+    if name == "sqlite":
+        return SQLiteBackend(registry)
+    if name == "numpy":
+        return NumpyBackend(registry, measurement_store)
+    if name == "duckdb":
+        return DuckDBBackend(registry, engine, version_func)
+    raise ValueError(f"HAWAII_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Equivalence check
+###======================================================================================================================================================###
+
+def check_queries(first_date, last_date, seed=0):
+    """[(name, callable(backend))] of the queries compared between backends."""
+
+    last = dt.date.fromisoformat(last_date)
+    first = dt.date.fromisoformat(first_date)
+    year_ago = (last - dt.timedelta(days=365)).isoformat()
+    rng = random.Random(seed)
+
+    checks = [
+        ("max_date", lambda b: b.max_date()),
+        ("stations", lambda b: b.stations()),
+        ("precipitation (last year)", lambda b: b.precipitation(year_ago)),
+        ("tobs (last year)", lambda b: b.tobs(year_ago)),
+        ("tobs (all)", lambda b: b.tobs(first_date)),
+        ("tobs (streamed)", lambda b: list(b.tobs(year_ago, batch_size=100))),
+        ("daily_temps (last year on)", lambda b: b.daily_temps(year_ago)),
+        ("daily_temps (all)", lambda b: b.daily_temps(first_date, last_date)),
+        ("daily_temps (streamed)", lambda b: list(b.daily_temps(year_ago, batch_size=100))),
+        ("daily_temps (after the data)", lambda b: b.daily_temps((last + dt.timedelta(days=1)).isoformat())),
+    ]
+    for _ in range(3):
+        start = first + dt.timedelta(days=rng.randint(0, max(0, (last - first).days - 30)))
+        end = start + dt.timedelta(days=rng.randint(0, 30))
+        checks.append((f"daily_temps {start}..{end}", lambda b, s=start.isoformat(), e=end.isoformat(): b.daily_temps(s, e)))
+    return checks
+
+
+def _normalized(result):
+    """Rows sorted (the order of the rows is not part of the contract), as lists."""
+
+    if not isinstance(result, list):
+        return result
+    rows = [list(row) for row in result]
+    return sorted(rows, key=lambda row: tuple((v is not None, v) for v in row))
+
+
+def _same(a, b):
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, (int, float)) or isinstance(b, float) and isinstance(a, (int, float)):
+        return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+    return a == b
+
+
+def check(backends, first_date, last_date, repeat=3, seed=0):
+    """Compare every backend with the first one. Returns the number of differences."""
+
+    reference = backends[0]
+    differences = 0
+    print(f"{'query':36s} " + " ".join(f"{b.name + ' ms':>12s}" for b in backends) + "   result")
+    for name, query in check_queries(first_date, last_date, seed):
+        timings, results = [], []
+        for backend in backends:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = query(backend)
+                samples.append(time.perf_counter() - started)
+            timings.append(float(np.median(samples)) * 1000)
+            results.append(_normalized(result))
+
+        mismatched = [b.name for b, r in zip(backends[1:], results[1:]) if not _same(results[0], r)]
+        differences += len(mismatched)
+        verdict = "same" if not mismatched else f"DIFFERENT from {reference.name}: {', '.join(mismatched)}"
+        print(f"{name:36s} " + " ".join(f"{t:12.2f}" for t in timings) + f"   {verdict}")
+    return differences
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the storage backends return the same data, and time them.")
+    parser.add_argument("command", choices=["check"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated backends (default: all available)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each query per backend, the median is shown (default 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # db.py reads its URL at import time
+    if args.db:
+        os.environ["HAWAII_DB_URL"] = args.db
+    import db
+    import stations
+
+    def registry():
+        raw_conn = db.engine.raw_connection()
+        try:
+            return stations.load_registry(raw_conn)
+        finally:
+            raw_conn.close()
+
+    measurement_store = None
+    backends = []
+    for name in args.backends.split(","):
+        name = name.strip()
+        if name == "numpy":
+            measurement_store = measurement_store or store.load_store(db.engine, db.Measurement)
+        try:
+            backends.append(make_backend(name, registry, db.engine, lambda: measurement_store))
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+    if len(backends) < 2:
+        sys.exit("backends.py: need at least two available backends to compare")
+
+    with db.engine.connect() as conn:
+        first_date, last_date = conn.exec_driver_sql("SELECT min(date), max(date) FROM measurement").one()
+    differences = check(backends, first_date, last_date, args.repeat, args.seed)
+    print(f"{differences} difference(s)")
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,221 @@
+###======================================================================================================================================================###
+# Batched temperature statistics
+###======================================================================================================================================================###
+
+# The notebook calls calc_temps / daily_normals once per trip day and the API answers one start/end range per request.
+# These functions evaluate many requests in one pass:
+#    # range_stats_*():   TMIN / TAVG / TMAX for many (station set, start, end) ranges. The ranges are sent as a VALUES table joined
+#                         to measurement in a single statement (or evaluated over the sorted arrays of store.MeasurementStore)
+#    # normals_stats_sql(): TMIN / TAVG / TMAX for many '%m-%d' keys, read from day_of_year_normals when it exists
+# Both return one (tmin, tavg, tmax) tuple per input, in input order, with None values where no reading matches.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import time
+import datetime as dt
+
+import numpy as np
+
+import instrument
+import store
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Largest number of ranges / keys accepted in one call
+BATCH_MAX_ITEMS = int(os.environ.get("HAWAII_BATCH_MAX_ITEMS", "1000"))
+
+# Bound parameters per statement (SQLite's historical limit is 999), larger batches are split into several statements
+MAX_VARIABLES = 999
+# Station codes of one filter: with at most MAX_VARIABLES // 2 keys per normals statement, the IN lists stay under MAX_VARIABLES
+MAX_STATIONS = MAX_VARIABLES // 2
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Validation
+###======================================================================================================================================================###
+
+def normalize_date(value):
+    """Accept %Y-%m-%d or %Y%m%d, return %Y-%m-%d. Raises ValueError."""
+
+    value = str(value).strip()
+    fmt = '%Y%m%d' if len(value) == 8 and value.isdigit() else '%Y-%m-%d'
+    return dt.datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+
+
+def normalize_month_day(value):
+    """Accept %m-%d or %m%d, return %m-%d. Raises ValueError."""
+
+    value = str(value).strip().replace("-", "")
+    if len(value) != 4 or not value.isdigit():
+        raise ValueError(f"invalid month-day {value!r}")
+    # 2000 is a leap year, so 02-29 is valid
+    return dt.datetime.strptime("2000" + value, '%Y%m%d').strftime('%m-%d')
+
+
+def parse_stations(stations):
+    """Validate an optional list of station codes into a sorted tuple (None when absent or empty). Raises ValueError."""
+
+    if stations is None:
+        return None
+    if not isinstance(stations, list) or len(stations) > MAX_STATIONS or not all(isinstance(s, str) for s in stations):
+        raise ValueError(f"stations must be a list of at most {MAX_STATIONS} station codes")
+    return tuple(sorted({s.strip() for s in stations if s.strip()})) or None
+
+
+def parse_ranges(items):
+    """Validate [{"start", "end", "stations"?}, ...] into [(stations tuple or None, start, end), ...]. Raises ValueError."""
+
+    if not isinstance(items, list) or not items:
+        raise ValueError("ranges must be a non-empty list")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"at most {BATCH_MAX_ITEMS} ranges per request")
+
+    ranges = []
+    for item in items:
+        if not isinstance(item, dict) or "start" not in item or "end" not in item:
+            raise ValueError("each range needs a start and an end")
+        start = normalize_date(item["start"])
+        end = normalize_date(item["end"])
+        stations = item.get("stations")
+        if isinstance(stations, str):
+            stations = [stations]
+        ranges.append((parse_stations(stations), start, end))
+    return ranges
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# SQL evaluation
+###======================================================================================================================================================###
+
+def fetch_sql(dbapi_conn, sql, params):
+    """Run a statement built for the request (variable VALUES / IN lists) on a DBAPI connection, returns all rows."""
+
+    start = time.perf_counter()
+    cursor = dbapi_conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    instrument.add_sql(time.perf_counter() - start)
+    return rows
+
+
+def _range_chunks(ranges):
+    """Split the expanded (idx, station, start, end) rows so that a statement stays under MAX_VARIABLES."""
+
+    rows = []
+    for idx, (stations, start, end) in enumerate(ranges):
+        for station in stations or (None,):
+            rows.append((idx, station, start, end))
+
+    per_statement = MAX_VARIABLES // 4
+    for i in range(0, len(rows), per_statement):
+        yield rows[i:i + per_statement]
+
+
+def range_stats_sql(dbapi_conn, ranges):
+    """TMIN, TAVG, TMAX per (stations, start, end) range with one VALUES-joined statement per chunk."""
+
+    # Running min / count / sum / max per range. A range over several stations expands to one row per station, and those rows
+    # can fall in different chunks. Each chunk then returns partial aggregates over disjoint sets of readings (other stations).
+    # min / max of the partial min / max and the sums of the partial counts / sums are the aggregates over all of them, so
+    # merging is exact. The average is only formed at the end, as total / count (averaging averages would not be).
+    acc = [[None, 0, 0.0, None] for _ in ranges]
+
+    for chunk in _range_chunks(ranges):
+        values = ", ".join(["(?, ?, ?, ?)"] * len(chunk))
+        params = [v for row in chunk for v in row]
+        # Ranges over all stations use the date index, station ranges the (station, date) index
+        sql = f"""
+            WITH ranges(idx, station, start, "end") AS (VALUES {values})
+            SELECT r.idx, min(m.tobs), count(m.tobs), sum(m.tobs), max(m.tobs)
+            FROM ranges r JOIN measurement m ON m.date >= r.start AND m.date <= r."end"
+            WHERE r.station IS NULL
+            GROUP BY r.idx
+            UNION ALL
+            SELECT r.idx, min(m.tobs), count(m.tobs), sum(m.tobs), max(m.tobs)
+            FROM ranges r JOIN measurement m ON m.station = r.station AND m.date >= r.start AND m.date <= r."end"
+            WHERE r.station IS NOT NULL
+            GROUP BY r.idx
+        """
+        for idx, lo, count, total, hi in fetch_sql(dbapi_conn, sql, params):
+            a = acc[idx]
+            if count:
+                a[0] = lo if a[0] is None else min(a[0], lo)
+                a[3] = hi if a[3] is None else max(a[3], hi)
+                a[1] += count
+                a[2] += total
+
+    return [(lo, total / count, hi) if count else (None, None, None) for lo, count, total, hi in acc]
+
+
+def normals_stats_sql(dbapi_conn, keys, stations=None, use_summary=True):
+    """TMIN, TAVG, TMAX per '%m-%d' key in one statement (day_of_year_normals when use_summary and no station filter)."""
+
+    unique = sorted(set(keys))
+    found = {}
+    for i in range(0, len(unique), MAX_VARIABLES // 2):
+        part = unique[i:i + MAX_VARIABLES // 2]
+        marks = ", ".join(["?"] * len(part))
+        if use_summary and not stations:
+            sql = f"""SELECT month_day, tobs_min, tobs_sum / nullif(tobs_count, 0), tobs_max
+                      FROM day_of_year_normals WHERE month_day IN ({marks})"""
+            params = list(part)
+        else:
+            station_filter = ""
+            params = list(part)
+            if stations:
+                station_filter = f"AND station IN ({', '.join(['?'] * len(stations))})"
+                params += list(stations)
+            # substr(date, 6, 5) matches the month-day expression index of schema.py
+            sql = f"""SELECT substr(date, 6, 5), min(tobs), avg(tobs), max(tobs)
+                      FROM measurement WHERE substr(date, 6, 5) IN ({marks}) {station_filter}
+                      GROUP BY substr(date, 6, 5)"""
+        for key, lo, avg, hi in fetch_sql(dbapi_conn, sql, params):
+            found[key] = (lo, avg, hi)
+
+    return [found.get(key, (None, None, None)) for key in keys]
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Vectorized evaluation over store.MeasurementStore
+###======================================================================================================================================================###
+
+def range_stats_store(measurement_store, ranges):
+    """TMIN, TAVG, TMAX per range over the date-sorted arrays: binary search of all bounds at once, then one reduce per range."""
+
+    s = measurement_store
+    starts = store.to_days([r[1] for r in ranges])
+    ends = store.to_days([r[2] for r in ranges])
+    los = np.searchsorted(s.day, starts, side="left")
+    his = np.searchsorted(s.day, ends, side="right")
+
+    results = []
+    for (stations, _, _), lo, hi in zip(ranges, los, his):
+        tobs = s.tobs[lo:hi]
+        if stations:
+            ids = [s.station_index[c] for c in stations if c in s.station_index]
+            tobs = tobs[np.isin(s.station[lo:hi], ids)]
+        tobs = tobs[~np.isnan(tobs)]
+        if len(tobs) == 0:
+            results.append((None, None, None))
+        else:
+            results.append((float(tobs.min()), float(tobs.astype(np.float64).mean()), float(tobs.max())))
+    return results
+
+###======================================================================================================================================================###
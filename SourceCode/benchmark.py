@@ -0,0 +1,347 @@
+###======================================================================================================================================================###
+# Benchmark suite for the API routes and the notebook queries
+###======================================================================================================================================================###
+
+# Generates a synthetic measurement database at a configurable scale, then measures:
+#    # every route of app.py (/precipitation, /stations, /tobs, /<start>, /<start>/<end>) through the Flask test client,
+#      with a configurable number of concurrent clients
+#    # the notebook queries: calc_temps, daily_normals and the most active stations
+# and writes latency percentiles / throughput as JSON, which can be compared with the results of a previous run.
+
+# Usage (from the SourceCode folder):
+#    # python benchmark.py --rows 1000000 --stations 50 --output before.json
+#    # python benchmark.py --db /tmp/bench.sqlite --reuse --indexes --summaries --output after.json --compare before.json
+#    # python benchmark.py --rows 50000000 --stations 2000 --concurrency 8 --requests 200
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Synthetic dataset
+###======================================================================================================================================================###
+
+# Same tables as Resources/hawaii.sqlite
+CREATE_TABLES = (
+    """CREATE TABLE measurement (
+        id INTEGER NOT NULL,
+        station TEXT,
+        date TEXT,
+        prcp FLOAT,
+        tobs FLOAT,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE station (
+        id INTEGER NOT NULL,
+        station TEXT,
+        name TEXT,
+        latitude FLOAT,
+        longitude FLOAT,
+        elevation FLOAT,
+        PRIMARY KEY (id)
+    )""",
+)
+
+START_DATE = dt.date(2010, 1, 1)
+
+
+def station_codes(n):
+    return [f"SYN{i:08d}" for i in range(n)]
+
+
+def synthetic_stations(n, seed=0):
+    """(station, name, latitude, longitude, elevation) rows spread over the Hawaiian islands."""
+
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(18.9, 22.2, n)
+    lon = rng.uniform(-160.2, -154.8, n)
+    elev = rng.uniform(0, 1200, n)
+    return [(code, f"SYNTHETIC {i}, HI US", round(float(lat[i]), 4), round(float(lon[i]), 4), round(float(elev[i]), 1))
+            for i, code in enumerate(station_codes(n))]
+
+
+def synthetic_measurements(n_stations, n_days, seed=0, days_per_chunk=365):
+    """Yield lists of (station, date, prcp, tobs) rows: one row per station and day, ~7% NULL prcp, seasonal tobs."""
+
+    rng = np.random.default_rng(seed)
+    codes = station_codes(n_stations)
+    for first in range(0, n_days, days_per_chunk):
+        days = np.arange(first, min(first + days_per_chunk, n_days))
+        dates = [(START_DATE + dt.timedelta(days=int(d))).isoformat() for d in days]
+
+        # Seasonal temperature (warmest in August) plus station offset and noise
+        season = 6 * np.sin(2 * np.pi * (days - 120) / 365.25)
+        offset = rng.normal(0, 3, n_stations)
+        tobs = np.rint(74 + season[:, None] + offset[None, :] + rng.normal(0, 2.5, (len(days), n_stations)))
+        prcp = np.round(rng.exponential(0.15, (len(days), n_stations)) * (rng.random((len(days), n_stations)) < 0.45), 2)
+        prcp_null = rng.random((len(days), n_stations)) < 0.07
+
+        rows = []
+        for i, date in enumerate(dates):
+            t = tobs[i].tolist()
+            p = prcp[i].tolist()
+            nulls = prcp_null[i]
+            for s, code in enumerate(codes):
+                rows.append((code, date, None if nulls[s] else p[s], t[s]))
+        yield rows
+
+
+def generate_database(path, rows, n_stations, years=None, seed=0):
+    """Create a synthetic database at path. Either rows or years sets the number of days. Returns (rows, first date, last date)."""
+
+    n_days = years * 365 if years else max(1, -(-rows // n_stations))
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for sql in CREATE_TABLES:
+        conn.execute(sql)
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO station (station, name, latitude, longitude, elevation) VALUES (?, ?, ?, ?, ?)",
+                     synthetic_stations(n_stations, seed))
+    total = 0
+    for chunk in synthetic_measurements(n_stations, n_days, seed):
+        conn.executemany("INSERT INTO measurement (station, date, prcp, tobs) VALUES (?, ?, ?, ?)", chunk)
+        total += len(chunk)
+    conn.execute("COMMIT")
+    conn.close()
+
+    last = START_DATE + dt.timedelta(days=n_days - 1)
+    return total, START_DATE.isoformat(), last.isoformat()
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Measurement
+###======================================================================================================================================================###
+
+def percentile_summary(latencies, errors, wall):
+    """Latency percentiles (ms) and throughput of one benchmark."""
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+    }
+
+
+def run_benchmark(call, n_requests, concurrency, warmup=1):
+    """Run call() n_requests times on concurrency threads. call returns True on success."""
+
+    for _ in range(warmup):
+        call()
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            ok = call()
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(n_requests)))
+    wall = time.perf_counter() - started
+
+    latencies = [t for t, ok in results if ok]
+    return percentile_summary(latencies, len(results) - len(latencies), wall)
+
+
+def route_benchmarks(flask_app, first_date, last_date, range_days, rng):
+    """{name: callable} for every route, using the Flask test client."""
+
+    first = dt.date.fromisoformat(first_date)
+    last = dt.date.fromisoformat(last_date)
+    one_year_ago = (last - dt.timedelta(days=365)).strftime("%Y%m%d")
+
+    def get(path):
+        def call():
+            # One client per call: the test client is not meant to be shared between threads
+            response = flask_app.test_client().get(path() if callable(path) else path)
+            response.get_data()
+            return response.status_code == 200
+        return call
+
+    def random_range():
+        span = max(0, (last - first).days - range_days)
+        start = first + dt.timedelta(days=rng.randint(0, span))
+        end = start + dt.timedelta(days=range_days - 1)
+        return f"/api/v1.0/{start.strftime('%Y%m%d')}/{end.strftime('%Y%m%d')}"
+
+    return {
+        "/api/v1.0/precipitation": get("/api/v1.0/precipitation"),
+        "/api/v1.0/stations": get("/api/v1.0/stations"),
+        "/api/v1.0/tobs": get("/api/v1.0/tobs"),
+        "/api/v1.0/<start>": get(f"/api/v1.0/{one_year_ago}"),
+        "/api/v1.0/<start>/<end>": get(random_range),
+    }
+
+
+def notebook_benchmarks(engine, first_date, last_date, range_days, rng):
+    """{name: callable} for the notebook queries (same SQL as climate.ipynb)."""
+
+    from sqlalchemy import text
+
+    first = dt.date.fromisoformat(first_date)
+    last = dt.date.fromisoformat(last_date)
+
+    def query(sql, params):
+        def call():
+            with engine.connect() as conn:
+                conn.execute(text(sql), params() if callable(params) else params).fetchall()
+            return True
+        return call
+
+    def random_range():
+        span = max(0, (last - first).days - range_days)
+        start = first + dt.timedelta(days=rng.randint(0, span))
+        return {"start": start.isoformat(), "end": (start + dt.timedelta(days=range_days - 1)).isoformat()}
+
+    def random_month_day():
+        return {"md": (dt.date(2020, 1, 1) + dt.timedelta(days=rng.randint(0, 365))).strftime("%m-%d")}
+
+    return {
+        "notebook: calc_temps": query(
+            "SELECT min(tobs), avg(tobs), max(tobs) FROM measurement WHERE date >= :start AND date <= :end", random_range),
+        "notebook: daily_normals": query(
+            "SELECT min(tobs), avg(tobs), max(tobs) FROM measurement WHERE strftime('%m-%d', date) = :md", random_month_day),
+        "notebook: most active stations": query(
+            "SELECT station, count(station) FROM measurement GROUP BY station ORDER BY count(station) DESC", {}),
+    }
+
+
+def compare(results, previous):
+    """Print p50 / p99 / throughput ratios against a previous results file."""
+
+    print(f"=== Compared with {previous['config'].get('label') or 'previous run'} ===")
+    for name, current in results["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        p50 = current["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("nan")
+        p99 = current["p99_ms"] / before["p99_ms"] if before["p99_ms"] else float("nan")
+        rps = current["throughput_rps"] / before["throughput_rps"] if before["throughput_rps"] else float("nan")
+        print(f"{name:40s} p50 x{p50:6.2f}   p99 x{p99:6.2f}   throughput x{rps:6.2f}")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API routes and notebook queries on a synthetic database.")
+    parser.add_argument("--db", default="benchmark.sqlite", help="SQLite file for the synthetic data (default: benchmark.sqlite)")
+    parser.add_argument("--reuse", action="store_true", help="use the existing --db file instead of generating it")
+    parser.add_argument("--rows", type=int, default=100000, help="measurement rows to generate (default 100k)")
+    parser.add_argument("--stations", type=int, default=9, help="number of stations (default 9)")
+    parser.add_argument("--years", type=int, help="years of data per station (overrides --rows)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--indexes", action="store_true", help="run schema.py migrate on the database first")
+    parser.add_argument("--summaries", action="store_true", help="run summary.py build on the database first")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled (disabled by default)")
+    parser.add_argument("--store", action="store_true", help="enable the in-memory measurement store (HAWAII_USE_STORE=1)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per benchmark (default 50)")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent clients (default 1)")
+    parser.add_argument("--range-days", type=int, default=7, help="days in the random <start>/<end> ranges (default 7)")
+    parser.add_argument("--only", help="comma separated benchmark names to run (default: all)")
+    parser.add_argument("--label", help="label stored in the results")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON file to compare with")
+    args = parser.parse_args(argv)
+
+    path = os.path.abspath(args.db)
+    if args.reuse:
+        with sqlite3.connect(path) as conn:
+            n_rows, first_date, last_date = conn.execute("SELECT count(*), min(date), max(date) FROM measurement").fetchone()
+    else:
+        started = time.perf_counter()
+        n_rows, first_date, last_date = generate_database(path, args.rows, args.stations, args.years, args.seed)
+        print(f"Generated {n_rows} rows ({first_date} .. {last_date}) in {time.perf_counter() - started:.1f}s")
+
+    # app.py / db.py read their configuration at import time
+    os.environ["HAWAII_DB_URL"] = "sqlite:///" + path
+    os.environ["HAWAII_CACHE"] = "1" if args.cache else "0"
+    os.environ["HAWAII_USE_STORE"] = "1" if args.store else "0"
+    os.environ.setdefault("HAWAII_DB_POOL_SIZE", str(max(5, args.concurrency)))
+
+    from sqlalchemy import create_engine
+    if args.indexes or args.summaries:
+        setup_engine = create_engine("sqlite:///" + path)
+        if args.indexes:
+            import schema
+            schema.migrate(setup_engine)
+        if args.summaries:
+            import summary
+            summary.build(setup_engine)
+        setup_engine.dispose()
+
+    import app as flask_app
+    import db
+
+    rng = random.Random(args.seed)
+    benchmarks = route_benchmarks(flask_app.app, first_date, last_date, args.range_days, rng)
+    benchmarks.update(notebook_benchmarks(db.engine, first_date, last_date, args.range_days, rng))
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(",")}
+        benchmarks = {name: call for name, call in benchmarks.items() if name in wanted}
+
+    results = {
+        "config": {
+            "label": args.label, "rows": n_rows, "stations": args.stations, "first_date": first_date, "last_date": last_date,
+            "requests": args.requests, "concurrency": args.concurrency, "indexes": args.indexes, "summaries": args.summaries,
+            "cache": args.cache, "store": args.store, "python": sys.version.split()[0], "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": {},
+    }
+    for name, call in benchmarks.items():
+        summary_row = run_benchmark(call, args.requests, args.concurrency)
+        results["results"][name] = summary_row
+        print(f"{name:40s} p50 {summary_row['p50_ms']:9.2f} ms   p99 {summary_row['p99_ms']:9.2f} ms   "
+              f"{summary_row['throughput_rps']:9.1f} req/s   errors {summary_row['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
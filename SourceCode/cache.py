@@ -0,0 +1,241 @@
+###======================================================================================================================================================###
+# Response cache for the API routes
+###======================================================================================================================================================###
+
+# Caches the full response body of a route, keyed by the request path (which includes <start>/<end>) and query string.
+#    # Bounded by entry count and total body bytes, least recently used entries are evicted first
+#    # Entries expire after a TTL
+#    # Everything is dropped when the data version changes: max(date) / max(id) of measurement. A body rendered while the version
+#      changed is not cached, so it cannot outlive the clear
+#    # Responses carry an ETag and a Last-Modified header; If-None-Match / If-Modified-Since requests get a 304 without a body
+#    # The key includes the negotiated wire format (Accept header, wire.py); the gzip / br variants of a body are compressed on
+#      their first request and kept in the entry (counted in the byte budget), with their own ETag
+
+# Configuration (environment):
+#    # HAWAII_CACHE=0                     disable the cache
+#    # HAWAII_CACHE_TTL                   seconds an entry stays valid (default 300)
+#    # HAWAII_CACHE_MAX_ENTRIES           (default 256)
+#    # HAWAII_CACHE_MAX_BYTES             (default 64 MB)
+#    # HAWAII_CACHE_VERSION_CHECK         seconds between two data version queries (default 1)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import time
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+
+from flask import request, current_app
+
+# Negotiated formats and compressed variants
+import wire
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+CACHE_ENABLED = os.environ.get("HAWAII_CACHE", "1") == "1"
+CACHE_TTL = float(os.environ.get("HAWAII_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("HAWAII_CACHE_MAX_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("HAWAII_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_VERSION_CHECK = float(os.environ.get("HAWAII_CACHE_VERSION_CHECK", "1"))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Cache
+###======================================================================================================================================================###
+
+class CacheEntry:
+    """One cached response body with its validators."""
+
+    __slots__ = ("body", "status", "mimetype", "etag", "last_modified", "expires", "encoded")
+
+    def __init__(self, body, status, mimetype, last_modified, expires):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.last_modified = last_modified
+        self.expires = expires
+        # Content-Encoding -> compressed body
+        self.encoded = {}
+
+    def nbytes(self):
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+
+class ResponseCache:
+    """LRU + TTL cache of route responses, invalidated when the data version changes."""
+
+    def __init__(self, version_func=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 version_check=CACHE_VERSION_CHECK, enabled=CACHE_ENABLED):
+
+        self.version_func = version_func
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_check = version_check
+        self.enabled = enabled
+
+        self.entries = OrderedDict()
+        self.size = 0
+        # Data version changes seen so far
+        self.counter = 0
+        self.version = None
+        self.version_checked = 0.0
+        # Time the current data version was first seen, sent as Last-Modified
+        self.last_modified = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # --- bookkeeping -------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def check_version(self, force=False):
+        """Query the data version at most every version_check seconds (force: now), clear the cache when it changed."""
+
+        if self.version_func is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.version_checked < self.version_check:
+            return
+        version = self.version_func()
+        with self.lock:
+            self.version_checked = now
+            if version != self.version:
+                self.version = version
+                self.counter += 1
+                self.entries.clear()
+                self.size = 0
+                self.last_modified = time.time()
+
+    def _evict(self):
+        # Least recently used entries sit at the front of the OrderedDict
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry.nbytes()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires < time.monotonic():
+                del self.entries[key]
+                self.size -= entry.nbytes()
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, status, mimetype, version):
+        """Cache the body rendered under data version version. None when it is not cached."""
+
+        # Bodies larger than the whole budget are never cached
+        if len(body) > self.max_bytes:
+            return None
+        with self.lock:
+            # The version changed while the view ran: the body may be stale and the clear has already happened
+            if version != self.version:
+                return None
+            entry = CacheEntry(body, status, mimetype, self.last_modified, time.monotonic() + self.ttl)
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.nbytes()
+            self.entries[key] = entry
+            self.size += len(body)
+            self._evict()
+            return entry
+
+    def encoded(self, key, entry, encoding):
+        """The entry's body compressed with encoding, compressed once and kept in the entry."""
+
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = wire.compress(entry.body, encoding)
+            with self.lock:
+                # Only counted while the entry is still cached
+                if encoding not in entry.encoded and self.entries.get(key) is entry:
+                    entry.encoded[encoding] = body
+                    self.size += len(body)
+                    self._evict()
+        return body
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses, "version": self.counter}
+
+    # --- Flask integration -------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def request_key():
+        """Cache key: route path (with <start>/<end>) plus the sorted query string and the negotiated format."""
+
+        args = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        try:
+            variant = wire.requested_format()
+        except wire.NotAcceptable:
+            # The view answers with an error, which is not cached
+            variant = None
+        return f"{request.path}?{args}#{variant}"
+
+    def conditional(self, key, entry):
+        """Build the response for a cached entry (compressed when accepted), 304 when the client's validators match."""
+
+        encoding = wire.requested_encoding() if len(entry.body) >= wire.COMPRESS_MIN_BYTES else None
+        if encoding is None:
+            response = current_app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+        else:
+            response = current_app.response_class(self.encoded(key, entry, encoding), status=entry.status, mimetype=entry.mimetype)
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{entry.etag}-{encoding}")
+        response.last_modified = entry.last_modified
+        return wire.vary(response.make_conditional(request))
+
+    def cached(self, view):
+        """Decorator caching the 200 responses of a view."""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            self.check_version()
+            version = self.version
+            key = self.request_key()
+            entry = self.get(key)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                # Only plain, successful bodies are cached (not errors, not streamed responses)
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                # Checked again (ignoring version_check): an ingest during the view must not leave its result cached
+                self.check_version(force=True)
+                entry = self.put(key, response.get_data(), response.status_code, response.mimetype, version)
+                if entry is None:
+                    return response
+            return self.conditional(key, entry)
+
+        return wrapper
+
+###======================================================================================================================================================###
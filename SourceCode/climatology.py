@@ -0,0 +1,342 @@
+###======================================================================================================================================================###
+# Climatology: daily normals for every month-day key in one vectorized pass
+###======================================================================================================================================================###
+
+# daily_normals() of climate.ipynb filters with strftime('%m-%d', date) == key: a full table scan per call, once per trip day.
+# Here the tobs column is grouped once by (station, month-day) with NumPy and the results are kept as (groups x 366) arrays:
+#    # group 0 is all stations, group i + 1 is Climatology.stations[i]
+#    # key k is the k-th '%m-%d' of a leap year (01-01 = 0, 02-29 = 59, 12-31 = 365)
+# so a lookup is two array indexes. Per key and group:
+#    # count, tmin, tavg, tmax                  same values as the SQL min / avg / max of the readings of that month-day
+#    # tavg_smooth                              tavg over a centered window of +-smoothing days (wrapping around the year end),
+#                                               weighted by the number of readings, so sparse keys (02-29) do not stand out
+#    # p<q> for each percentile q               band of the readings (linear interpolation, as numpy.percentile)
+
+# The arrays are built from store.MeasurementStore (the database or the columnar export of columnar.py) and can be saved to
+# the climatology table with "python climatology.py build", which app.py reads back when it is current.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import argparse
+import datetime as dt
+
+import numpy as np
+from sqlalchemy import text, inspect
+
+import store
+from engines import make_engine, reflect
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Half width (days) of the tavg_smooth window
+SMOOTHING = int(os.environ.get("HAWAII_NORMALS_SMOOTHING", "7"))
+PERCENTILES = tuple(int(p) for p in os.environ.get("HAWAII_NORMALS_PERCENTILES", "10,25,50,75,90").split(","))
+
+# Longest date range answered by one Climatology.dates() call
+MAX_DAYS = 3660
+
+ALL_STATIONS = "*"
+
+# The 366 '%m-%d' keys, 2000 being a leap year
+MONTH_DAYS = [(dt.date(2000, 1, 1) + dt.timedelta(days=i)).strftime('%m-%d') for i in range(366)]
+MONTH_DAY_INDEX = {key: i for i, key in enumerate(MONTH_DAYS)}
+
+# Key of the first day of each month
+_MONTH_START = np.array([MONTH_DAY_INDEX[f"{m:02d}-01"] for m in range(1, 13)], dtype=np.int32)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Keys
+###======================================================================================================================================================###
+
+def _value(x):
+    """Python value of an array element, None for NaN."""
+
+    x = x.item() if hasattr(x, "item") else x
+    return None if x != x else x
+
+
+def month_day_keys(days):
+    """Month-day key (0 .. 365) of every day number (days since 1970-01-01)."""
+
+    dates = np.asarray(days).astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    month = months.astype(np.int64) % 12
+    day_of_month = (dates - months).astype(np.int64)
+    return _MONTH_START[month] + day_of_month.astype(np.int32)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Climatology
+###======================================================================================================================================================###
+
+class Climatology:
+    """Lookup table of normals: one (groups x 366) array per statistic."""
+
+    def __init__(self, stations, stats, smoothing=SMOOTHING, percentiles=PERCENTILES, data_version=None):
+        self.stations = list(stations)
+        self.groups = {ALL_STATIONS: 0}
+        self.groups.update((code, i + 1) for i, code in enumerate(self.stations))
+        self.stats = stats
+        self.smoothing = smoothing
+        self.percentiles = tuple(percentiles)
+        self.data_version = data_version
+
+    @property
+    def columns(self):
+        return ["count", "tmin", "tavg", "tmax", "tavg_smooth"] + [f"p{q}" for q in self.percentiles]
+
+    def group(self, station=None):
+        """Row of the station (None = all stations). Raises KeyError for an unknown station."""
+
+        return self.groups[ALL_STATIONS if station is None else station]
+
+    def lookup(self, month_day, station=None):
+        """{statistic: value} of one '%m-%d' key, None where the key has no reading."""
+
+        g, k = self.group(station), MONTH_DAY_INDEX[month_day]
+        if self.stats["count"][g, k] == 0:
+            return {name: (0 if name == "count" else None) for name in self.columns}
+        return {name: _value(self.stats[name][g, k]) for name in self.columns}
+
+    def normals(self, month_day, station=None):
+        """(tmin, tavg, tmax) of one '%m-%d' key, like daily_normals() of the notebook."""
+
+        values = self.lookup(month_day, station)
+        return values["tmin"], values["tavg"], values["tmax"]
+
+    def dates(self, start_date, end_date, station=None):
+        """[{"date", "month_day", statistic: value, ...}] for every date of the range ('%Y-%m-%d' strings, inclusive)."""
+
+        start = dt.datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = dt.datetime.strptime(end_date, '%Y-%m-%d').date()
+        if end < start:
+            raise ValueError("the end date is before the start date")
+        if (end - start).days >= MAX_DAYS:
+            raise ValueError(f"at most {MAX_DAYS} days per request")
+
+        g = self.group(station)
+        days = np.arange(store.to_day(start_date), store.to_day(end_date) + 1)
+        keys = month_day_keys(days)
+        columns = {name: self.stats[name][g, keys].tolist() for name in self.columns}
+        counts = columns["count"]
+
+        result = []
+        for i, (day, key) in enumerate(zip(days, keys)):
+            row = {"date": store.to_date_str(day), "month_day": MONTH_DAYS[key]}
+            for name in self.columns:
+                row[name] = _value(columns[name][i]) if counts[i] or name == "count" else None
+            result.append(row)
+        return result
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Computation
+###======================================================================================================================================================###
+
+def _smooth(total, count, half_width):
+    """Count-weighted circular moving average over the key axis."""
+
+    if half_width <= 0:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+    window = 2 * half_width + 1
+    # Wrap the year around, then windowed sums with one cumulative sum per statistic
+    pad = lambda a: np.concatenate([a[:, -half_width:], a, a[:, :half_width]], axis=1)
+    csum = np.cumsum(np.pad(pad(total), ((0, 0), (1, 0))), axis=1)
+    ccount = np.cumsum(np.pad(pad(count), ((0, 0), (1, 0))), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (csum[:, window:] - csum[:, :-window]) / (ccount[:, window:] - ccount[:, :-window])
+
+
+def compute(measurement_store, smoothing=SMOOTHING, percentiles=PERCENTILES, data_version=None):
+    """Build the Climatology of a store.MeasurementStore."""
+
+    s = measurement_store
+    n_groups = len(s.stations) + 1
+    shape = (n_groups, 366)
+
+    valid = ~np.isnan(s.tobs)
+    tobs = s.tobs[valid].astype(np.float64)
+    keys = month_day_keys(s.day[valid])
+    station_groups = s.station[valid].astype(np.int64) + 1
+
+    # Every reading counts once for its station and once for all stations
+    group = np.concatenate([np.zeros(len(tobs), dtype=np.int64), station_groups])
+    cell = group * 366 + np.concatenate([keys, keys])
+    values = np.concatenate([tobs, tobs])
+
+    size = n_groups * 366
+    count = np.bincount(cell, minlength=size).astype(np.float64)
+    total = np.bincount(cell, weights=values, minlength=size)
+    tmin = np.full(size, np.inf)
+    tmax = np.full(size, -np.inf)
+    np.minimum.at(tmin, cell, values)
+    np.maximum.at(tmax, cell, values)
+
+    stats = {"count": count.astype(np.int64).reshape(shape)}
+    empty = count == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats["tavg"] = np.where(empty, np.nan, total / count).reshape(shape)
+    stats["tmin"] = np.where(empty, np.nan, tmin).reshape(shape)
+    stats["tmax"] = np.where(empty, np.nan, tmax).reshape(shape)
+    stats["tavg_smooth"] = _smooth(total.reshape(shape), count.reshape(shape), smoothing)
+
+    # Percentiles: sort the readings by (cell, value), every cell is then a contiguous segment of the sorted values
+    order = np.lexsort((values, cell))
+    sorted_values = values[order]
+    starts = np.concatenate([[0], np.cumsum(count)[:-1]]).astype(np.int64)
+    n = count.astype(np.int64)
+    last = max(len(sorted_values) - 1, 0)
+    for q in percentiles:
+        # Linear interpolation as np.percentile computes it: the fraction comes from the index inside the cell's segment
+        # (adding the segment start first would lose precision on large arrays), the start is only added to the integers
+        quantile = q / 100.0
+        index = (np.maximum(n, 1) - 1) * quantile
+        below = np.floor(index)
+        fraction = index - below
+        lo = starts + below.astype(np.int64)
+        hi = np.minimum(lo + 1, starts + np.maximum(n, 1) - 1)
+        lo_value = sorted_values[np.minimum(lo, last)] if len(sorted_values) else np.zeros(size)
+        hi_value = sorted_values[np.minimum(hi, last)] if len(sorted_values) else np.zeros(size)
+        step = hi_value - lo_value
+        band = np.where(fraction >= 0.5, hi_value - step * (1 - fraction), lo_value + step * fraction)
+        stats[f"p{q}"] = np.where(empty, np.nan, band).reshape(shape)
+
+    return Climatology(s.stations, stats, smoothing, percentiles, data_version)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Lookup table
+###======================================================================================================================================================###
+
+def _data_version(conn):
+    return tuple(conn.execute(text("SELECT max(date), max(id) FROM measurement")).one())
+
+
+def save(engine, climatology):
+    """Write the climatology to the climatology table (one row per station and key, station '*' for all stations)."""
+
+    columns = climatology.columns
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS climatology"))
+        conn.execute(text(
+            "CREATE TABLE climatology (station TEXT NOT NULL, month_day TEXT NOT NULL, "
+            + ", ".join(f"{name} {'INTEGER' if name == 'count' else 'FLOAT'}" for name in columns)
+            + ", PRIMARY KEY (station, month_day))"))
+        conn.execute(text("DROP TABLE IF EXISTS climatology_meta"))
+        conn.execute(text("CREATE TABLE climatology_meta (max_date TEXT, max_id INTEGER, smoothing INTEGER, percentiles TEXT)"))
+
+        rows = []
+        for code, g in climatology.groups.items():
+            for k, key in enumerate(MONTH_DAYS):
+                row = {"station": code, "month_day": key}
+                for name in columns:
+                    row[name] = _value(climatology.stats[name][g, k])
+                rows.append(row)
+        names = ["station", "month_day"] + columns
+        conn.execute(text(f"INSERT INTO climatology ({', '.join(names)}) VALUES ({', '.join(':' + n for n in names)})"), rows)
+
+        max_date, max_id = climatology.data_version or _data_version(conn)
+        conn.execute(text("INSERT INTO climatology_meta VALUES (:max_date, :max_id, :smoothing, :percentiles)"),
+                     {"max_date": max_date, "max_id": max_id, "smoothing": climatology.smoothing,
+                      "percentiles": ",".join(str(q) for q in climatology.percentiles)})
+
+
+def read(engine):
+    """The saved climatology when it matches the current measurement data, None otherwise."""
+
+    if "climatology_meta" not in inspect(engine).get_table_names():
+        return None
+    with engine.connect() as conn:
+        max_date, max_id, smoothing, percentiles = conn.execute(text("SELECT * FROM climatology_meta")).one()
+        if (max_date, max_id) != _data_version(conn):
+            return None
+        percentiles = tuple(int(q) for q in percentiles.split(",") if q)
+        result = conn.execute(text("SELECT * FROM climatology ORDER BY station, month_day"))
+        names = list(result.keys())
+        rows = result.fetchall()
+
+    stations = sorted({row[0] for row in rows} - {ALL_STATIONS})
+    groups = {ALL_STATIONS: 0}
+    groups.update((code, i + 1) for i, code in enumerate(stations))
+    stats = {name: np.full((len(groups), 366), np.nan) for name in names[2:]}
+    for row in rows:
+        g, k = groups[row[0]], MONTH_DAY_INDEX[row[1]]
+        for name, value in zip(names[2:], row[2:]):
+            stats[name][g, k] = np.nan if value is None else value
+    stats["count"] = np.nan_to_num(stats["count"]).astype(np.int64)
+    return Climatology(stations, stats, smoothing, percentiles, (max_date, max_id))
+
+
+def load(engine, Measurement, measurement_store=None):
+    """The saved climatology when current, otherwise computed from measurement_store (or a store loaded from the engine)."""
+
+    saved = read(engine)
+    if saved is not None:
+        return saved
+    if measurement_store is None:
+        measurement_store = store.load_store(engine, Measurement)
+    with engine.connect() as conn:
+        version = _data_version(conn)
+    return compute(measurement_store, data_version=version)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the climatology lookup table.")
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--smoothing", type=int, default=SMOOTHING, help="half width in days of the tavg_smooth window")
+    parser.add_argument("--percentiles", default=",".join(str(q) for q in PERCENTILES), help="comma separated percentiles")
+    parser.add_argument("--station", help="show: one station instead of all stations")
+    parser.add_argument("--start", default="01-01", help="show: first '%%m-%%d' key")
+    parser.add_argument("--end", default="01-07", help="show: last '%%m-%%d' key")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.db)
+
+    if args.command == "build":
+        percentiles = tuple(int(q) for q in args.percentiles.split(",") if q)
+        measurement_store = store.load_store(engine, reflect(engine).classes.measurement)
+        climatology = compute(measurement_store, args.smoothing, percentiles)
+        save(engine, climatology)
+        print(f"climatology: {len(climatology.groups)} groups x 366 keys, smoothing +-{args.smoothing} days, "
+              f"percentiles {percentiles}")
+
+    else:
+        climatology = load(engine, reflect(engine).classes.measurement)
+        print("month_day " + " ".join(f"{name:>11}" for name in climatology.columns))
+        for key in MONTH_DAYS[MONTH_DAY_INDEX[args.start]:MONTH_DAY_INDEX[args.end] + 1]:
+            values = climatology.lookup(key, args.station)
+            print(f"{key:>9} " + " ".join("       null" if v is None else f"{v:11.2f}" for v in values.values()))
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
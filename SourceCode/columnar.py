@@ -0,0 +1,302 @@
+###======================================================================================================================================================###
+# Columnar binary export of the measurement table, read back through memory maps
+###======================================================================================================================================================###
+
+# pd.read_sql builds a Python object per value before pandas copies it into its own arrays. The export writes measurement
+# once as fixed-width column files, partitioned by station and year:
+#    # <export>/manifest.json                 stations, partitions (row count, first / last date) and the data version exported
+#    # <export>/<station>/<year>/day.npy      int32 day number (days since 1970-01-01), sorted
+#    # <export>/<station>/<year>/prcp.npy     float32, NaN where the database holds NULL
+#    # <export>/<station>/<year>/tobs.npy     float32, NaN where the database holds NULL
+# The reader maps the .npy files read-only (np.load(mmap_mode="r")): opening costs nothing, only the pages a query touches are
+# read, and every process reading the export shares them in the page cache. A query only opens the partitions of the requested
+# stations and years and slices them with a binary search on day, so a single partition is returned without any copy.
+
+# Usage (from the SourceCode folder):
+#    # python columnar.py export                          (Resources/hawaii_columnar from HAWAII_DB_URL or Resources/hawaii.sqlite)
+#    # python columnar.py export --db sqlite:////data/noaa.sqlite --out /data/noaa_columnar
+#    # python columnar.py info --out /data/noaa_columnar
+# In Python / the notebook:
+#    # reader = columnar.ColumnarReader("../Resources/hawaii_columnar")
+#    # tobs_df = reader.frame(["tobs"], "2016-08-23", stations=["USC00519281"])
+# app.py loads its in-memory store (HAWAII_USE_STORE=1) from the export when HAWAII_STORE_PATH points to it (see store.py).
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+
+import store
+from engines import make_engine
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+FORMAT_VERSION = 1
+
+DEFAULT_EXPORT_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Resources", "hawaii_columnar"))
+
+# Column name -> dtype of its file
+COLUMNS = {"day": np.int32, "prcp": np.float32, "tobs": np.float32}
+
+# Rows fetched per cursor.fetchmany() during the export
+FETCH_SIZE = 50000
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Export
+###======================================================================================================================================================###
+
+def station_folder(station):
+    """Directory name of a station code: only [A-Za-z0-9_-], so a code cannot reach outside the export.
+
+    A code that had to be changed gets a hash of the original, so two codes never share a folder.
+    """
+
+    folder = re.sub(r"[^A-Za-z0-9_-]", "_", station)
+    if folder != station or not folder:
+        folder += "-" + hashlib.blake2b(station.encode("utf-8"), digest_size=4).hexdigest()
+    return folder
+
+
+def _write_partition(root, station, year, dates, prcp, tobs):
+    """Write one (station, year) partition, returns its manifest entry."""
+
+    folder = os.path.join(station_folder(station), str(year))
+    os.makedirs(os.path.join(root, folder), exist_ok=True)
+    columns = {
+        "day": store.to_days(dates),
+        # None -> NaN for NULL readings
+        "prcp": np.array([np.nan if v is None else v for v in prcp], dtype=np.float32),
+        "tobs": np.array([np.nan if v is None else v for v in tobs], dtype=np.float32),
+    }
+    for name, values in columns.items():
+        np.save(os.path.join(root, folder, name + ".npy"), values.astype(COLUMNS[name], copy=False))
+    return {"station": station, "year": year, "rows": len(dates), "first": dates[0], "last": dates[-1], "path": folder}
+
+
+def export(engine, path=DEFAULT_EXPORT_PATH, fetch_size=FETCH_SIZE):
+    """Write the measurement table of the engine's database to path. Returns the manifest.
+
+    Rows are read in (station, date) order and written one partition at a time, so memory stays bounded by the largest
+    partition. Rows without a station or a date belong to no partition and are left out. The export is built next to path
+    and renamed over it at the end: readers never see a half written export.
+    """
+
+    path = os.path.abspath(path)
+    building = f"{path}.building-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        cursor.execute("SELECT max(date), max(id) FROM measurement")
+        version = list(cursor.fetchone())
+        cursor.execute("SELECT station, date, prcp, tobs FROM measurement WHERE station IS NOT NULL AND date IS NOT NULL "
+                       "ORDER BY station, date")
+
+        partitions = []
+        key, dates, prcp, tobs = None, [], [], []
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            for station, date, p, t in rows:
+                row_key = (station, int(date[:4]))
+                if row_key != key:
+                    if dates:
+                        partitions.append(_write_partition(building, *key, dates, prcp, tobs))
+                    key, dates, prcp, tobs = row_key, [], [], []
+                dates.append(date)
+                prcp.append(p)
+                tobs.append(t)
+            if not rows:
+                break
+        if dates:
+            partitions.append(_write_partition(building, *key, dates, prcp, tobs))
+    finally:
+        raw_conn.close()
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "data_version": version,
+        "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+        "stations": sorted({p["station"] for p in partitions}),
+        "rows": sum(p["rows"] for p in partitions),
+        "partitions": partitions,
+    }
+    with open(os.path.join(building, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the new export in. Processes that mapped the old files keep reading them until they reopen the export
+    previous = f"{path}.previous-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(building, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Reader
+###======================================================================================================================================================###
+
+class ColumnarReader:
+    """Memory-mapped access to an export written by export()."""
+
+    def __init__(self, path=DEFAULT_EXPORT_PATH):
+        self.path = os.path.abspath(path)
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{self.path}: unsupported export format {self.manifest.get('format')!r}")
+
+        self.stations = self.manifest["stations"]
+        self.station_index = {code: i for i, code in enumerate(self.stations)}
+        self.data_version = tuple(self.manifest["data_version"])
+        self.partitions = self.manifest["partitions"]
+        # Opened lazily, (station, year) -> {column: memmap}
+        self._maps = {}
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def _columns(self, partition):
+        key = (partition["station"], partition["year"])
+        columns = self._maps.get(key)
+        if columns is None:
+            folder = os.path.join(self.path, partition["path"])
+            columns = self._maps[key] = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+        return columns
+
+    def select(self, start_date=None, end_date=None, stations=None):
+        """Partitions overlapping start_date <= date <= end_date ('%Y-%m-%d' strings), for the given stations (default all)."""
+
+        wanted = None if stations is None else set(stations)
+        return [
+            p for p in self.partitions
+            if (wanted is None or p["station"] in wanted)
+            and (start_date is None or p["last"] >= start_date)
+            and (end_date is None or p["first"] <= end_date)
+        ]
+
+    def slices(self, start_date=None, end_date=None, stations=None, fields=("day", "prcp", "tobs")):
+        """Yield (station, {field: array}) per matching partition. The arrays are views of the memory maps (no copy)."""
+
+        start_day = None if start_date is None else store.to_day(start_date)
+        end_day = None if end_date is None else store.to_day(end_date)
+        for partition in self.select(start_date, end_date, stations):
+            columns = self._columns(partition)
+            day = columns["day"]
+            lo = 0 if start_day is None else int(np.searchsorted(day, start_day, side="left"))
+            hi = len(day) if end_day is None else int(np.searchsorted(day, end_day, side="right"))
+            if hi > lo:
+                yield partition["station"], {name: columns[name][lo:hi] for name in fields}
+
+    def scan(self, start_date=None, end_date=None, stations=None, fields=("day", "prcp", "tobs")):
+        """{field: array} over the matching rows plus "station" (int32 index into self.stations), in (station, date) order.
+
+        A single matching partition is returned as views of its memory maps, several are concatenated.
+        """
+
+        parts = list(self.slices(start_date, end_date, stations, fields))
+        if not parts:
+            result = {name: np.empty(0, dtype=COLUMNS[name]) for name in fields}
+            result["station"] = np.empty(0, dtype=np.int32)
+            return result
+        if len(parts) == 1:
+            result = dict(parts[0][1])
+        else:
+            result = {name: np.concatenate([columns[name] for _, columns in parts]) for name in fields}
+        result["station"] = np.repeat(
+            np.array([self.station_index[code] for code, _ in parts], dtype=np.int32),
+            [len(next(iter(columns.values()))) for _, columns in parts])
+        return result
+
+    def precipitation(self, start_date=None, end_date=None, stations=None):
+        """(day, prcp) arrays of the readings with a precipitation value, like the /api/v1.0/precipitation query."""
+
+        columns = self.scan(start_date, end_date, stations, ("day", "prcp"))
+        valid = ~np.isnan(columns["prcp"])
+        return columns["day"][valid], columns["prcp"][valid]
+
+    def tobs(self, start_date=None, end_date=None, stations=None):
+        """(day, tobs) arrays, like the /api/v1.0/tobs query (NULL tobs are NaN)."""
+
+        columns = self.scan(start_date, end_date, stations, ("day", "tobs"))
+        return columns["day"], columns["tobs"]
+
+    def daily_temps(self, start_date, end_date=None, stations=None):
+        """(date, tmin, tavg, tmax) per date, like the /api/v1.0/<start>/<end> query."""
+
+        columns = self.scan(start_date, end_date, stations)
+        return store.MeasurementStore(self.stations, columns["station"], columns["day"], columns["prcp"], columns["tobs"])\
+            .daily_temps(start_date, end_date)
+
+    def frame(self, fields=("prcp", "tobs"), start_date=None, end_date=None, stations=None):
+        """pandas DataFrame with station, date and the requested fields."""
+
+        import pandas as pd
+
+        columns = self.scan(start_date, end_date, stations, ("day",) + tuple(fields))
+        data = {"station": pd.Categorical.from_codes(columns["station"], self.stations),
+                "date": columns["day"].astype("datetime64[D]")}
+        data.update((name, columns[name]) for name in fields)
+        return pd.DataFrame(data, copy=False)
+
+    def to_store(self):
+        """The whole export as a store.MeasurementStore."""
+
+        columns = self.scan()
+        return store.MeasurementStore(self.stations, columns["station"], columns["day"], columns["prcp"], columns["tobs"])
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export measurement as memory-mappable column files.")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--out", default=DEFAULT_EXPORT_PATH, help="Export folder (default: Resources/hawaii_columnar)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        manifest = export(make_engine(args.db), args.out)
+        print(f"Exported {manifest['rows']} rows of {len(manifest['stations'])} stations "
+              f"in {len(manifest['partitions'])} partitions to {args.out}")
+
+    else:
+        reader = ColumnarReader(args.out)
+        print(f"{reader.path}: {len(reader)} rows, {len(reader.stations)} stations, {len(reader.partitions)} partitions, "
+              f"data version {reader.data_version}")
+        for code in reader.stations:
+            parts = reader.select(stations=[code])
+            print(f"    {code}: {sum(p['rows'] for p in parts)} rows, {parts[0]['first']} .. {parts[-1]['last']}")
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
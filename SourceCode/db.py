@@ -0,0 +1,175 @@
+###======================================================================================================================================================###
+# Database layer shared by app.py
+###======================================================================================================================================================###
+
+# The engine, the reflected Measurement/Station classes and the session factory are created once per process (at import time)
+# instead of once per HTTP request. Each request gets its own session from a scoped_session registry, which is removed by the
+# Flask teardown hook registered in init_app(). The command line tools that take --db use engines.py instead, which does
+# nothing at import time.
+
+# Connection routing (SQLite files only, see EngineRouter):
+#    # HAWAII_DB_WAL=1                 WAL journal, one writer connection, reads on a separate pool of read-only (mode=ro) connections
+#    # HAWAII_DB_SNAPSHOT=<path>       reads go to a snapshot copy of the database, opened immutable (no locking at all). A new
+#                                       snapshot is published by renaming a copy over the path (python ingest.py --snapshot <path>)
+#                                       and the read pool switches to it within HAWAII_DB_SNAPSHOT_CHECK seconds (default 1)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import time
+import threading
+
+from sqlalchemy.orm import scoped_session, sessionmaker, Session
+from sqlalchemy import func, select
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Database URL, pool and routing settings, engine factories and reflection (engines.py, re-exported here)
+from engines import (SOURCE_DIR, DEFAULT_DB_PATH, DEFAULT_DB_URL, DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                     DB_WAL, DB_SNAPSHOT, DB_SNAPSHOT_CHECK, DB_BUSY_TIMEOUT,
+                     make_engine, sqlite_path, read_only_url, file_id, make_writer_engine, reflect)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Engine & Reflection
+###======================================================================================================================================================###
+
+class EngineRouter:
+    """Picks the engine of each session: writes go to the writer, reads to the read-only pool or to the current snapshot.
+
+    Without HAWAII_DB_WAL / HAWAII_DB_SNAPSHOT (or for non-SQLite URLs) both are the same engine, as before.
+    """
+
+    def __init__(self, url=None, wal=DB_WAL, snapshot=DB_SNAPSHOT, check_interval=DB_SNAPSHOT_CHECK):
+        url = url or DB_URL
+        path = sqlite_path(url)
+        self.snapshot = snapshot if path is not None else None
+        self.check_interval = check_interval
+        self.snapshot_id = None
+        self.next_check = 0.0
+        self.swaps = 0
+        self.lock = threading.Lock()
+        # Called with every engine created later on (snapshot swaps), e.g. to attach the SQL timers of instrument.py
+        self.hooks = []
+
+        if path is None or not (wal or self.snapshot):
+            self.writer_engine = self.reader_engine = make_engine(url)
+            return
+
+        self.writer_engine = make_writer_engine(url) if wal else make_engine(url)
+        if wal:
+            # Switch the file to WAL before the read-only connections open it (they cannot change the journal mode)
+            with self.writer_engine.connect():
+                pass
+        if self.snapshot:
+            self.snapshot_id = file_id(self.snapshot)
+            self.reader_engine = make_engine(read_only_url(self.snapshot, immutable=True))
+        else:
+            self.reader_engine = make_engine(read_only_url(path))
+
+    def writer(self):
+        return self.writer_engine
+
+    def reader(self):
+        if self.snapshot is not None and time.monotonic() >= self.next_check:
+            self._check_snapshot()
+        return self.reader_engine
+
+    def _check_snapshot(self):
+        """Swap the read pool to a newly published snapshot."""
+
+        with self.lock:
+            now = time.monotonic()
+            if now < self.next_check:
+                return
+            self.next_check = now + self.check_interval
+            current = file_id(self.snapshot)
+            if current is None or current == self.snapshot_id:
+                return
+            engine = make_engine(read_only_url(self.snapshot, immutable=True))
+            for hook in self.hooks:
+                hook(engine)
+            old, self.reader_engine, self.snapshot_id = self.reader_engine, engine, current
+            self.swaps += 1
+        # Idle connections to the old file are closed now, the ones in use by requests in progress when they are returned
+        old.dispose()
+
+
+class RoutingSession(Session):
+    """Session that reads through router.reader() and flushes through router.writer()."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing:
+            return router.writer()
+        return router.reader()
+
+
+# Process-wide objects: created once at startup and shared by every query helper
+# (startup_ms keeps the one-off cost of each step, reported by /metrics)
+startup_ms = {}
+_started = time.perf_counter()
+router = EngineRouter()
+# Engine of the reads at startup (reflection, compiled statements, in-memory store)
+engine = router.reader()
+startup_ms["engine"] = (time.perf_counter() - _started) * 1000
+_started = time.perf_counter()
+Base = reflect(engine)
+startup_ms["reflect"] = (time.perf_counter() - _started) * 1000
+Measurement = Base.classes.measurement
+Station = Base.classes.station
+# Summary table maintained by summary.py (None until "python summary.py build" has been run)
+DailySummary = Base.classes.get("daily_summary")
+
+# Request-scoped sessions: one Session per thread, removed at the end of each request
+session_factory = sessionmaker(class_=RoutingSession)
+session = scoped_session(session_factory)
+
+
+def dispose_engines(close=True):
+    """Dispose every engine of the process: the router's writer and reader and the startup engine.
+
+    close=False forgets the pooled connections without closing them, for a forked child whose parent still uses them.
+    """
+
+    engines = {id(e): e for e in (router.writer_engine, router.reader_engine, engine)}
+    for e in engines.values():
+        e.dispose(close=close)
+
+
+def data_version():
+    """(max(date), max(id)) of measurement: changes whenever measurement rows are added."""
+
+    with router.reader().connect() as conn:
+        return tuple(conn.execute(select(func.max(Measurement.date), func.max(Measurement.id))).one())
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Flask integration
+###======================================================================================================================================================###
+
+def remove_session(exception=None):
+    """Close the request's session and return its connection to the pool."""
+
+    session.remove()
+
+
+def init_app(app):
+    """Register the session teardown on the Flask app."""
+
+    app.teardown_appcontext(remove_session)
+    return app
+
+###======================================================================================================================================================###
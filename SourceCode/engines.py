@@ -0,0 +1,125 @@
+###======================================================================================================================================================###
+# Database configuration and engine factories
+###======================================================================================================================================================###
+
+# Configuration read from the environment and the functions that create engines. Importing this module opens no connection
+# and reflects nothing, so the command line tools (schema.py, summary.py, ingest.py, ...) import it to work on the database
+# given with --db. db.py builds the process-wide engine, reflected classes and sessions of the app from it.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import warnings
+
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.engine import make_url
+from sqlalchemy import create_engine, event
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Folder that holds this script, used to build paths that do not depend on the current working directory
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default database: Resources/hawaii.sqlite, one folder up from SourceCode
+DEFAULT_DB_PATH = os.path.join(SOURCE_DIR, "..", "Resources", "hawaii.sqlite")
+DEFAULT_DB_URL = "sqlite:///" + os.path.normpath(DEFAULT_DB_PATH)
+
+# The database URL and the pool settings can be overridden from the environment
+DB_URL = os.environ.get("HAWAII_DB_URL", DEFAULT_DB_URL)
+DB_POOL_SIZE = int(os.environ.get("HAWAII_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("HAWAII_DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.environ.get("HAWAII_DB_POOL_TIMEOUT", "30"))
+
+# Connection routing
+DB_WAL = os.environ.get("HAWAII_DB_WAL", "0") == "1"
+DB_SNAPSHOT = os.environ.get("HAWAII_DB_SNAPSHOT")
+DB_SNAPSHOT_CHECK = float(os.environ.get("HAWAII_DB_SNAPSHOT_CHECK", "1"))
+# Milliseconds a connection waits for a lock held by another connection
+DB_BUSY_TIMEOUT = int(os.environ.get("HAWAII_DB_BUSY_TIMEOUT", "5000"))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Engines
+###======================================================================================================================================================###
+
+def make_engine(url=None):
+    """Create an engine with a bounded connection pool for the given URL (default: DB_URL)."""
+
+    url = url or DB_URL
+    kwargs = {}
+    if url.startswith("sqlite"):
+        # Pooled SQLite connections are handed to whichever Flask worker thread checks them out
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if url not in ("sqlite://", "sqlite:///:memory:"):
+        kwargs["pool_size"] = DB_POOL_SIZE
+        kwargs["max_overflow"] = DB_MAX_OVERFLOW
+        kwargs["pool_timeout"] = DB_POOL_TIMEOUT
+    return create_engine(url, pool_pre_ping=True, **kwargs)
+
+
+def sqlite_path(url):
+    """Path of the SQLite database file of the URL, None for other databases, in-memory and URI-style URLs."""
+
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:") or url.database.startswith("file:"):
+        return None
+    return url.database
+
+
+def read_only_url(path, immutable=False):
+    """URL of a read-only connection to the file; immutable=True also skips locking (only for files never modified in place)."""
+
+    return f"sqlite:///file:{os.path.abspath(path)}?mode=ro{'&immutable=1' if immutable else ''}&uri=true"
+
+
+def file_id(path):
+    """Identity of the file at path (changes when another file is renamed over it), None when it does not exist."""
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+
+def _set_wal(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT}")
+    cursor.close()
+
+
+def make_writer_engine(url=None):
+    """Engine with a single WAL-mode connection: SQLite has one writer at a time, more connections would only wait on its lock."""
+
+    url = url or DB_URL
+    writer = create_engine(url, pool_pre_ping=True, pool_size=1, max_overflow=0, pool_timeout=DB_POOL_TIMEOUT,
+                           connect_args={"check_same_thread": False})
+    event.listen(writer, "connect", _set_wal)
+    return writer
+
+
+def reflect(engine):
+    """Reflect the database into a new automap Base."""
+
+    Base = automap_base()
+    with warnings.catch_warnings():
+        # The month-day expression index added by schema.py cannot be reflected and is not needed by the ORM
+        warnings.filterwarnings("ignore", "Skipped unsupported reflection of expression-based index")
+        Base.prepare(autoload_with=engine)
+    return Base
+
+###======================================================================================================================================================###
@@ -0,0 +1,440 @@
+###======================================================================================================================================================###
+# Bulk CSV ingestion into the SQLite database
+###======================================================================================================================================================###
+
+# Loads measurement and station CSV files (same layout as Resources/hawaii_measurements.csv and Resources/hawaii_stations.csv):
+#    # Files are read as a stream in chunks, never fully in memory
+#    # Dates are validated and normalized to %Y-%m-%d (also accepts %Y%m%d, %Y/%m/%d and %m/%d/%Y), bad rows are counted and skipped
+#    # Measurements are deduplicated on (station, date): within the files and against the rows already stored
+#    # Rows are inserted with executemany inside large transactions, with WAL journaling and synchronous=OFF during the load
+#    # Every loaded file is recorded in ingest_log, so re-running the command only loads new (or changed) files
+# When the summary tables of summary.py exist, their insert trigger is suspended during the load and the loaded date range
+# is refreshed once at the end, instead of running the trigger for every row. The same goes for the station_id trigger of
+# stations.py: measurement.station_id is filled with one UPDATE after the load.
+# With --snapshot, a consistent copy of the database is published at the given path once the load is done: readers of
+# db.py (HAWAII_DB_SNAPSHOT) keep querying the previous copy during the load and switch to the new one afterwards.
+
+# Usage (from the SourceCode folder):
+#    # python ingest.py ../Resources/hawaii_stations.csv ../Resources/hawaii_measurements.csv
+#    # python ingest.py --db sqlite:////data/noaa.sqlite /data/noaa/*.csv
+#    # python ingest.py --snapshot ../Resources/hawaii_snapshot.sqlite ../Resources/hawaii_measurements.csv
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import csv
+import time
+import sqlite3
+import argparse
+import datetime as dt
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+import summary
+import stations
+from engines import DEFAULT_DB_URL
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Rows per executemany() call
+CHUNK_SIZE = 50000
+# Rows per transaction
+TRANSACTION_SIZE = 1000000
+
+MEASUREMENT_COLUMNS = ("station", "date", "prcp", "tobs")
+STATION_COLUMNS = ("station", "name", "latitude", "longitude", "elevation")
+
+# Tables of Resources/hawaii.sqlite, created when loading into a new database
+CREATE_MEASUREMENT = """
+CREATE TABLE IF NOT EXISTS measurement (
+    id INTEGER NOT NULL,
+    station TEXT,
+    date TEXT,
+    prcp FLOAT,
+    tobs FLOAT,
+    PRIMARY KEY (id)
+)
+"""
+
+CREATE_STATION = """
+CREATE TABLE IF NOT EXISTS station (
+    id INTEGER NOT NULL,
+    station TEXT,
+    name TEXT,
+    latitude FLOAT,
+    longitude FLOAT,
+    elevation FLOAT,
+    PRIMARY KEY (id)
+)
+"""
+
+# Unique index used to deduplicate measurements on (station, date)
+UNIQUE_INDEX = "ix_measurement_station_date"
+
+CREATE_INGEST_LOG = """
+CREATE TABLE IF NOT EXISTS ingest_log (
+    id INTEGER NOT NULL PRIMARY KEY,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime FLOAT NOT NULL,
+    rows_read INTEGER NOT NULL,
+    rows_inserted INTEGER NOT NULL,
+    rows_rejected INTEGER NOT NULL,
+    loaded_at TEXT NOT NULL
+)
+"""
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Validation & Normalization
+###======================================================================================================================================================###
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%Y/%m/%d", "%m/%d/%Y")
+
+# The same dates repeat for every station: normalize each distinct string once
+_date_cache = {}
+
+
+def normalize_date(value):
+    """Return value as a %Y-%m-%d string, or None when it is not a valid date."""
+
+    value = value.strip()
+    result = _date_cache.get(value)
+    if result is None and value not in _date_cache:
+        for fmt in DATE_FORMATS:
+            try:
+                result = dt.datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+                break
+            except ValueError:
+                pass
+        _date_cache[value] = result
+    return result
+
+
+def to_float(value):
+    """Empty -> None (NULL), otherwise float(). Raises ValueError for anything else."""
+
+    value = value.strip()
+    return float(value) if value else None
+
+
+def measurement_rows(reader, columns, rejected):
+    """Yield normalized (station, date, prcp, tobs) tuples, counting invalid rows in rejected[0]."""
+
+    i_station, i_date, i_prcp, i_tobs = (columns[c] for c in MEASUREMENT_COLUMNS)
+    for record in reader:
+        try:
+            station = record[i_station].strip()
+            date = normalize_date(record[i_date])
+            if not station or date is None:
+                raise ValueError
+            yield (station, date, to_float(record[i_prcp]), to_float(record[i_tobs]))
+        except (ValueError, IndexError):
+            rejected[0] += 1
+
+
+def station_rows(reader, columns, rejected):
+    """Yield normalized (station, name, latitude, longitude, elevation) tuples."""
+
+    i_station, i_name, i_lat, i_lon, i_elev = (columns[c] for c in STATION_COLUMNS)
+    for record in reader:
+        try:
+            station = record[i_station].strip()
+            if not station:
+                raise ValueError
+            yield (station, record[i_name].strip(), to_float(record[i_lat]), to_float(record[i_lon]), to_float(record[i_elev]))
+        except (ValueError, IndexError):
+            rejected[0] += 1
+
+
+def detect_kind(header):
+    """'measurement' or 'station' from the CSV header, None if it matches neither."""
+
+    names = set(header)
+    if names.issuperset(MEASUREMENT_COLUMNS):
+        return "measurement"
+    if names.issuperset(STATION_COLUMNS):
+        return "station"
+    return None
+
+
+def chunks(rows, size):
+    """Split an iterable into lists of at most size items."""
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Database
+###======================================================================================================================================================###
+
+def connect(path):
+    """Open the database for a bulk load: autocommit mode (explicit BEGIN/COMMIT), WAL journal, no fsync per commit."""
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Per connection: other connections keep their own synchronous setting
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")
+    return conn
+
+
+def prepare(conn):
+    """Create the tables (measurement and station too in a new database) and the unique index the loader relies on."""
+
+    conn.execute(CREATE_MEASUREMENT)
+    conn.execute(CREATE_STATION)
+    conn.execute(CREATE_INGEST_LOG)
+
+    # (station, date) must be unique for INSERT OR IGNORE to deduplicate; replace a non-unique index of the same name
+    indexes = {r[1]: r[2] for r in conn.execute("PRAGMA index_list(measurement)")}
+    if UNIQUE_INDEX in indexes and not indexes[UNIQUE_INDEX]:
+        conn.execute(f"DROP INDEX {UNIQUE_INDEX}")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON measurement (station, date)")
+
+
+def already_loaded(conn, path, size, mtime):
+    row = conn.execute("SELECT 1 FROM ingest_log WHERE path = ? AND size = ? AND mtime = ?", (path, size, mtime)).fetchone()
+    return row is not None
+
+
+def suspend_trigger(conn, name):
+    """Drop the insert trigger, returns True if it existed."""
+
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+    if exists:
+        conn.execute(f"DROP TRIGGER {name}")
+    return exists is not None
+
+
+def suspend_summary_trigger(conn):
+    """Drop the summary insert trigger, returns True if it existed."""
+
+    return suspend_trigger(conn, "measurement_summary_insert")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Loaders
+###======================================================================================================================================================###
+
+def load_measurements(conn, rows, chunk_size=CHUNK_SIZE, transaction_size=TRANSACTION_SIZE):
+    """Insert measurement rows, skipping (station, date) pairs already stored. Returns (inserted, min date, max date)."""
+
+    inserted = 0
+    in_transaction = 0
+    min_date = max_date = None
+
+    conn.execute("BEGIN")
+    for chunk in chunks(rows, chunk_size):
+        # rowcount only counts the inserted rows, not the rows changed by triggers (total_changes does)
+        cursor = conn.executemany("INSERT OR IGNORE INTO measurement (station, date, prcp, tobs) VALUES (?, ?, ?, ?)", chunk)
+        inserted += cursor.rowcount
+
+        dates = [r[1] for r in chunk]
+        lo, hi = min(dates), max(dates)
+        min_date = lo if min_date is None else min(min_date, lo)
+        max_date = hi if max_date is None else max(max_date, hi)
+
+        # Large transactions, committed every transaction_size rows to bound the WAL size
+        in_transaction += len(chunk)
+        if in_transaction >= transaction_size:
+            conn.execute("COMMIT")
+            conn.execute("BEGIN")
+            in_transaction = 0
+    conn.execute("COMMIT")
+    return inserted, min_date, max_date
+
+
+def load_stations(conn, rows):
+    """Insert stations whose code is not stored yet. Returns the number of inserted rows."""
+
+    existing = {r[0] for r in conn.execute("SELECT station FROM station")}
+    new_rows = []
+    for row in rows:
+        if row[0] not in existing:
+            existing.add(row[0])
+            new_rows.append(row)
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO station (station, name, latitude, longitude, elevation) VALUES (?, ?, ?, ?, ?)", new_rows)
+    conn.execute("COMMIT")
+    return len(new_rows)
+
+
+def ingest_file(conn, path, force=False, chunk_size=CHUNK_SIZE):
+    """Load one CSV file. Returns a dict describing the load (None when the file was already loaded)."""
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    if not force and already_loaded(conn, path, stat.st_size, stat.st_mtime):
+        return None
+
+    started = time.perf_counter()
+    rejected = [0]
+    read = [0]
+    min_date = max_date = None
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader)]
+        kind = detect_kind(header)
+        if kind is None:
+            raise ValueError(f"{path}: unknown CSV layout {header}")
+        columns = {name: i for i, name in enumerate(header)}
+
+        def counted(records):
+            for record in records:
+                read[0] += 1
+                yield record
+
+        if kind == "measurement":
+            inserted, min_date, max_date = load_measurements(conn, measurement_rows(counted(reader), columns, rejected), chunk_size)
+        else:
+            inserted = load_stations(conn, station_rows(counted(reader), columns, rejected))
+
+    conn.execute("INSERT INTO ingest_log (path, kind, size, mtime, rows_read, rows_inserted, rows_rejected, loaded_at) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                 (path, kind, stat.st_size, stat.st_mtime, read[0], inserted, rejected[0], dt.datetime.now().isoformat(timespec="seconds")))
+
+    return {"path": path, "kind": kind, "read": read[0], "inserted": inserted, "rejected": rejected[0],
+            "min_date": min_date, "max_date": max_date, "seconds": time.perf_counter() - started}
+
+
+def ingest(db_path, paths, force=False, chunk_size=CHUNK_SIZE):
+    """Load the given CSV files (stations first), then refresh the summary tables for the loaded dates. Returns the load reports."""
+
+    conn = connect(db_path)
+    had_trigger = had_station_trigger = False
+    completed = False
+    reports = []
+    try:
+        prepare(conn)
+        had_trigger = suspend_summary_trigger(conn)
+        had_station_trigger = suspend_trigger(conn, stations.STATION_ID_TRIGGER)
+
+        # Stations before measurements, whatever the order on the command line
+        def is_station_file(p):
+            with open(p, newline="", encoding="utf-8") as f:
+                return detect_kind([h.strip().lower() for h in next(csv.reader(f))]) == "station"
+
+        ordered = sorted(paths, key=lambda p: not is_station_file(p))
+        for path in ordered:
+            report = ingest_file(conn, path, force, chunk_size)
+            if report is not None:
+                reports.append(report)
+        completed = True
+    finally:
+        # Also when the load failed part way: the triggers must not stay dropped
+        try:
+            if had_station_trigger:
+                # A failed load may have left its transaction open: it would be rolled back by close() anyway
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                conn.execute("BEGIN")
+                stations.fill_station_ids(conn)
+                conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if had_trigger:
+            restore_summaries(db_path, reports if completed else None)
+
+    return reports
+
+
+def restore_summaries(db_path, reports=None):
+    """Bring daily_summary / day_of_year_normals up to date once for the loaded range, then restore the trigger.
+
+    reports=None (a failed load, whose committed rows are not in any report) refreshes every date.
+    """
+
+    engine = create_engine("sqlite:///" + db_path)
+    try:
+        with engine.begin() as conn:
+            summary.create_summaries(conn)
+            if reports is None:
+                summary.refresh(conn)
+            else:
+                dates = [(r["min_date"], r["max_date"]) for r in reports if r["min_date"] is not None]
+                if dates:
+                    summary.refresh(conn, min(d[0] for d in dates), max(d[1] for d in dates))
+    finally:
+        engine.dispose()
+
+
+def publish_snapshot(db_path, snapshot_path):
+    """Copy the database to snapshot_path atomically: online backup to a temporary file, then rename over the snapshot."""
+
+    tmp_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+        # Snapshots are opened immutable: a rollback journal file, no WAL / shm files next to it
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, snapshot_path)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load measurement / station CSV files into the SQLite database.")
+    parser.add_argument("files", nargs="+", help="CSV files (layout detected from the header)")
+    parser.add_argument("--db", help="SQLite database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--force", action="store_true", help="load files even if ingest_log says they were loaded")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per executemany() call")
+    parser.add_argument("--snapshot", help="publish a copy of the database at this path after the load (read by HAWAII_DB_SNAPSHOT)")
+    args = parser.parse_args(argv)
+
+    url = make_url(args.db or os.environ.get("HAWAII_DB_URL", DEFAULT_DB_URL))
+    if url.get_backend_name() != "sqlite" or not url.database:
+        parser.error("ingest.py only loads into a SQLite database file")
+
+    reports = ingest(url.database, args.files, args.force, args.chunk_size)
+    if args.snapshot and (reports or not os.path.exists(args.snapshot)):
+        publish_snapshot(url.database, args.snapshot)
+        print(f"Published snapshot {args.snapshot}")
+    if not reports:
+        print("Nothing to load: every file is already in ingest_log (use --force to reload)")
+    for r in reports:
+        rate = r["read"] / r["seconds"] * 60 if r["seconds"] else 0
+        print(f"{r['path']} ({r['kind']}): {r['read']} read, {r['inserted']} inserted, {r['rejected']} rejected "
+              f"in {r['seconds']:.2f}s ({rate:,.0f} rows/min)")
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,319 @@
+###======================================================================================================================================================###
+# Per-request profiling and query instrumentation
+###======================================================================================================================================================###
+
+# Breaks the time of every request down into phases and aggregates them per route:
+#    # sql:      time spent executing SQL (SQLAlchemy before / after_cursor_execute events), with the number of statements
+#    # q_*:      self time of each query helper of app.py: a helper called by another timed helper (route helper -> q_* ->
+#                backend) is subtracted from its caller, so the phases add up to the helpers' time once (minus sql, it is row
+#                fetching / construction)
+#    # total:    whole request, the rest (total - helpers) is jsonify and Flask
+# plus row counts and response sizes. Every response gets a Server-Timing header; /metrics returns per-route histograms and the
+# one-off startup costs (engine creation, reflection) measured by db.py.
+
+# Configuration (environment):
+#    # HAWAII_METRICS=0                  disable the instrumentation
+#    # HAWAII_PROFILE=1                  profile requests with cProfile
+#    # HAWAII_PROFILE_SAMPLE             fraction of requests profiled (default 0.1)
+#    # HAWAII_PROFILE_KEEP               number of slowest profiled requests kept per route (default 5)
+#    # HAWAII_PROFILE_DIR                folder for the .prof dumps (default ./profiles), read them with pstats / snakeviz
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import time
+import heapq
+import random
+import cProfile
+import threading
+import functools
+
+from flask import g, request, jsonify, has_request_context
+from sqlalchemy import event
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+METRICS_ENABLED = os.environ.get("HAWAII_METRICS", "1") == "1"
+PROFILE_ENABLED = os.environ.get("HAWAII_PROFILE", "0") == "1"
+PROFILE_SAMPLE = float(os.environ.get("HAWAII_PROFILE_SAMPLE", "0.1"))
+PROFILE_KEEP = int(os.environ.get("HAWAII_PROFILE_KEEP", "5"))
+PROFILE_DIR = os.environ.get("HAWAII_PROFILE_DIR", "profiles")
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Metrics registry
+###======================================================================================================================================================###
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+
+    def as_dict(self):
+        buckets = {f"le_{b}": c for b, c in zip(BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {"count": self.count, "sum_ms": self.total, "mean_ms": self.total / self.count if self.count else 0.0, "buckets": buckets}
+
+
+class RouteMetrics:
+    """Aggregates of one route."""
+
+    def __init__(self):
+        self.phases = {}
+        self.statuses = {}
+        self.rows = 0
+        self.bytes = 0
+        self.sql_statements = 0
+
+    def as_dict(self):
+        return {
+            "phases": {name: h.as_dict() for name, h in self.phases.items()},
+            "statuses": dict(self.statuses),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "sql_statements": self.sql_statements,
+        }
+
+
+routes = {}
+routes_lock = threading.Lock()
+
+# One-off startup phases (set by db.py)
+startup = {}
+
+
+def record(route, phases, status, rows, size, sql_statements):
+    with routes_lock:
+        metrics = routes.get(route)
+        if metrics is None:
+            metrics = routes[route] = RouteMetrics()
+        for name, ms in phases.items():
+            hist = metrics.phases.get(name)
+            if hist is None:
+                hist = metrics.phases[name] = Histogram()
+            hist.observe(ms)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.rows += rows
+        metrics.bytes += size
+        metrics.sql_statements += sql_statements
+
+
+def snapshot():
+    with routes_lock:
+        return {"startup_ms": dict(startup), "routes": {route: m.as_dict() for route, m in routes.items()}}
+
+
+def reset():
+    with routes_lock:
+        routes.clear()
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Spans
+###======================================================================================================================================================###
+
+def add_span(name, seconds):
+    """Add seconds to the named phase of the current request (no-op outside a request)."""
+
+    if has_request_context() and "spans" in g:
+        g.spans[name] = g.spans.get(name, 0.0) + seconds
+
+
+def timed(name):
+    """Decorator recording the self time (and row count of list results) of a query helper as a span of the request.
+
+    Time spent in nested timed helpers is recorded under their own names only, and rows are counted by the outermost helper.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (has_request_context() and "span_stack" in g):
+                return func(*args, **kwargs)
+            # One entry per running timed helper: the time of its timed children
+            stack = g.span_stack
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                add_span(name, elapsed - children)
+                if stack:
+                    stack[-1] += elapsed
+            if isinstance(result, list) and not stack:
+                g.rows += len(result)
+            return result
+        return wrapper
+    return decorator
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# SQLAlchemy events
+###======================================================================================================================================================###
+
+# The start time is kept on the statement's execution context: a statement that fails never reaches after_cursor_execute,
+# and a start time left on the connection would be paired with the next statement
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    add_sql(time.perf_counter() - context.query_start)
+
+
+def add_sql(seconds):
+    """Record one SQL statement of the current request (also used for statements run on raw DBAPI cursors)."""
+
+    if has_request_context() and "spans" in g:
+        g.spans["sql"] = g.spans.get("sql", 0.0) + seconds
+        g.sql_statements += 1
+
+
+def instrument_engine(engine):
+    """Time every statement executed through the engine."""
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Profiler
+###======================================================================================================================================================###
+
+# Per route: min-heap of (duration, path) for the slowest profiled requests that were dumped
+_slowest = {}
+_slowest_lock = threading.Lock()
+
+
+def keep_profile(route, duration):
+    """True when the request is among the PROFILE_KEEP slowest profiled requests of its route."""
+
+    with _slowest_lock:
+        heap = _slowest.setdefault(route, [])
+        if len(heap) < PROFILE_KEEP:
+            heapq.heappush(heap, duration)
+            return True
+        if duration > heap[0]:
+            heapq.heapreplace(heap, duration)
+            return True
+        return False
+
+
+def dump_profile(profiler, route, duration):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+    path = os.path.join(PROFILE_DIR, f"{name}-{duration * 1000:.0f}ms-{int(time.time() * 1000)}.prof")
+    profiler.dump_stats(path)
+    return path
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Flask integration
+###======================================================================================================================================================###
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.spans = {}
+    g.span_stack = []
+    g.rows = 0
+    g.sql_statements = 0
+    g.profiler = None
+    if PROFILE_ENABLED and random.random() < PROFILE_SAMPLE:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _after_request(response):
+    if "request_start" not in g:
+        return response
+
+    total = time.perf_counter() - g.request_start
+    profiler = g.profiler
+    if profiler is not None:
+        profiler.disable()
+        g.profiler = None
+
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    phases = {name: seconds * 1000 for name, seconds in g.spans.items()}
+    phases["total"] = total * 1000
+
+    # Streamed bodies are not known yet (their timing covers the time to the first byte)
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    record(route, phases, response.status_code, g.rows, size, g.sql_statements)
+
+    timings = [f'{name};dur={ms:.2f}' for name, ms in phases.items() if name not in ("sql", "total")]
+    if "sql" in phases:
+        timings.append(f'sql;dur={phases["sql"]:.2f};desc="{g.sql_statements} statements"')
+    timings.append(f'rows;desc="{g.rows}"')
+    timings.append(f'total;dur={phases["total"]:.2f}')
+    response.headers["Server-Timing"] = ", ".join(timings)
+
+    if profiler is not None and keep_profile(route, total):
+        dump_profile(profiler, route, total)
+    return response
+
+
+def _teardown_request(exception=None):
+    # after_request does not run when the view (or another hook) raises: the profiler must not stay enabled on the thread
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def metrics():
+    """Aggregated per-route timings, row counts and payload sizes."""
+
+    return jsonify(snapshot())
+
+
+def init_app(app, engine):
+    """Register the request hooks, the SQL timers and the /metrics route."""
+
+    if not METRICS_ENABLED:
+        return app
+    instrument_engine(engine)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
+    return app
+
+###======================================================================================================================================================###
@@ -0,0 +1,445 @@
+###======================================================================================================================================================###
+# Load test: replays request mixes at fixed arrival rates against locally launched servers
+###======================================================================================================================================================###
+
+# benchmark.py times single routes through the Flask test client. This harness measures the whole server under concurrent traffic:
+#    # every configuration starts its own serve.py (pre-fork workers) on a free local port, against the same database
+#      (a synthetic one from benchmark.py by default, so it runs offline)
+#    # a request mix (e.g. tobs=60,range=30,stations=10) is replayed open-loop: requests are sent at fixed arrival times for
+#      each offered rate, whether or not the previous ones have returned, and latency is counted from the scheduled time,
+#      so a saturated server shows up as growing latency instead of a slower client
+#    # per rate: latency percentiles and histogram, per kind of request, error rate and achieved throughput; the saturation
+#      point is the first rate that misses the throughput, p99 (--slo-ms) or error targets
+#    # one report compares all configurations side by side (JSON with --output, markdown with --report)
+
+# Request kinds of a mix: precipitation, stations, tobs, start (/<start> within the last year), range (/<start>/<end> of
+# --range-days), normals, series, nearest, page (/tobs?station=&limit=), or a literal path starting with "/".
+# A configuration is a comma separated list of workers=N, cache=0|1, store=0|1 and any HAWAII_* variable for the workers.
+
+# Usage (from the SourceCode folder):
+#    # python loadtest.py --rows 500000 --stations 50 --rates 50,100,200,400
+#    # python loadtest.py --db /tmp/load.sqlite --reuse --mix tobs=60,range=30,stations=10 \
+#    #     --config workers=1,cache=0 --config workers=4,cache=0 --config workers=4,cache=1 --report load.md
+#    # python loadtest.py --db ../Resources/hawaii.sqlite --reuse --config workers=2,store=1 --rates 100 --duration 30
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import http.client
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import benchmark
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+DEFAULT_MIX = "tobs=60,range=30,stations=10"
+DEFAULT_CONFIGS = ["workers=1,cache=0", "workers=4,cache=0", "workers=4,cache=1"]
+
+# Latency histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# A rate is saturated when less than this share of the offered requests complete within the run, or too many fail
+MIN_THROUGHPUT_RATIO = 0.9
+MAX_ERROR_RATE = 0.01
+
+# Configuration keys that are not HAWAII_* variables
+CONFIG_ENV = {"cache": "HAWAII_CACHE", "store": "HAWAII_USE_STORE"}
+
+SERVE_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Request mix
+###======================================================================================================================================================###
+
+def parse_mix(text):
+    """[(kind, weight)] of "kind=weight,..." (weights are relative)."""
+
+    mix = []
+    for item in text.split(","):
+        kind, _, weight = item.strip().rpartition("=")
+        if not kind:
+            raise ValueError(f"mix item {item!r} is not kind=weight")
+        if not kind.startswith("/") and kind not in REQUEST_KINDS:
+            raise ValueError(f"unknown request kind {kind!r} (one of {', '.join(REQUEST_KINDS)} or a path)")
+        mix.append((kind, float(weight)))
+    return mix
+
+
+class Traffic:
+    """Random request paths of the mix, drawn from the dates and stations of the database."""
+
+    def __init__(self, mix, first_date, last_date, stations, range_days=7, seed=0):
+        self.kinds = [kind for kind, _ in mix]
+        weights = np.array([weight for _, weight in mix], dtype=np.float64)
+        self.cumulative = np.cumsum(weights / weights.sum())
+        self.first = dt.date.fromisoformat(first_date)
+        self.last = dt.date.fromisoformat(last_date)
+        self.stations = stations
+        self.range_days = range_days
+        self.rng = random.Random(seed)
+
+    def random_date(self, first=None, span_days=0):
+        first = first or self.first
+        days = max(0, (self.last - first).days - span_days)
+        return first + dt.timedelta(days=self.rng.randint(0, days))
+
+    def next(self):
+        """(kind, path) of the next request."""
+
+        kind = self.kinds[int(np.searchsorted(self.cumulative, self.rng.random(), side="right").clip(0, len(self.kinds) - 1))]
+        if kind.startswith("/"):
+            return kind, kind
+        return kind, REQUEST_KINDS[kind](self)
+
+
+def _range(traffic, days):
+    start = traffic.random_date(span_days=days - 1)
+    end = start + dt.timedelta(days=days - 1)
+    return start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+
+
+REQUEST_KINDS = {
+    "precipitation": lambda t: "/api/v1.0/precipitation",
+    "stations": lambda t: "/api/v1.0/stations",
+    "tobs": lambda t: "/api/v1.0/tobs",
+    "start": lambda t: "/api/v1.0/" + t.random_date(t.last - dt.timedelta(days=365)).strftime("%Y%m%d"),
+    "range": lambda t: "/api/v1.0/{}/{}".format(*_range(t, t.range_days)),
+    "normals": lambda t: "/api/v1.0/normals/{}/{}".format(*_range(t, 7)),
+    "series": lambda t: "/api/v1.0/series/{}/{}?every=month".format(*_range(t, 365)),
+    "nearest": lambda t: f"/api/v1.0/stations/nearest?lat={t.rng.uniform(18.9, 22.2):.3f}&lon={t.rng.uniform(-160.2, -154.8):.3f}&k=3",
+    "page": lambda t: f"/api/v1.0/tobs?limit=500&station={t.rng.choice(t.stations)}",
+}
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Server
+###======================================================================================================================================================###
+
+def parse_config(text):
+    """(workers, env) of "workers=4,cache=1,HAWAII_X=..."."""
+
+    workers, env = 1, {}
+    for item in text.split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "workers":
+            workers = int(value)
+        elif key in CONFIG_ENV:
+            env[CONFIG_ENV[key]] = value
+        elif key.startswith("HAWAII_"):
+            env[key] = value
+        else:
+            raise ValueError(f"unknown configuration key {key!r} (workers, {', '.join(CONFIG_ENV)} or HAWAII_*)")
+    return workers, env
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """serve.py running in a subprocess for one configuration."""
+
+    def __init__(self, db_path, workers, env, timeout=120):
+        self.port = free_port()
+        # No access log line per request: at a few thousand requests per second it costs the workers more than the queries.
+        # A configuration can still turn it back on with HAWAII_ACCESS_LOG=1
+        child_env = dict(os.environ, HAWAII_WORKERS=str(workers), HAWAII_ACCESS_LOG="0")
+        child_env.update(env)
+        # stderr goes to a file rather than a pipe nobody reads: a full pipe would block the workers on their next log line
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, SERVE_PY, "--db", db_path, "--bind", f"127.0.0.1:{self.port}", "--workers", str(workers),
+             "--reload-interval", "0"],
+            env=child_env, cwd=os.path.dirname(SERVE_PY), stdout=subprocess.DEVNULL, stderr=self.log)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                tail = self.log_tail()
+                self.log.close()
+                raise RuntimeError(f"serve.py exited: {tail}")
+            try:
+                if request("127.0.0.1", self.port, "/api/v1.0/stations", timeout=2)[0] == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        tail = self.log_tail()
+        self.stop()
+        raise RuntimeError(f"serve.py did not answer within {timeout}s: {tail}")
+
+    def log_tail(self, size=2000):
+        """Last size characters serve.py wrote to stderr."""
+
+        self.log.seek(0, os.SEEK_END)
+        self.log.seek(max(0, self.log.tell() - size))
+        return self.log.read().decode(errors="replace")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Load generation
+###======================================================================================================================================================###
+
+def request(host, port, path, headers=None, timeout=10):
+    """(status, body bytes) of one GET on a new connection."""
+
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, len(response.read())
+    finally:
+        conn.close()
+
+
+def run_rate(port, traffic, rate, duration, connections, headers=None, timeout=10, poisson=False):
+    """Send rate requests per second for duration seconds. Returns [(kind, latency s, ok, bytes)], wall time."""
+
+    n = max(1, int(rate * duration))
+    if poisson:
+        offsets = np.cumsum(np.random.default_rng(traffic.rng.randrange(2 ** 32)).exponential(1 / rate, n))
+    else:
+        offsets = np.arange(n) / rate
+    requests = [traffic.next() for _ in range(n)]
+    results = [None] * n
+
+    def send(i, scheduled):
+        kind, path = requests[i]
+        try:
+            status, size = request("127.0.0.1", port, path, headers, timeout)
+            ok = 200 <= status < 300
+        except (OSError, http.client.HTTPException):
+            # Refused or timed out, or a malformed / truncated response (BadStatusLine, IncompleteRead)
+            ok, size = False, 0
+        # From the scheduled time: waiting for a free connection counts as latency
+        results[i] = (kind, time.perf_counter() - scheduled, ok, size)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        for i, offset in enumerate(offsets):
+            scheduled = started + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, i, scheduled)
+    return results, time.perf_counter() - started
+
+
+def histogram(latencies):
+    """Request counts per BUCKETS_MS bucket ("<=1", ..., "+Inf")."""
+
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    counts = np.bincount(np.searchsorted(BUCKETS_MS, ms, side="left"), minlength=len(BUCKETS_MS) + 1)
+    return {**{f"<={b}": int(c) for b, c in zip(BUCKETS_MS, counts)}, "+Inf": int(counts[-1])}
+
+
+def summarize(results, rate, duration, wall, slo_ms):
+    """Latency summary, histogram, per-kind summaries and the saturation verdict of one rate."""
+
+    latencies = [latency for _, latency, ok, _ in results if ok]
+    errors = sum(1 for _, _, ok, _ in results if not ok)
+    summary = benchmark.percentile_summary(latencies, errors, wall)
+    summary["offered_rps"] = rate
+    summary["error_rate"] = errors / len(results)
+    summary["bytes"] = sum(size for _, _, _, size in results)
+    summary["histogram"] = histogram(latencies)
+    summary["kinds"] = {}
+    for kind in sorted({r[0] for r in results}):
+        kind_results = [r for r in results if r[0] == kind]
+        kind_ok = [r[1] for r in kind_results if r[2]]
+        summary["kinds"][kind] = benchmark.percentile_summary(kind_ok, len(kind_results) - len(kind_ok), wall)
+
+    # Requests that completed within the offered window, not counting the drain of the queue at the end
+    on_time = len(latencies) / max(wall, duration) / rate
+    summary["saturated"] = bool(on_time < MIN_THROUGHPUT_RATIO or summary["error_rate"] > MAX_ERROR_RATE
+                                or summary["p99_ms"] > slo_ms)
+    return summary
+
+
+def run_config(db_path, label, traffic, rates, duration, warmup, connections, headers, slo_ms, stop_at_saturation,
+               poisson=False):
+    """Start the server of one configuration and run every rate. Returns {"label", "workers", "env", "rates": [...]}."""
+
+    workers, env = parse_config(label)
+    result = {"label": label, "workers": workers, "env": env, "rates": [], "saturation_rps": None, "max_sustained_rps": None}
+    server = Server(db_path, workers, env)
+    try:
+        if warmup:
+            run_rate(server.port, traffic, min(rates), warmup, connections, headers, poisson=poisson)
+        for rate in rates:
+            results, wall = run_rate(server.port, traffic, rate, duration, connections, headers, poisson=poisson)
+            summary = summarize(results, rate, duration, wall, slo_ms)
+            result["rates"].append(summary)
+            print(f"  {label:32s} {rate:8.1f} req/s offered  {summary['throughput_rps']:8.1f} done  "
+                  f"p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  errors {summary['error_rate']:6.2%}"
+                  f"{'  SATURATED' if summary['saturated'] else ''}", flush=True)
+            if summary["saturated"]:
+                if result["saturation_rps"] is None:
+                    result["saturation_rps"] = rate
+                if stop_at_saturation:
+                    break
+            elif result["saturation_rps"] is None:
+                result["max_sustained_rps"] = rate
+    finally:
+        server.stop()
+    return result
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Report
+###======================================================================================================================================================###
+
+def markdown_report(results):
+    """Side by side comparison of the configurations."""
+
+    config = results["config"]
+    lines = [
+        "# Load test",
+        "",
+        f"Database: {config['db']} ({config['rows']} rows, {config['first_date']} .. {config['last_date']}), "
+        f"mix: {config['mix']}, {config['duration']}s per rate, {config['connections']} client connections",
+        "",
+        "| configuration | max sustained req/s | saturation req/s |",
+        "|---|---:|---:|",
+    ]
+    for run in results["runs"]:
+        lines.append(f"| {run['label']} | {run['max_sustained_rps'] or '-'} | {run['saturation_rps'] or '-'} |")
+
+    rates = sorted({r["offered_rps"] for run in results["runs"] for r in run["rates"]})
+    for metric, title in (("p50_ms", "p50 latency (ms)"), ("p99_ms", "p99 latency (ms)"),
+                          ("throughput_rps", "completed req/s"), ("error_rate", "error rate")):
+        lines += ["", f"## {title}", "", "| configuration | " + " | ".join(f"{r:g} req/s" for r in rates) + " |",
+                  "|---|" + "---:|" * len(rates)]
+        for run in results["runs"]:
+            by_rate = {r["offered_rps"]: r for r in run["rates"]}
+            cells = []
+            for rate in rates:
+                value = by_rate.get(rate, {}).get(metric)
+                cells.append("-" if value is None else f"{value:.2%}" if metric == "error_rate" else f"{value:.1f}")
+            lines.append(f"| {run['label']} | " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay request mixes at fixed rates against locally launched servers.")
+    parser.add_argument("--db", default="loadtest.sqlite", help="SQLite file (default: loadtest.sqlite, generated)")
+    parser.add_argument("--reuse", action="store_true", help="use the existing --db file instead of generating it")
+    parser.add_argument("--rows", type=int, default=200000, help="measurement rows to generate (default 200k)")
+    parser.add_argument("--stations", type=int, default=20, help="stations to generate (default 20)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"kind=weight,... (default {DEFAULT_MIX})")
+    parser.add_argument("--config", action="append", help="workers=N,cache=0|1,store=0|1,HAWAII_*=... (repeatable)")
+    parser.add_argument("--rates", default="25,50,100,200", help="offered request rates per second (default 25,50,100,200)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per rate (default 10)")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of traffic before measuring (default 2)")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times instead of a fixed interval")
+    parser.add_argument("--connections", type=int, default=64, help="concurrent client connections (default 64)")
+    parser.add_argument("--range-days", type=int, default=7, help="days of the random <start>/<end> ranges (default 7)")
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    parser.add_argument("--slo-ms", type=float, default=500, help="p99 above which a rate counts as saturated (default 500)")
+    parser.add_argument("--keep-going", action="store_true", help="run the higher rates after the saturation point")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--report", help="write the comparison as markdown to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        configs = args.config or DEFAULT_CONFIGS
+        for config in configs:
+            parse_config(config)
+    except ValueError as e:
+        parser.error(str(e))
+    rates = sorted(float(r) for r in args.rates.split(","))
+
+    path = os.path.abspath(args.db)
+    if not args.reuse:
+        started = time.perf_counter()
+        n_rows, first_date, last_date = benchmark.generate_database(path, args.rows, args.stations, seed=args.seed)
+        print(f"Generated {n_rows} rows ({first_date} .. {last_date}) in {time.perf_counter() - started:.1f}s")
+    with sqlite3.connect(path) as conn:
+        n_rows, first_date, last_date = conn.execute("SELECT count(*), min(date), max(date) FROM measurement").fetchone()
+        stations = [row[0] for row in conn.execute("SELECT station FROM station")]
+
+    headers = {"Accept-Encoding": "gzip"} if args.gzip else {}
+    results = {
+        "config": {
+            "db": path, "rows": n_rows, "first_date": first_date, "last_date": last_date, "mix": args.mix, "rates": rates,
+            "duration": args.duration, "poisson": args.poisson, "connections": args.connections, "gzip": args.gzip,
+            "slo_ms": args.slo_ms, "python": sys.version.split()[0], "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        },
+        "runs": [],
+    }
+    for config in configs:
+        print(f"=== {config} ===", flush=True)
+        # Same request sequence for every configuration
+        traffic = Traffic(mix, first_date, last_date, stations, args.range_days, args.seed)
+        run = run_config(path, config, traffic, rates, args.duration, args.warmup, args.connections, headers,
+                         args.slo_ms, not args.keep_going, args.poisson)
+        results["runs"].append(run)
+
+    report = markdown_report(results)
+    print()
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(report)
+    return results
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,228 @@
+###======================================================================================================================================================###
+# Keyset pagination, filters, sub-windows and projection for the data routes
+###======================================================================================================================================================###
+
+# /api/v1.0/precipitation, /api/v1.0/tobs, /api/v1.0/<start> and /api/v1.0/<start>/<end> return their whole range in one document.
+# Adding any of these query parameters returns one page of it instead:
+#    # limit=N                   rows per page (default HAWAII_PAGE_LIMIT=1000, capped at HAWAII_PAGE_MAX_LIMIT=10000)
+#    # cursor=...                the "next" value of the previous page
+#    # station=A,B               only these stations (repeatable); on the <start> routes the daily values cover these stations
+#    # from=YYYY-MM-DD, to=...   sub-window inside the route's date range (%Y%m%d also accepted)
+#    # fields=date,prcp          columns to return (default all)
+# The page is {"fields": [...], "data": [[...], ...], "next": cursor or null}, or with ?format=columnar / msgpack the columnar
+# document of wire.py with its "next" cursor.
+
+# Pages are read with keyset conditions, not OFFSET: rows are ordered by (date, station) (by date on the <start> routes) and the
+# cursor holds the key of the last row sent, so every page costs one index seek plus at most limit + 1 rows. A cursor stays valid
+# while rows are added (new rows are simply returned when the pages reach them) and is rejected when the filters change.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import json
+import base64
+import hashlib
+
+from flask import request, jsonify, current_app
+
+import wire
+import batch
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+DEFAULT_LIMIT = int(os.environ.get("HAWAII_PAGE_LIMIT", "1000"))
+MAX_LIMIT = int(os.environ.get("HAWAII_PAGE_MAX_LIMIT", "10000"))
+
+# Query parameters that switch a route to paged output
+PAGE_PARAMS = ("limit", "cursor", "station", "from", "to", "fields")
+
+# Row layout of each kind of route, the leading key columns order the pages
+PRECIPITATION = (("date", "station", "prcp"), 2)
+TOBS = (("date", "station", "tobs"), 2)
+DAILY = (("date", "tmin", "tavg", "tmax"), 1)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Page requests
+###======================================================================================================================================================###
+
+class Page:
+    """A validated page request."""
+
+    __slots__ = ("columns", "key_size", "limit", "after", "stations", "start", "end", "fields", "scope")
+
+    def __init__(self, layout, limit=DEFAULT_LIMIT, after=None, stations=None, start=None, end=None, fields=None, scope=""):
+        self.columns, self.key_size = layout
+        self.limit = limit
+        self.after = after
+        self.stations = stations
+        self.start = start
+        self.end = end
+        self.fields = fields or list(self.columns)
+        self.scope = scope
+
+    def window(self, start, end=None):
+        """The route's [start, end] range narrowed to the from / to sub-window (None = unbounded end)."""
+
+        if self.start is not None and self.start > start:
+            start = self.start
+        if self.end is not None and (end is None or self.end < end):
+            end = self.end
+        return start, end
+
+    def key(self, row):
+        return list(row[:self.key_size])
+
+
+def _scope(stations, start, end):
+    """Fingerprint of the filters a cursor was issued for."""
+
+    text = json.dumps([request.path, stations, start, end])
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+
+def encode_cursor(scope, key):
+    return base64.urlsafe_b64encode(json.dumps([scope] + key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, scope, key_size):
+    """The row key stored in the cursor. Raises ValueError when it is malformed or was issued for other filters."""
+
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("invalid cursor")
+    if not isinstance(value, list) or len(value) != key_size + 1 or not all(isinstance(v, str) for v in value):
+        raise ValueError("invalid cursor")
+    if value[0] != scope:
+        raise ValueError("cursor does not match the station / from / to filters of the request")
+    return value[1:]
+
+
+def requested_page(layout):
+    """Page for the current request, None when it has no paging parameter (whole result). Raises ValueError."""
+
+    args = request.args
+    if not any(name in args for name in PAGE_PARAMS):
+        return None
+    columns, key_size = layout
+
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    stations = sorted({s.strip() for value in args.getlist("station") for s in value.split(",") if s.strip()}) or None
+    start = batch.normalize_date(args["from"]) if "from" in args else None
+    end = batch.normalize_date(args["to"]) if "to" in args else None
+
+    fields = None
+    if "fields" in args:
+        fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+        unknown = [f for f in fields if f not in columns]
+        if unknown or not fields:
+            raise ValueError(f"fields must be among {', '.join(columns)}")
+
+    scope = _scope(stations, start, end)
+    after = decode_cursor(args["cursor"], scope, key_size) if args.get("cursor") else None
+    return Page(layout, min(limit, MAX_LIMIT), after, stations, start, end, fields, scope)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Queries
+###======================================================================================================================================================###
+
+def _filters(page, start, end):
+    """WHERE clauses and parameters of the sub-window and the station filter.
+
+    The filter stays on the station code: ix_measurement_date_station (date, station, prcp, tobs) covers it.
+    """
+
+    start, end = page.window(start, end)
+    clauses, params = ["date >= ?"], [start]
+    if end is not None:
+        clauses.append("date <= ?")
+        params.append(end)
+    if page.stations:
+        clauses.append(f"station IN ({', '.join(['?'] * len(page.stations))})")
+        params += page.stations
+    return clauses, params
+
+
+def fetch_readings(dbapi_conn, page, column, start, end=None, not_null=False):
+    """Up to page.limit + 1 (date, station, column) rows after the cursor, in (date, station) order.
+
+    column is "prcp" or "tobs" (never taken from the request).
+    """
+
+    clauses, params = _filters(page, start, end)
+    if not_null:
+        clauses.append(f"{column} IS NOT NULL")
+    if page.after:
+        # Row value comparison: the ix_measurement_date_station index seeks straight to the cursor
+        clauses.append("(date, station) > (?, ?)")
+        params += page.after
+    sql = (f"SELECT date, station, {column} FROM measurement WHERE {' AND '.join(clauses)} "
+           f"ORDER BY date, station LIMIT ?")
+    return batch.fetch_sql(dbapi_conn, sql, params + [page.limit + 1])
+
+
+def fetch_daily(dbapi_conn, page, start, end=None, use_summary=False):
+    """Up to page.limit + 1 (date, tmin, tavg, tmax) rows after the cursor, in date order.
+
+    Reads daily_summary when use_summary and no station filter is given.
+    """
+
+    clauses, params = _filters(page, start, end)
+    if page.after:
+        clauses.append("date > ?")
+        params += page.after
+    where = " AND ".join(clauses)
+    if use_summary and not page.stations:
+        sql = (f"SELECT date, tobs_min, tobs_sum / nullif(tobs_count, 0), tobs_max FROM daily_summary WHERE {where} "
+               f"ORDER BY date LIMIT ?")
+    else:
+        sql = (f"SELECT date, min(tobs), avg(tobs), max(tobs) FROM measurement WHERE {where} "
+               f"GROUP BY date ORDER BY date LIMIT ?")
+    return batch.fetch_sql(dbapi_conn, sql, params + [page.limit + 1])
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Response
+###======================================================================================================================================================###
+
+def page_response(rows, page, wire_format="json"):
+    """Page of the first page.limit rows, with the cursor of the next page when more rows were fetched.
+
+    wire_format is one of wire.PAGE_FORMATS.
+    """
+
+    more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    positions = [page.columns.index(f) for f in page.fields]
+    data = [[row[i] for i in positions] for row in rows]
+    next_cursor = encode_cursor(page.scope, page.key(rows[-1])) if more else None
+    if wire_format != "json":
+        body, mimetype = wire.encode_page(data, page.fields, next_cursor, wire_format)
+        return current_app.response_class(body, mimetype=mimetype)
+    return jsonify({"fields": page.fields, "data": data, "next": next_cursor})
+
+###======================================================================================================================================================###
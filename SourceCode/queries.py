@@ -0,0 +1,152 @@
+###======================================================================================================================================================###
+# Lean data access: compiled Core statements and shape-specialized JSON encoders
+###======================================================================================================================================================###
+
+# session.query(...).all() builds an ORM Row per result row, app.py then copies it into a tuple and jsonify walks it generically.
+# Here every statement of the API is a Core select() with bound parameters, compiled once for the engine's dialect. It runs on
+# the DBAPI connection of the request's session and the driver's plain tuples are returned as they are: no Row objects, no copies.
+# The encoders then write the JSON for the known row shapes directly: (date, prcp), (date, tobs) and (date, min, avg, max).
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import time
+
+from sqlalchemy import select, func, bindparam
+
+import instrument
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Compiled statements
+###======================================================================================================================================================###
+
+class CompiledQuery:
+    """A Core statement compiled once for a dialect, executed on a DBAPI connection with bound parameters."""
+
+    def __init__(self, statement, dialect):
+        compiled = statement.compile(dialect=dialect)
+        self.sql = str(compiled)
+        # Parameter order for positional paramstyles (qmark for SQLite), None for named ones
+        self.positions = list(compiled.positiontup) if compiled.positional else None
+        # Values of the literal parameters of the statement (e.g. the 0 of nullif(count, 0))
+        self.defaults = {name: value for name, value in compiled.params.items() if value is not None}
+
+    def execute(self, dbapi_conn, **params):
+        """Run the statement, returns the DBAPI cursor."""
+
+        params = {**self.defaults, **params}
+        args = [params[name] for name in self.positions] if self.positions is not None else params
+        start = time.perf_counter()
+        cursor = dbapi_conn.cursor()
+        cursor.execute(self.sql, args)
+        instrument.add_sql(time.perf_counter() - start)
+        return cursor
+
+    def fetchall(self, dbapi_conn, **params):
+        """All rows as the driver's tuples."""
+
+        return self.execute(dbapi_conn, **params).fetchall()
+
+    def iterate(self, dbapi_conn, batch_size, **params):
+        """Yield rows, fetching batch_size rows at a time from the cursor."""
+
+        cursor = self.execute(dbapi_conn, **params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    def columns(self, dbapi_conn, **params):
+        """The result as one list per column."""
+
+        cursor = self.execute(dbapi_conn, **params)
+        rows = cursor.fetchall()
+        if not rows:
+            return [[] for _ in cursor.description]
+        return [list(column) for column in zip(*rows)]
+
+    def scalar(self, dbapi_conn, **params):
+        row = self.execute(dbapi_conn, **params).fetchone()
+        return None if row is None else row[0]
+
+
+def build_queries(dialect, measurement, station, daily_summary=None):
+    """Compile every statement of the API for the dialect, returns {name: CompiledQuery}."""
+
+    m = measurement
+    statements = {
+        "max_date": select(func.max(m.c.date)),
+        "precipitation": select(m.c.date, m.c.prcp)
+            .where(m.c.date >= bindparam("start")).where(m.c.prcp.isnot(None)),
+        "tobs": select(m.c.date, m.c.tobs)
+            .where(m.c.date >= bindparam("start")),
+        "station_tobs": select(m.c.date, m.c.tobs)
+            .where(m.c.station == bindparam("station")).where(m.c.date >= bindparam("start")),
+        "stations": select(station.c.station, station.c.name, station.c.latitude, station.c.longitude, station.c.elevation),
+        "by_date": select(m.c.date, func.min(m.c.tobs), func.avg(m.c.tobs), func.max(m.c.tobs))
+            .where(m.c.date >= bindparam("start")).group_by(m.c.date),
+        "by_date_range": select(m.c.date, func.min(m.c.tobs), func.avg(m.c.tobs), func.max(m.c.tobs))
+            .where(m.c.date >= bindparam("start")).where(m.c.date <= bindparam("end")).group_by(m.c.date),
+    }
+
+    if daily_summary is not None:
+        s = daily_summary
+        daily = select(s.c.date, s.c.tobs_min, s.c.tobs_sum / func.nullif(s.c.tobs_count, 0), s.c.tobs_max)
+        statements["summary_by_date"] = daily.where(s.c.date >= bindparam("start")).order_by(s.c.date)
+        statements["summary_by_date_range"] = daily.where(s.c.date >= bindparam("start"))\
+            .where(s.c.date <= bindparam("end")).order_by(s.c.date)
+
+    return {name: CompiledQuery(statement, dialect) for name, statement in statements.items()}
+
+
+# QUERIES: compiled once for the application's engine on first access, so that schema.py can use build_queries() on the
+# database given with --db without db.py reflecting the application's database
+def __getattr__(name):
+    global QUERIES
+    if name != "QUERIES":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import db
+    QUERIES = build_queries(db.engine.dialect, db.Measurement.__table__, db.Station.__table__,
+                            None if db.DailySummary is None else db.DailySummary.__table__)
+    return QUERIES
+
+
+def dbapi_connection(session):
+    """The DBAPI connection behind the session (checked out from the pool until the session is removed)."""
+
+    return session.connection().connection.dbapi_connection
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# JSON encoders
+###======================================================================================================================================================###
+
+# Output is byte-identical to jsonify for these shapes: compact separators, floats as repr(), None as null, trailing newline.
+# Dates are ISO strings and need no escaping.
+
+def _num(value):
+    return "null" if value is None else repr(value)
+
+
+def encode_date_value(rows):
+    """JSON for [(date, value), ...] rows: (date, prcp) and (date, tobs)."""
+
+    return "[" + ",".join(f'["{d}",{_num(v)}]' for d, v in rows) + "]\n"
+
+
+def encode_date_stats(rows):
+    """JSON for [(date, min, avg, max), ...] rows."""
+
+    return "[" + ",".join(f'["{d}",{_num(lo)},{_num(avg)},{_num(hi)}]' for d, lo, avg, hi in rows) + "]\n"
+
+###======================================================================================================================================================###
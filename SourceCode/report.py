@@ -0,0 +1,357 @@
+###======================================================================================================================================================###
+# Chart report generator for the Output folder
+###======================================================================================================================================================###
+
+# Renders the charts of climate.ipynb without the notebook, optionally for every station:
+#    # precipitation.png            daily precipitation totals of the last 12 months (one bar per day, not one per reading)
+#    # station-histogram.png        tobs histogram of the most active station over the last 12 months
+#    # temperature.png              trip average temperature, peak-to-peak error bar (same dates, previous year)
+#    # daily-normals.png            tmin / tavg / tmax normals of the trip dates
+#    # stations/<station>-precipitation.png and stations/<station>-histogram.png with --stations
+# The measurement table is read once into a store.MeasurementStore and every chart's data is pre-aggregated from its arrays
+# (bincount per day, histogram counts, climatology lookups), so each chart receives a few hundred numbers. The charts are drawn
+# in a process pool with the non-interactive Agg backend. A fingerprint of each chart's data is kept in
+# <output>/.report-fingerprints.json and charts whose data did not change since the last run are not drawn again.
+
+# Usage (from the SourceCode folder):
+#    # python report.py                                   (the four notebook charts into ../Output)
+#    # python report.py --stations all --workers 8        (plus two charts per station)
+#    # python report.py --db sqlite:////data/noaa.sqlite --out /data/report --force
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import store
+import batch
+import climatology
+from engines import make_engine, reflect
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+DEFAULT_OUTPUT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Output"))
+FINGERPRINTS = ".report-fingerprints.json"
+
+# Bump when the drawing code changes, so every chart is drawn again
+RENDER_VERSION = 1
+
+STYLE = "fivethirtyeight"
+HISTOGRAM_BINS = 11
+
+TRIP_START = "2018-01-01"
+TRIP_END = "2018-01-07"
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Drawing (runs in the pool workers)
+###======================================================================================================================================================###
+
+def init_worker():
+    """Select the Agg backend before pyplot is imported: no display, no GUI event loop."""
+
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import style
+    style.use(STYLE)
+
+
+def draw_precipitation(path, data):
+    import matplotlib.pyplot as plt
+
+    # Bars of width one day drawn as a single filled step patch instead of one rectangle per day
+    fig, ax = plt.subplots()
+    days = data["days"]
+    ax.stairs(data["totals"], np.append(days, days[-1] + 1).astype("datetime64[D]"), fill=True, label="Precipitation")
+    ax.set_title(data["title"])
+    ax.legend()
+    ax.get_xaxis().set_visible(False)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_histogram(path, data):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.stairs(data["counts"], data["edges"], fill=True, label="tobs")
+    ax.legend()
+    ax.set_ylabel("Frequency", fontsize=10)
+    ax.set_title(data["title"])
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_trip_temperature(path, data):
+    import matplotlib.pyplot as plt
+
+    tmin, tavg, tmax = data["temps"]
+    fig, ax = plt.subplots()
+    ax.bar(x=1, height=tavg, yerr=(tmax - tmin), color="peachpuff", width=0.75)
+    ax.set_xticks([])
+    ax.set_yticks([0, 20, 40, 60, 80, 100])
+    ax.set_xlim(0, 2)
+    ax.set_title("Trip Avg Temp")
+    ax.set_ylabel("Temp F")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_daily_normals(path, data):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    x = np.arange(len(data["dates"]))
+    for column, label in ((0, "Min"), (1, "Avg"), (2, "Max")):
+        ax.fill_between(x, data["normals"][:, column], alpha=0.5, label=label)
+    ax.set_xticks(x, data["dates"], rotation=45)
+    ax.set_xlabel("date")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+DRAW = {
+    "precipitation": draw_precipitation,
+    "histogram": draw_histogram,
+    "trip_temperature": draw_trip_temperature,
+    "daily_normals": draw_daily_normals,
+}
+
+
+def render(job):
+    """Draw one chart, returns (path, seconds)."""
+
+    kind, path, data = job
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    DRAW[kind](path, data)
+    return path, time.perf_counter() - start
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Chart data (pre-aggregated in the parent from one read of the table)
+###======================================================================================================================================================###
+
+def last_year(s):
+    """First day number of the last 12 months of data (max date - 365 days, as in the notebook)."""
+
+    return int(s.day.max()) - 365
+
+
+def precipitation_totals(s, start_day):
+    """Daily precipitation totals from start_day for all stations (row 0) and every station (row i + 1)."""
+
+    n_days = int(s.day.max()) - start_day + 1
+    mask = (s.day >= start_day) & ~np.isnan(s.prcp)
+    offsets = s.day[mask] - start_day
+    prcp = s.prcp[mask].astype(np.float64)
+
+    totals = np.empty((len(s.stations) + 1, n_days))
+    totals[0] = np.bincount(offsets, weights=prcp, minlength=n_days)
+    cells = s.station[mask].astype(np.int64) * n_days + offsets
+    totals[1:] = np.bincount(cells, weights=prcp, minlength=len(s.stations) * n_days).reshape(len(s.stations), n_days)
+    return np.arange(start_day, start_day + n_days), totals
+
+
+def station_histograms(s, start_day, station_ids):
+    """{station index: (counts, edges)} of the tobs readings from start_day."""
+
+    mask = (s.day >= start_day) & ~np.isnan(s.tobs)
+    station, tobs = s.station[mask], s.tobs[mask]
+    order = np.argsort(station, kind="stable")
+    station, tobs = station[order], tobs[order]
+    bounds = np.searchsorted(station, np.arange(len(s.stations) + 1))
+    return {i: np.histogram(tobs[bounds[i]:bounds[i + 1]], bins=HISTOGRAM_BINS) for i in station_ids}
+
+
+def selected_stations(s, stations):
+    """Store indexes of the --stations value ("none", "all" or comma separated codes). Raises ValueError for an unknown code."""
+
+    if stations == "all":
+        return list(range(len(s.stations)))
+    if stations == "none":
+        return []
+    codes = [code.strip() for code in stations.split(",") if code.strip()]
+    unknown = [code for code in codes if code not in s.station_index]
+    if unknown:
+        raise ValueError(f"unknown station {', '.join(unknown)} (stations: {', '.join(s.stations)})")
+    return [s.station_index[code] for code in codes]
+
+
+def build_jobs(s, output, stations="none", trip_start=TRIP_START, trip_end=TRIP_END):
+    """[(kind, path, data)] of every chart of the report."""
+
+    start_day = last_year(s)
+    days, totals = precipitation_totals(s, start_day)
+    counts = np.bincount(s.station[~np.isnan(s.tobs)], minlength=len(s.stations))
+    most_active = int(np.argmax(counts))
+
+    station_ids = selected_stations(s, stations)
+    histograms = station_histograms(s, start_day, set(station_ids) | {most_active})
+
+    # Trip: calc_temps over the same dates of the previous year, normals of the trip's month-day keys
+    low = (dt.datetime.strptime(trip_start, '%Y-%m-%d').date() - dt.timedelta(days=365)).strftime('%Y-%m-%d')
+    high = (dt.datetime.strptime(trip_end, '%Y-%m-%d').date() - dt.timedelta(days=365)).strftime('%Y-%m-%d')
+    trip_temps = batch.range_stats_store(s, [(None, low, high)])[0]
+    trip_days = np.arange(store.to_day(trip_start), store.to_day(trip_end) + 1)
+    normals_table = climatology.compute(s, smoothing=0, percentiles=())
+    trip_keys = [climatology.MONTH_DAYS[k] for k in climatology.month_day_keys(trip_days)]
+
+    jobs = [
+        ("precipitation", os.path.join(output, "precipitation.png"),
+         {"days": days, "totals": totals[0], "title": ""}),
+        ("histogram", os.path.join(output, "station-histogram.png"),
+         {"counts": histograms[most_active][0], "edges": histograms[most_active][1], "title": ""}),
+        ("daily_normals", os.path.join(output, "daily-normals.png"),
+         {"dates": [store.to_date_str(d) for d in trip_days],
+          "normals": np.array([normals_table.normals(key) for key in trip_keys], dtype=np.float64)}),
+    ]
+    if None not in trip_temps:
+        jobs.append(("trip_temperature", os.path.join(output, "temperature.png"), {"temps": trip_temps}))
+
+    for i in station_ids:
+        code = s.stations[i]
+        jobs.append(("precipitation", os.path.join(output, "stations", f"{code}-precipitation.png"),
+                     {"days": days, "totals": totals[i + 1], "title": code}))
+        jobs.append(("histogram", os.path.join(output, "stations", f"{code}-histogram.png"),
+                     {"counts": histograms[i][0], "edges": histograms[i][1], "title": code}))
+    return jobs
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Fingerprints
+###======================================================================================================================================================###
+
+def fingerprint(kind, data):
+    """Digest of the chart kind, the drawing code version and the chart's data."""
+
+    h = hashlib.blake2b(f"{RENDER_VERSION}|{STYLE}|{kind}".encode(), digest_size=16)
+    for name in sorted(data):
+        value = data[name]
+        h.update(name.encode())
+        if isinstance(value, np.ndarray):
+            h.update(f"{value.dtype}{value.shape}".encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+def read_fingerprints(output):
+    try:
+        with open(os.path.join(output, FINGERPRINTS)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_fingerprints(output, fingerprints):
+    path = os.path.join(output, FINGERPRINTS)
+    with open(path + ".tmp", "w") as f:
+        json.dump(fingerprints, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Report
+###======================================================================================================================================================###
+
+def generate(measurement_store, output=DEFAULT_OUTPUT, stations="none", workers=None, force=False,
+             trip_start=TRIP_START, trip_end=TRIP_END):
+    """Draw the charts whose data changed. Returns {"rendered": [...], "skipped": [...], "seconds": {...}}."""
+
+    os.makedirs(output, exist_ok=True)
+    jobs = build_jobs(measurement_store, output, stations, trip_start, trip_end)
+
+    previous = read_fingerprints(output)
+    current, todo, skipped = {}, [], []
+    for kind, path, data in jobs:
+        name = os.path.relpath(path, output)
+        current[name] = fingerprint(kind, data)
+        if not force and previous.get(name) == current[name] and os.path.exists(path):
+            skipped.append(path)
+        else:
+            todo.append((kind, path, data))
+
+    workers = workers or os.cpu_count() or 1
+    if len(todo) <= 1 or workers == 1:
+        init_worker()
+        results = [render(job) for job in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo)), initializer=init_worker) as pool:
+            results = list(pool.map(render, todo, chunksize=max(1, len(todo) // (workers * 4))))
+
+    # Charts of this run replace the previous fingerprints, entries of charts no longer generated are kept
+    write_fingerprints(output, {**previous, **current})
+    return {"rendered": [path for path, _ in results], "skipped": skipped, "seconds": dict(results)}
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the chart report into the Output folder.")
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Output folder (default: ../Output)")
+    parser.add_argument("--stations", default="none", help="per-station charts: none, all or a comma separated list")
+    parser.add_argument("--workers", type=int, help="drawing processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="draw every chart even if its data did not change")
+    parser.add_argument("--trip-start", default=TRIP_START, help="first trip date (%%Y-%%m-%%d)")
+    parser.add_argument("--trip-end", default=TRIP_END, help="last trip date (%%Y-%%m-%%d)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    engine = make_engine(args.db)
+    measurement_store = store.load_store(engine, reflect(engine).classes.measurement)
+    loaded = time.perf_counter()
+
+    try:
+        selected_stations(measurement_store, args.stations)
+    except ValueError as e:
+        parser.error(f"--stations: {e}")
+
+    result = generate(measurement_store, args.out, args.stations, args.workers, args.force, args.trip_start, args.trip_end)
+    done = time.perf_counter()
+
+    for path in result["rendered"]:
+        print(f"rendered {os.path.relpath(path, args.out)} ({result['seconds'][path] * 1000:.0f} ms)")
+    print(f"{len(result['rendered'])} rendered, {len(result['skipped'])} unchanged; "
+          f"load {loaded - started:.2f}s, charts {done - loaded:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
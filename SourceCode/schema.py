@@ -0,0 +1,240 @@
+###======================================================================================================================================================###
+# Schema management for the measurement table
+###======================================================================================================================================================###
+
+# Adds the indexes used by the hot filters of app.py and climate.ipynb, refreshes the planner statistics (ANALYZE) and prints
+# EXPLAIN QUERY PLAN for each route's statement (the compiled statements of queries.py and the keyset pages of paging.py,
+# built for the database's tables) before and after, so full table scans on measurement are easy to spot.
+
+# Usage (from the SourceCode folder):
+#    # python schema.py status              (existing tables / indexes)
+#    # python schema.py explain             (query plans for the current schema)
+#    # python schema.py migrate             (plans before, create indexes + ANALYZE, plans after)
+#    # python schema.py migrate --dry-run   (only print the statements)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import sys
+import sqlite3
+import argparse
+
+from sqlalchemy import inspect, text
+
+import paging
+import queries
+from engines import make_engine, reflect
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Indexes
+###======================================================================================================================================================###
+
+# name -> CREATE statement
+INDEXES = {
+    # Station filters of the notebook (most active station, its last 12 months of tobs).
+    # Unique: one reading per station and day, ingest.py relies on it to deduplicate
+    "ix_measurement_station_date":
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_measurement_station_date ON measurement (station, date)",
+    # Covering index of the date range filters of /precipitation, /tobs, /<start> and /<start>/<end>: scans that only read
+    # tobs / prcp never touch the table rows
+    "ix_measurement_date_tobs_prcp":
+        "CREATE INDEX IF NOT EXISTS ix_measurement_date_tobs_prcp ON measurement (date, tobs, prcp)",
+    # Keyset pages of paging.py: (date, station) order with the reading columns, pages never touch the table rows
+    "ix_measurement_date_station":
+        "CREATE INDEX IF NOT EXISTS ix_measurement_date_station ON measurement (date, station, prcp, tobs)",
+    # Month-day key ('%m-%d'), used by the daily normals. Queries must filter on substr(date, 6, 5) to use it
+    "ix_measurement_month_day":
+        "CREATE INDEX IF NOT EXISTS ix_measurement_month_day ON measurement (substr(date, 6, 5))",
+}
+
+# Created by earlier versions and dropped by migrate(): the covering indexes above start with date
+REDUNDANT_INDEXES = ("ix_measurement_date",)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Route queries
+###======================================================================================================================================================###
+
+# Representative parameters of the statements
+SAMPLE_PARAMS = {"start": "2016-08-23", "end": "2017-01-07", "station": "USC00519281"}
+SAMPLE_CURSOR = ["2017-01-01", "USC00519281"]
+
+# The notebook's ORM queries as SQL (the routes' statements are taken from queries.py and paging.py)
+NOTEBOOK_QUERIES = {
+    "notebook: most active stations":
+        ("SELECT station, count(station) FROM measurement GROUP BY station ORDER BY count(station) DESC", {}),
+    "notebook: calc_temps":
+        ("SELECT min(tobs), avg(tobs), max(tobs) FROM measurement WHERE date >= :start AND date <= :end",
+         {"start": "2017-01-01", "end": "2017-01-07"}),
+    "notebook: month-day normals":
+        ("SELECT min(tobs), avg(tobs), max(tobs) FROM measurement WHERE substr(date, 6, 5) = :md", {"md": "01-01"}),
+}
+
+
+class ExplainCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        return super().execute("EXPLAIN QUERY PLAN " + sql, params)
+
+
+class ExplainConnection:
+    """DBAPI connection stand-in: every statement executed through it returns its EXPLAIN QUERY PLAN rows instead."""
+
+    def __init__(self, dbapi_conn):
+        self.dbapi_conn = dbapi_conn
+
+    def cursor(self):
+        return self.dbapi_conn.cursor(ExplainCursor)
+
+
+def route_statements(engine):
+    """{name: callable(dbapi_conn)} running the statements of the routes (queries.py, paging.py) for the engine's tables."""
+
+    Base = reflect(engine)
+    summary = Base.classes.get("daily_summary")
+    compiled = queries.build_queries(engine.dialect, Base.classes.measurement.__table__, Base.classes.station.__table__,
+                                     None if summary is None else summary.__table__)
+
+    statements = {name: (lambda conn, q=query: q.fetchall(conn, **SAMPLE_PARAMS)) for name, query in compiled.items()}
+    readings = paging.Page(paging.TOBS, after=SAMPLE_CURSOR)
+    daily = paging.Page(paging.DAILY, after=SAMPLE_CURSOR[:1])
+    statements["page: tobs"] = lambda conn: paging.fetch_readings(conn, readings, "tobs", SAMPLE_PARAMS["start"])
+    statements["page: precipitation"] = lambda conn: paging.fetch_readings(conn, readings, "prcp", SAMPLE_PARAMS["start"],
+                                                                            not_null=True)
+    statements["page: <start>/<end>"] = lambda conn: paging.fetch_daily(conn, daily, SAMPLE_PARAMS["start"], SAMPLE_PARAMS["end"],
+                                                                         use_summary=summary is not None)
+    return statements
+
+###======================================================================================================================================================###
+# Inspect / Explain / Migrate
+###======================================================================================================================================================###
+
+def existing_indexes(engine, table="measurement"):
+    """Names of the indexes currently defined on the table."""
+
+    with engine.connect() as conn:
+        return [r[1] for r in conn.execute(text(f"PRAGMA index_list({table})"))]
+
+
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN rows (detail column) of one statement."""
+
+    return [r[-1] for r in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+
+
+def is_full_scan(detail, table="measurement"):
+    """True when a plan step scans the whole table without an index."""
+
+    return detail.startswith(f"SCAN {table}") and "INDEX" not in detail
+
+
+def query_plans(engine):
+    """{query name: [plan steps]} of the route statements and of NOTEBOOK_QUERIES."""
+
+    statements = route_statements(engine)
+    raw_conn = engine.raw_connection()
+    try:
+        plans = {name: [r[-1] for r in run(ExplainConnection(raw_conn.dbapi_connection))] for name, run in statements.items()}
+    finally:
+        raw_conn.close()
+    with engine.connect() as conn:
+        plans.update({name: explain(conn, sql, params) for name, (sql, params) in NOTEBOOK_QUERIES.items()})
+    return plans
+
+
+def print_plans(plans, title):
+    print(f"=== {title} ===")
+    for name, steps in plans.items():
+        flag = "  <-- full scan" if any(is_full_scan(s) for s in steps) else ""
+        print(f"{name}{flag}")
+        for step in steps:
+            print(f"    {step}")
+
+
+def duplicate_readings(engine, sample=5):
+    """(number of (station, date) pairs with more than one row, up to sample of those (station, date, rows))."""
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT station, date, count(*) FROM measurement GROUP BY station, date HAVING count(*) > 1")).all()
+    return len(rows), [tuple(r) for r in rows[:sample]]
+
+
+def migrate(engine, dry_run=False):
+    """Create the missing indexes, drop the redundant ones and run ANALYZE. Returns the statements that were (or would be) executed.
+
+    Raises ValueError when measurement has duplicate (station, date) rows: the unique index cannot be created.
+    """
+
+    current = set(existing_indexes(engine))
+    if "ix_measurement_station_date" not in current:
+        count, sample = duplicate_readings(engine)
+        if count:
+            listed = ", ".join(f"{station} {date} ({n} rows)" for station, date, n in sample)
+            raise ValueError(f"measurement has {count} duplicate (station, date) pairs, e.g. {listed}: remove them before "
+                             f"creating the unique index ix_measurement_station_date")
+
+    statements = [sql for name, sql in INDEXES.items() if name not in current]
+    statements += [f"DROP INDEX {name}" for name in REDUNDANT_INDEXES if name in current]
+    statements.append("ANALYZE")
+    if not dry_run:
+        with engine.begin() as conn:
+            for sql in statements:
+                conn.execute(text(sql))
+    return statements
+
+
+def drop_indexes(engine):
+    """Drop the indexes created by migrate() (and the redundant ones of earlier versions)."""
+
+    with engine.begin() as conn:
+        for name in list(INDEXES) + list(REDUNDANT_INDEXES):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the indexes of the measurement table.")
+    parser.add_argument("command", choices=["status", "explain", "migrate", "drop-indexes"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--dry-run", action="store_true", help="migrate: print the statements without running them")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.db)
+
+    if args.command == "status":
+        for table in inspect(engine).get_table_names():
+            print(f"{table}: {', '.join(existing_indexes(engine, table)) or '(no indexes)'}")
+
+    elif args.command == "explain":
+        print_plans(query_plans(engine), "Query plans")
+
+    elif args.command == "migrate":
+        print_plans(query_plans(engine), "Before")
+        try:
+            statements = migrate(engine, args.dry_run)
+        except ValueError as e:
+            sys.exit(f"schema.py: {e}")
+        print("=== Statements ===")
+        for sql in statements:
+            print(f"    {sql}")
+        if not args.dry_run:
+            print_plans(query_plans(engine), "After")
+
+    else:
+        drop_indexes(engine)
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
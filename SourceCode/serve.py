@@ -0,0 +1,300 @@
+###======================================================================================================================================================###
+# Pre-fork production server
+###======================================================================================================================================================###
+
+# app.run(debug=True) serves every request from one process. This server runs the API on N worker processes sharing one
+# listening socket:
+#    # master:  owns the socket, watches the database snapshot and replaces the loader when a new snapshot is published
+#    # loader:  imports app.py once (reflection, compiled queries, in-memory store when HAWAII_USE_STORE=1), freezes the loaded
+#               objects out of the garbage collector and forks the workers, so they share those pages copy-on-write.
+#               Restarts workers that die
+#    # workers: drop the connections inherited from the loader and serve requests with their own read-only SQLite connections
+# A snapshot is published by renaming a new database file over the served path (or by sending SIGHUP to the master). The master
+# then starts a loader for the new file and, once its workers accept requests, stops the old generation: its workers finish
+# the requests in progress and exit. A loader that fails to start leaves the old generation serving.
+
+# Usage (from the SourceCode folder):
+#    # python serve.py                                          (Resources/hawaii.sqlite on 127.0.0.1:8000, one worker per CPU)
+#    # python serve.py --db /data/hawaii.sqlite --bind 0.0.0.0:8000 --workers 8
+#    # HAWAII_USE_STORE=1 python serve.py                       (store loaded once in the loader, shared by the workers)
+#    # HAWAII_ACCESS_LOG=0 python serve.py                      (no per-request log line on stderr)
+#    # kill -HUP <master pid>                                   (reload)
+# The other HAWAII_* variables of app.py / db.py apply to the workers.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import gc
+import sys
+import time
+import select
+import signal
+import socket
+import logging
+import argparse
+import traceback
+
+# Configuration and engine helpers only: importing engines opens no connection
+import engines
+from engines import read_only_url, file_id
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+DEFAULT_DB_PATH = os.path.normpath(engines.DEFAULT_DB_PATH)
+
+WORKERS = int(os.environ.get("HAWAII_WORKERS", str(os.cpu_count() or 1)))
+BIND = os.environ.get("HAWAII_BIND", "127.0.0.1:8000")
+# Seconds between two checks of the database file for a new snapshot (0 disables the check, SIGHUP still reloads)
+RELOAD_INTERVAL = float(os.environ.get("HAWAII_RELOAD_INTERVAL", "5"))
+# Seconds a stopping generation has to finish its requests before its workers are killed
+GRACEFUL_TIMEOUT = float(os.environ.get("HAWAII_GRACEFUL_TIMEOUT", "30"))
+# Seconds a new loader has to import the app and start its workers
+LOAD_TIMEOUT = float(os.environ.get("HAWAII_LOAD_TIMEOUT", "120"))
+# 0 drops werkzeug's line per request on stderr (errors are still logged)
+ACCESS_LOG = os.environ.get("HAWAII_ACCESS_LOG", "1") != "0"
+
+# How often a worker checks for a stop request between two requests
+POLL_INTERVAL = 0.5
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Worker
+###======================================================================================================================================================###
+
+def run_worker(listener, flask_app):
+    """Serve requests on the inherited socket until SIGTERM, then finish the current request and exit."""
+
+    import db
+    from werkzeug.serving import make_server
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # The pools were created in the loader: forget their connections without closing them under the loader's feet
+    db.dispose_engines(close=False)
+    if not ACCESS_LOG:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, flask_app, fd=listener.fileno())
+    server.timeout = POLL_INTERVAL
+    while not stopping:
+        server.handle_request()
+    server.server_close()
+    os._exit(0)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Loader
+###======================================================================================================================================================###
+
+def fork_worker(listener, flask_app):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(listener, flask_app)
+        except BaseException:
+            traceback.print_exc()
+        os._exit(1)
+    return pid
+
+
+def run_loader(listener, db_path, workers, ready_fd):
+    """Load the app, fork the workers, report readiness on ready_fd and keep the workers running until SIGTERM."""
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # engines.py was imported by the master, before the URL of this generation was known
+    engines.DB_URL = os.environ["HAWAII_DB_URL"] = read_only_url(db_path)
+    import app as flask_module
+    import werkzeug.serving  # noqa: F401  (imported once here rather than in every worker)
+
+    # Loaded objects never become garbage: keep the collector from touching (and so copying) their pages in the workers
+    flask_module.db.dispose_engines()
+    gc.collect()
+    gc.freeze()
+
+    pids = {fork_worker(listener, flask_module.app) for _ in range(workers)}
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+
+    while not stopping:
+        time.sleep(POLL_INTERVAL)
+        while not stopping:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            # A worker died: replace it
+            pids.discard(pid)
+            pids.add(fork_worker(listener, flask_module.app))
+
+    stop_processes(pids, GRACEFUL_TIMEOUT)
+    os._exit(0)
+
+
+def stop_processes(pids, timeout):
+    """SIGTERM the processes, SIGKILL the ones still running after timeout seconds, reap them all."""
+
+    pids = set(pids)
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + timeout
+    while pids and time.monotonic() < deadline:
+        for pid in list(pids):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    pids.discard(pid)
+            except ChildProcessError:
+                pids.discard(pid)
+        time.sleep(0.05)
+
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Master
+###======================================================================================================================================================###
+
+def start_generation(listener, db_path, workers):
+    """Fork a loader and wait until its workers run. Returns the loader pid, or None when it failed to start."""
+
+    ready_r, ready_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_r)
+        try:
+            run_loader(listener, db_path, workers, ready_w)
+        except BaseException:
+            traceback.print_exc()
+        os._exit(1)
+
+    os.close(ready_w)
+    try:
+        readable, _, _ = select.select([ready_r], [], [], LOAD_TIMEOUT)
+        ready = bool(readable) and os.read(ready_r, 1) == b"1"
+    finally:
+        os.close(ready_r)
+    if not ready:
+        stop_processes([pid], 0)
+        return None
+    return pid
+
+
+def bind(address):
+    host, _, port = address.rpartition(":")
+    listener = socket.create_server((host or "127.0.0.1", int(port)), reuse_port=False, backlog=1024)
+    listener.set_inheritable(True)
+    return listener
+
+
+def serve(db_path, address=BIND, workers=WORKERS, reload_interval=RELOAD_INTERVAL):
+    listener = bind(address)
+    signals = []
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: signals.append(signum))
+
+    current = start_generation(listener, db_path, workers)
+    if current is None:
+        sys.exit(f"serve.py: the app failed to load {db_path}")
+    snapshot = file_id(db_path)
+    print(f"Serving {db_path} on http://{address} with {workers} workers (master pid {os.getpid()})", flush=True)
+
+    next_check = time.monotonic() + reload_interval
+    while True:
+        time.sleep(POLL_INTERVAL)
+
+        # Reap loaders that died on their own
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid == current:
+            print("serve.py: loader exited, starting a new one", flush=True)
+            current = start_generation(listener, db_path, workers)
+            if current is None:
+                sys.exit(f"serve.py: the app failed to load {db_path}")
+
+        reload = False
+        while signals:
+            signum = signals.pop()
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                stop_processes([current], GRACEFUL_TIMEOUT + 5)
+                listener.close()
+                return
+            reload = True
+
+        if reload_interval and time.monotonic() >= next_check:
+            next_check = time.monotonic() + reload_interval
+            published = file_id(db_path)
+            if published is not None and published != snapshot:
+                reload = True
+
+        if reload:
+            snapshot = file_id(db_path)
+            new = start_generation(listener, db_path, workers)
+            if new is None:
+                print("serve.py: the new snapshot failed to load, still serving the previous one", flush=True)
+                continue
+            old, current = current, new
+            stop_processes([old], GRACEFUL_TIMEOUT + 5)
+            print(f"serve.py: reloaded {db_path} (loader pid {current})", flush=True)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked worker processes.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database file (default: Resources/hawaii.sqlite)")
+    parser.add_argument("--bind", default=BIND, help="host:port to listen on (default: HAWAII_BIND or 127.0.0.1:8000)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (default: HAWAII_WORKERS or the CPU count)")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="seconds between checks for a new snapshot, 0 to only reload on SIGHUP")
+    args = parser.parse_args(argv)
+
+    # The master never imports app / db: every loader imports them fresh, against the snapshot it serves
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+
+    serve(args.db, args.bind, max(1, args.workers), args.reload_interval)
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,288 @@
+###======================================================================================================================================================###
+# Spatial index and location queries over the station coordinates
+###======================================================================================================================================================###
+
+# /api/v1.0/stations returns every station and clients filtered by location themselves. StationIndex is built from the station
+# registry (stations.py) and answers location queries without touching the database:
+#    # the stations are bucketed into a grid of HAWAII_SPATIAL_CELL degree cells (default 1), stored as one array of station
+#      positions sorted by cell plus the (start, end) slice of every non-empty cell
+#    # a radius query only reads the cells overlapping the circle's bounding box, then computes exact great-circle distances
+#      (chord length between unit vectors) for those candidates with NumPy
+#    # a k nearest query runs radius queries with a doubling radius until k stations are found
+# Routes (see app.py), optionally with ?start=&end= to add the tobs / prcp aggregates of every returned station over the range:
+#    # /api/v1.0/stations/nearest?lat=21.3&lon=-157.8&k=3
+#    # /api/v1.0/stations/within?lat=21.3&lon=-157.8&radius=25          (km)
+#    # /api/v1.0/stations/bbox?south=21.2&west=-158.3&north=21.7&east=-157.6
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import math
+
+import numpy as np
+
+import batch
+import store
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+CELL_DEGREES = float(os.environ.get("HAWAII_SPATIAL_CELL", "1"))
+# Largest k of a nearest query
+MAX_NEAREST = int(os.environ.get("HAWAII_SPATIAL_MAX_NEAREST", "100"))
+
+# Mean Earth radius
+EARTH_RADIUS_KM = 6371.0088
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Index
+###======================================================================================================================================================###
+
+def unit_vectors(lat, lon):
+    """(n, 3) unit vectors of latitude / longitude arrays in degrees."""
+
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class StationIndex:
+    """Grid index over the stations of a registry that have coordinates."""
+
+    def __init__(self, records, version=None, cell=CELL_DEGREES):
+        self.records = tuple(r for r in records if r.latitude is not None and r.longitude is not None)
+        self.version = version
+        self.cell = cell
+        self.lat = np.array([r.latitude for r in self.records], dtype=np.float64)
+        self.lon = np.array([r.longitude for r in self.records], dtype=np.float64)
+        self.xyz = unit_vectors(self.lat, self.lon)
+
+        # Cell number of every station, station positions sorted by cell and the slice of each cell
+        self.n_cols = int(math.ceil(360 / cell))
+        rows, cols = self._cell(self.lat, self.lon)
+        keys = rows * self.n_cols + cols
+        self.order = np.argsort(keys, kind="stable")
+        cell_keys, starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.cells = {int(k): (int(s), int(s + c)) for k, s, c in zip(cell_keys, starts, counts)}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _cell(self, lat, lon):
+        rows = np.floor((np.asarray(lat) + 90) / self.cell).astype(np.int64)
+        cols = np.floor((np.asarray(lon) + 180) / self.cell).astype(np.int64) % self.n_cols
+        return rows, cols
+
+    def _candidates(self, south, north, west, east):
+        """Positions of the stations in the cells overlapping the box (west > east crosses the antimeridian)."""
+
+        row_lo, row_hi = (int(r) for r in self._cell([max(south, -90.0), min(north, 90.0)], [0, 0])[0])
+        if east - west >= 360:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            col_lo, col_hi = (int(c) for c in self._cell([0, 0], [west, east])[1])
+            col_ranges = [(col_lo, col_hi)] if west <= east else [(col_lo, self.n_cols - 1), (0, col_hi)]
+
+        n_cells = (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges)
+        if n_cells > len(self.cells):
+            # Wide box: walk the non-empty cells instead of the box's cells
+            slices = [span for key, span in self.cells.items()
+                      if row_lo <= key // self.n_cols <= row_hi and any(lo <= key % self.n_cols <= hi for lo, hi in col_ranges)]
+        else:
+            slices = [self.cells[key] for row in range(row_lo, row_hi + 1) for lo, hi in col_ranges
+                      for key in range(row * self.n_cols + lo, row * self.n_cols + hi + 1) if key in self.cells]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[start:end] for start, end in slices])
+
+    def distances(self, positions, lat, lon):
+        """Great-circle distances in km from (lat, lon) to the stations at positions."""
+
+        chord = np.linalg.norm(self.xyz[positions] - unit_vectors([lat], [lon])[0], axis=1)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+    def within(self, lat, lon, radius_km):
+        """[(record, distance_km)] of the stations within radius_km of (lat, lon), nearest first."""
+
+        angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+        south, north = lat - math.degrees(angle), lat + math.degrees(angle)
+        if south <= -90 or north >= 90:
+            # The circle contains a pole: every longitude
+            west, east = -180.0, 180.0
+        else:
+            # Widest longitude offset of the circle (reached north / south of the centre)
+            spread = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+            west, east = lon - spread, lon + spread
+            if east - west < 360:
+                west, east = (west + 180) % 360 - 180, (east + 180) % 360 - 180
+
+        positions = self._candidates(south, north, west, east)
+        distance = self.distances(positions, lat, lon)
+        keep = distance <= radius_km
+        positions, distance = positions[keep], distance[keep]
+        order = np.lexsort((positions, distance))
+        return [(self.records[p], float(d)) for p, d in zip(positions[order], distance[order])]
+
+    def nearest(self, lat, lon, k):
+        """[(record, distance_km)] of the k stations nearest to (lat, lon), nearest first."""
+
+        # Every station within the radius is found, so once k of them are, they include the k nearest
+        radius = self.cell * 111.2
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= HALF_CIRCUMFERENCE_KM:
+                return found[:k]
+            radius *= 2
+
+    def bbox(self, south, west, north, east):
+        """[record] of the stations inside the box, in registry order (west > east crosses the antimeridian)."""
+
+        positions = self._candidates(south, north, west, east)
+        lat, lon = self.lat[positions], self.lon[positions]
+        inside = (lat >= south) & (lat <= north)
+        if west <= east:
+            inside &= (lon >= west) & (lon <= east)
+        else:
+            inside &= (lon >= west) | (lon <= east)
+        return [self.records[p] for p in np.sort(positions[inside])]
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Request parameters
+###======================================================================================================================================================###
+
+def float_arg(args, name, low, high):
+    """Float query parameter within [low, high]. Raises ValueError."""
+
+    if name not in args:
+        raise ValueError(f"{name} is required")
+    try:
+        value = float(args[name])
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def int_arg(args, name, low, high, default):
+    """Integer query parameter within [low, high], default when absent. Raises ValueError."""
+
+    try:
+        value = int(args.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def date_range_arg(args):
+    """(start, end) of the optional ?start=&end= aggregate range, None without start. Raises ValueError."""
+
+    if "start" not in args:
+        if "end" in args:
+            raise ValueError("end requires start")
+        return None
+    start = batch.normalize_date(args["start"])
+    end = batch.normalize_date(args["end"]) if "end" in args else None
+    if end is not None and end < start:
+        raise ValueError("end must not be before start")
+    return start, end
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Aggregates of the selected stations
+###======================================================================================================================================================###
+
+def station_stats_sql(dbapi_conn, codes, start, end=None, station_ids=None):
+    """{code: (count, tmin, tavg, tmax, prcp)} of tobs / prcp over [start, end] for the stations, in one GROUP BY query.
+
+    station_ids are the integer ids of the codes in the same order (stations.py), None to filter on the codes.
+    """
+
+    if not codes:
+        return {}
+    column, values = ("station_id", station_ids) if station_ids is not None else ("station", codes)
+    clauses, params = [f"{column} IN ({', '.join(['?'] * len(values))})", "date >= ?"], list(values) + [start]
+    if end is not None:
+        clauses.append("date <= ?")
+        params.append(end)
+    sql = (f"SELECT {column}, count(tobs), min(tobs), avg(tobs), max(tobs), sum(prcp) FROM measurement "
+           f"WHERE {' AND '.join(clauses)} GROUP BY {column}")
+    rows = batch.fetch_sql(dbapi_conn, sql, params)
+    if station_ids is not None:
+        code_of = dict(zip(station_ids, codes))
+        return {code_of[row[0]]: tuple(row[1:]) for row in rows}
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def station_stats_store(measurement_store, codes, start, end=None):
+    """station_stats_sql() over the date-sorted arrays of store.MeasurementStore: one slice and one bincount per column."""
+
+    s = measurement_store
+    lo, hi = s.day_range(store.to_day(start), None if end is None else store.to_day(end))
+    station, tobs, prcp = s.station[lo:hi], s.tobs[lo:hi], s.prcp[lo:hi]
+    n = len(s.stations)
+
+    valid = ~np.isnan(tobs)
+    count = np.bincount(station[valid], minlength=n)
+    total = np.bincount(station[valid], weights=tobs[valid].astype(np.float64), minlength=n)
+    tmin = np.full(n, np.inf, dtype=np.float32)
+    tmax = np.full(n, -np.inf, dtype=np.float32)
+    np.minimum.at(tmin, station[valid], tobs[valid])
+    np.maximum.at(tmax, station[valid], tobs[valid])
+    wet = ~np.isnan(prcp)
+    prcp_count = np.bincount(station[wet], minlength=n)
+    prcp_total = np.bincount(station[wet], weights=prcp[wet].astype(np.float64), minlength=n)
+
+    result = {}
+    for code in codes:
+        i = s.station_index.get(code)
+        if i is None or not (count[i] or prcp_count[i]):
+            continue
+        # NULL like SQL when a station has no reading of that column in the range
+        temps = (float(tmin[i]), float(total[i] / count[i]), float(tmax[i])) if count[i] else (None, None, None)
+        result[code] = (int(count[i]),) + temps + (float(prcp_total[i]) if prcp_count[i] else None,)
+    return result
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Response
+###======================================================================================================================================================###
+
+def station_entries(found, stats=None):
+    """JSON objects of (record, distance_km or None) pairs, with the aggregates of stats ({code: (count, ...)}) when given."""
+
+    entries = []
+    for record, distance in found:
+        entry = {"station": record.code, "name": record.name, "latitude": record.latitude, "longitude": record.longitude,
+                 "elevation": record.elevation}
+        if distance is not None:
+            entry["distance_km"] = round(distance, 3)
+        if stats is not None:
+            count, tmin, tavg, tmax, prcp = stats.get(record.code, (0, None, None, None, None))
+            entry.update({"count": count, "tmin": tmin, "tavg": tavg, "tmax": tmax, "prcp": prcp})
+        entries.append(entry)
+    return entries
+
+###======================================================================================================================================================###
@@ -0,0 +1,239 @@
+###======================================================================================================================================================###
+# Station registry and integer station ids
+###======================================================================================================================================================###
+
+# The station table is small and almost never changes, yet /api/v1.0/stations read and serialized it on every request, and
+# every measurement row and index entry repeats the 11 character station code. This module:
+#    # loads the stations once into StationRecord objects (__slots__, no per-record __dict__), indexed by code and by id
+#    # keeps the /api/v1.0/stations document serialized once, byte-identical to jsonify() of the rows
+#    # "python stations.py migrate" adds an integer measurement.station_id (= station.id), filled for existing rows and by
+#      an insert trigger for new ones, with a covering (station_id, date, tobs, prcp) index. The per-station aggregates of
+#      /api/v1.0/stations/nearest|within|bbox then read only that index, where (station, date) needs the table rows
+# The text measurement.station column is kept, so existing queries, the notebook and ingest.py keep working unchanged. The
+# paged and series station filters stay on the code: they return or order by it, and ix_measurement_date_station (schema.py)
+# covers them. ingest.py suspends the trigger during a load and fills station_id once at the end (fill_station_ids).
+
+# Usage (from the SourceCode folder):
+#    # python stations.py migrate           (add station_id, its index and trigger)
+#    # python stations.py status
+#    # python stations.py drop              (remove them again)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import json
+import argparse
+
+from sqlalchemy import text, inspect
+
+from engines import make_engine
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Schema
+###======================================================================================================================================================###
+
+STATION_ID_INDEX = "ix_measurement_station_id_date"
+# Covering for the per-station aggregates (the first versions of migrate only indexed station_id, date)
+STATION_ID_INDEX_COLUMNS = ["station_id", "date", "tobs", "prcp"]
+STATION_ID_TRIGGER = "measurement_station_id_insert"
+
+FILL_STATION_IDS = ("UPDATE measurement SET station_id = (SELECT station.id FROM station WHERE station.station = measurement.station) "
+                    "WHERE station_id IS NULL")
+
+# Rows inserted by anything else than ingest.py only set the code
+CREATE_STATION_ID_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS {STATION_ID_TRIGGER} AFTER INSERT ON measurement
+    WHEN NEW.station_id IS NULL
+    BEGIN
+        UPDATE measurement SET station_id = (SELECT station.id FROM station WHERE station.station = NEW.station)
+        WHERE rowid = NEW.rowid;
+    END"""
+
+CREATE_STATION_ID_INDEX = f"CREATE INDEX IF NOT EXISTS {STATION_ID_INDEX} ON measurement ({', '.join(STATION_ID_INDEX_COLUMNS)})"
+
+MIGRATE = [
+    "ALTER TABLE measurement ADD COLUMN station_id INTEGER",
+    FILL_STATION_IDS,
+    CREATE_STATION_ID_INDEX,
+    CREATE_STATION_ID_TRIGGER,
+    "ANALYZE measurement",
+]
+
+
+def has_station_ids(engine):
+    """True when measurement has the station_id column."""
+
+    return any(c["name"] == "station_id" for c in inspect(engine).get_columns("measurement"))
+
+
+def migrate(engine):
+    """Add and fill measurement.station_id with its index and trigger. Returns False when it already exists.
+
+    An existing column gets the covering index in place of an older narrower one.
+    """
+
+    if has_station_ids(engine):
+        with engine.begin() as conn:
+            columns = [r[2] for r in conn.exec_driver_sql(f"PRAGMA index_info({STATION_ID_INDEX})")]
+            if columns != STATION_ID_INDEX_COLUMNS:
+                conn.execute(text(f"DROP INDEX IF EXISTS {STATION_ID_INDEX}"))
+                conn.execute(text(CREATE_STATION_ID_INDEX))
+                conn.execute(text("ANALYZE measurement"))
+        return False
+    with engine.begin() as conn:
+        for sql in MIGRATE:
+            conn.execute(text(sql))
+    return True
+
+
+def fill_station_ids(dbapi_conn):
+    """Set station_id on the rows that lack it and restore the trigger (after a load with the trigger suspended).
+
+    Does nothing when measurement has no station_id column. Returns the number of rows filled.
+    """
+
+    columns = [r[1] for r in dbapi_conn.execute("PRAGMA table_info(measurement)")]
+    if "station_id" not in columns:
+        return 0
+    filled = dbapi_conn.execute(FILL_STATION_IDS).rowcount
+    dbapi_conn.execute(CREATE_STATION_ID_TRIGGER)
+    return filled
+
+
+def drop(engine):
+    """Remove station_id, its index and trigger."""
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {STATION_ID_TRIGGER}"))
+        conn.execute(text(f"DROP INDEX IF EXISTS {STATION_ID_INDEX}"))
+    if has_station_ids(engine):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE measurement DROP COLUMN station_id"))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Registry
+###======================================================================================================================================================###
+
+class StationRecord:
+    """One station."""
+
+    __slots__ = ("id", "code", "name", "latitude", "longitude", "elevation")
+
+    def __init__(self, id, code, name, latitude, longitude, elevation):
+        self.id = id
+        self.code = code
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elevation = elevation
+
+    def as_row(self):
+        """(station, name, latitude, longitude, elevation), the row shape of /api/v1.0/stations."""
+
+        return (self.code, self.name, self.latitude, self.longitude, self.elevation)
+
+    def __repr__(self):
+        return f"StationRecord({self.id}, {self.code!r}, {self.name!r})"
+
+
+class StationRegistry:
+    """Every station, by code and by id, plus the serialized /api/v1.0/stations document."""
+
+    def __init__(self, records, version=None):
+        # Table order, as returned by the stations query
+        self.records = tuple(records)
+        self.by_code = {r.code: r for r in self.records}
+        self.by_id = {r.id: r for r in self.records}
+        self.version = version
+        # Compact separators and a trailing newline, as jsonify (ensure_ascii like Flask's JSON provider)
+        self.body = json.dumps([r.as_row() for r in self.records], separators=(",", ":")) + "\n"
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def rows(self):
+        return [r.as_row() for r in self.records]
+
+    def id_of(self, code):
+        """Integer id of the station code, None when unknown."""
+
+        record = self.by_code.get(code)
+        return None if record is None else record.id
+
+    def ids_of(self, codes):
+        """Integer ids of the known codes (unknown codes are left out)."""
+
+        return [self.by_code[c].id for c in codes if c in self.by_code]
+
+    def code_of(self, id):
+        return self.by_id[id].code
+
+
+VERSION_SQL = "SELECT count(*), max(id) FROM station"
+STATIONS_SQL = "SELECT id, station, name, latitude, longitude, elevation FROM station"
+
+
+def registry_version(dbapi_conn):
+    """(count, max(id)) of station: changes when stations are added or removed."""
+
+    cursor = dbapi_conn.cursor()
+    cursor.execute(VERSION_SQL)
+    return tuple(cursor.fetchone())
+
+
+def load_registry(dbapi_conn):
+    """Read the station table into a StationRegistry."""
+
+    cursor = dbapi_conn.cursor()
+    cursor.execute(STATIONS_SQL)
+    records = [StationRecord(*row) for row in cursor.fetchall()]
+    return StationRegistry(records, registry_version(dbapi_conn))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the integer station ids of the measurement table.")
+    parser.add_argument("command", choices=["migrate", "status", "drop"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.db)
+
+    if args.command == "migrate":
+        print("measurement.station_id added" if migrate(engine) else "measurement.station_id already exists")
+
+    elif args.command == "status":
+        raw_conn = engine.raw_connection()
+        try:
+            registry = load_registry(raw_conn)
+        finally:
+            raw_conn.close()
+        print(f"{len(registry)} stations, station_id column: {'yes' if has_station_ids(engine) else 'no'}")
+        for record in registry:
+            print(f"    {record.id:>4}  {record.code}  {record.name}")
+
+    else:
+        drop(engine)
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,219 @@
+###======================================================================================================================================================###
+# In-memory columnar measurement store
+###======================================================================================================================================================###
+
+# Optional replacement for the GROUP BY date query behind /api/v1.0/<start> and /api/v1.0/<start>/<end>.
+# The measurement table is loaded once into NumPy arrays sorted by date:
+#    # station: int32 index into MeasurementStore.stations
+#    # day:     int32 day number (days since 1970-01-01)
+#    # prcp:    float32, NaN where the database holds NULL
+#    # tobs:    float32, NaN where the database holds NULL
+# A date range is located with a binary search and the per-day TMIN/TAVG/TMAX are computed with ufunc.reduceat, so a query
+# costs O(log n + k) for k rows in the range and no SQL round trip.
+
+# Enable it in app.py with the environment variable HAWAII_USE_STORE=1. With HAWAII_STORE_PATH pointing to an export of
+# columnar.py, the arrays are read from its memory-mapped files instead of the measurement table (when the export is current).
+# app.py holds the store in a Reloader: it is loaded again when the data version of db.py changes (checked at most every
+# HAWAII_STORE_VERSION_CHECK seconds, default 1), so rows ingested after startup show up like on the SQL routes.
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import time
+import threading
+
+import numpy as np
+from sqlalchemy import select, func
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+USE_STORE = os.environ.get("HAWAII_USE_STORE", "0") == "1"
+STORE_PATH = os.environ.get("HAWAII_STORE_PATH")
+STORE_VERSION_CHECK = float(os.environ.get("HAWAII_STORE_VERSION_CHECK", "1"))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Date helpers
+###======================================================================================================================================================###
+
+def to_day(date_str):
+    """Convert a '%Y-%m-%d' string to an int day number."""
+
+    return int(np.datetime64(date_str, "D").astype(np.int64))
+
+
+def to_date_str(day):
+    """Convert a day number back to a '%Y-%m-%d' string."""
+
+    return str(np.datetime64(int(day), "D"))
+
+
+def to_days(date_strs):
+    """Vectorized to_day() for a sequence of '%Y-%m-%d' strings."""
+
+    return np.array(date_strs, dtype="datetime64[D]").astype(np.int32)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Store
+###======================================================================================================================================================###
+
+class MeasurementStore:
+    """Date-sorted column arrays of the measurement table."""
+
+    def __init__(self, stations, station, day, prcp, tobs):
+
+        # Sort every column by day (stable, so rows of one day keep their load order)
+        order = np.argsort(day, kind="stable")
+        self.stations = list(stations)
+        self.station_index = {code: i for i, code in enumerate(self.stations)}
+        self.station = np.ascontiguousarray(station[order], dtype=np.int32)
+        self.day = np.ascontiguousarray(day[order], dtype=np.int32)
+        self.prcp = np.ascontiguousarray(prcp[order], dtype=np.float32)
+        self.tobs = np.ascontiguousarray(tobs[order], dtype=np.float32)
+
+    def __len__(self):
+        return len(self.day)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the store from (station, date, prcp, tobs) tuples."""
+
+        rows = list(rows)
+        codes = [r[0] for r in rows]
+        stations = sorted(set(codes))
+        index = {code: i for i, code in enumerate(stations)}
+
+        station = np.fromiter((index[c] for c in codes), dtype=np.int32, count=len(rows))
+        day = to_days([r[1] for r in rows]) if rows else np.empty(0, dtype=np.int32)
+        # None -> NaN for NULL readings
+        prcp = np.array([np.nan if r[2] is None else r[2] for r in rows], dtype=np.float32)
+        tobs = np.array([np.nan if r[3] is None else r[3] for r in rows], dtype=np.float32)
+        return cls(stations, station, day, prcp, tobs)
+
+    @classmethod
+    def from_engine(cls, engine, Measurement):
+        """Load the whole measurement table through the given engine."""
+
+        query = select(Measurement.station, Measurement.date, Measurement.prcp, Measurement.tobs)
+        with engine.connect() as conn:
+            return cls.from_rows(conn.execute(query))
+
+    def day_range(self, start_day, end_day=None):
+        """Return the (lo, hi) slice of rows with start_day <= day <= end_day (binary search)."""
+
+        lo = int(np.searchsorted(self.day, start_day, side="left"))
+        if end_day is None:
+            hi = len(self.day)
+        else:
+            hi = int(np.searchsorted(self.day, end_day, side="right"))
+        return lo, max(lo, hi)
+
+    def daily_temps(self, start_date, end_date=None):
+        """TMIN, TAVG and TMAX of tobs per date for start_date <= date <= end_date ('%Y-%m-%d' strings).
+
+        Returns a list of (date, tmin, tavg, tmax) tuples, the same shape as the SQL GROUP BY date query.
+        Days where every tobs is NULL return None for the three values, like SQL min/avg/max.
+        """
+
+        end_day = None if end_date is None else to_day(end_date)
+        lo, hi = self.day_range(to_day(start_date), end_day)
+        if lo == hi:
+            return []
+
+        day = self.day[lo:hi]
+        tobs = self.tobs[lo:hi]
+
+        # Start offset of every distinct day inside the slice
+        starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+
+        # fmin / fmax ignore NaN unless the whole group is NaN; the mean only counts non-NULL readings
+        valid = ~np.isnan(tobs)
+        tmin = np.fmin.reduceat(tobs, starts)
+        tmax = np.fmax.reduceat(tobs, starts)
+        total = np.add.reduceat(np.where(valid, tobs, 0).astype(np.float64), starts)
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+
+        result = []
+        for i, s in enumerate(starts):
+            if count[i] == 0:
+                result.append((to_date_str(day[s]), None, None, None))
+            else:
+                result.append((to_date_str(day[s]), float(tmin[i]), float(total[i] / count[i]), float(tmax[i])))
+        return result
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Loader
+###======================================================================================================================================================###
+
+def load_store(engine, Measurement, path=None):
+    """Load a MeasurementStore from the columnar export at path (default STORE_PATH) or from the database.
+
+    The export is only used when its data version (max date, max id) matches the database, otherwise rows added since
+    the export would be missing.
+    """
+
+    path = path or STORE_PATH
+    if path:
+        import columnar
+        reader = columnar.ColumnarReader(path)
+        with engine.connect() as conn:
+            version = tuple(conn.execute(select(func.max(Measurement.date), func.max(Measurement.id))).one())
+        if reader.data_version == version:
+            return reader.to_store()
+
+    return MeasurementStore.from_engine(engine, Measurement)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Reloader
+###======================================================================================================================================================###
+
+class Reloader:
+    """Value built by load() at startup and built again when version_func() changes (queried at most every check_interval seconds)."""
+
+    def __init__(self, load, version_func, check_interval=STORE_VERSION_CHECK):
+        self.load = load
+        self.version_func = version_func
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.version = version_func()
+        self.value = load()
+        self.checked = time.monotonic()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self.checked < self.check_interval:
+            return self.value
+        with self.lock:
+            # Another thread may have checked while this one waited for the lock
+            if now - self.checked >= self.check_interval:
+                version = self.version_func()
+                if version != self.version:
+                    self.value = self.load()
+                    self.version = version
+                    self.reloads += 1
+                self.checked = time.monotonic()
+            return self.value
+
+###======================================================================================================================================================###
@@ -0,0 +1,102 @@
+###======================================================================================================================================================###
+# Streaming JSON responses
+###======================================================================================================================================================###
+
+# Large results (e.g. /api/v1.0/<start> with an early start date) can be sent as a chunked response instead of building the
+# full row list and the full JSON string in memory. The query helpers yield rows from the cursor in batches (yield_per) and the
+# encoders below turn them into chunks as they arrive, so peak memory does not depend on the size of the range.
+
+# Requested by the client with:
+#    # ?stream=1 (or ?stream=json)     chunked JSON array, same document as the non-streamed route
+#    # ?stream=ndjson                  one JSON array per line
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import json
+
+from flask import Response, request, stream_with_context
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+# Rows fetched from the cursor per batch, also the number of rows encoded per chunk
+STREAM_BATCH_SIZE = int(os.environ.get("HAWAII_STREAM_BATCH_SIZE", "1000"))
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Encoders
+###======================================================================================================================================================###
+
+# Compact separators, as used by jsonify
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def iter_json_array(rows, batch_size=STREAM_BATCH_SIZE):
+    """Yield a JSON array of rows in chunks of batch_size rows."""
+
+    yield "["
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(_dumps(row))
+        if len(batch) >= batch_size:
+            yield ("" if first else ",") + ",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ("" if first else ",") + ",".join(batch)
+    yield "]\n"
+
+
+def iter_ndjson(rows, batch_size=STREAM_BATCH_SIZE):
+    """Yield newline-delimited JSON, one row per line, in chunks of batch_size rows."""
+
+    batch = []
+    for row in rows:
+        batch.append(_dumps(row) + "\n")
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Flask helpers
+###======================================================================================================================================================###
+
+def requested_format():
+    """'json' or 'ndjson' when the client asked for a streamed response, None otherwise."""
+
+    stream = request.args.get("stream", "").lower()
+    if stream in ("1", "true", "json"):
+        return "json"
+    if stream == "ndjson":
+        return "ndjson"
+    return None
+
+
+def stream_response(rows, stream_format="json"):
+    """Chunked response for an iterable of rows (the request context stays open until the last row is sent)."""
+
+    if stream_format == "ndjson":
+        return Response(stream_with_context(iter_ndjson(rows)), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(iter_json_array(rows)), mimetype="application/json")
+
+###======================================================================================================================================================###
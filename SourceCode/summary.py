@@ -0,0 +1,233 @@
+###======================================================================================================================================================###
+# Precomputed daily aggregates
+###======================================================================================================================================================###
+
+# Maintains two summary tables next to measurement so that the date range APIs and the notebook's daily normals read
+# one row per day instead of every measurement row:
+#    # daily_summary:        per date -> count, sum, min, max of tobs and prcp
+#    # day_of_year_normals:  per '%m-%d' key -> count, sum, min, max of tobs and prcp over all years
+# SQLite triggers on measurement keep both tables up to date when new rows are inserted.
+# Updates and deletes of existing measurement rows are not tracked: run "refresh" for the affected dates (or "build") after those.
+
+# Usage (from the SourceCode folder):
+#    # python summary.py build                                  (create / rebuild both tables and the triggers)
+#    # python summary.py refresh --start 2017-01-01 --end 2017-01-31
+#    # python summary.py drop
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import argparse
+
+from sqlalchemy import inspect, text
+
+from engines import make_engine
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Schema
+###======================================================================================================================================================###
+
+SUMMARY_TABLES = ("daily_summary", "day_of_year_normals")
+SUMMARY_TRIGGERS = ("measurement_summary_insert",)
+
+CREATE_DAILY_SUMMARY = """
+CREATE TABLE IF NOT EXISTS daily_summary (
+    date TEXT NOT NULL PRIMARY KEY,
+    tobs_count INTEGER NOT NULL DEFAULT 0,
+    tobs_sum FLOAT NOT NULL DEFAULT 0,
+    tobs_min FLOAT,
+    tobs_max FLOAT,
+    prcp_count INTEGER NOT NULL DEFAULT 0,
+    prcp_sum FLOAT NOT NULL DEFAULT 0,
+    prcp_min FLOAT,
+    prcp_max FLOAT
+)
+"""
+
+CREATE_DAY_OF_YEAR_NORMALS = """
+CREATE TABLE IF NOT EXISTS day_of_year_normals (
+    month_day TEXT NOT NULL PRIMARY KEY,
+    tobs_count INTEGER NOT NULL DEFAULT 0,
+    tobs_sum FLOAT NOT NULL DEFAULT 0,
+    tobs_min FLOAT,
+    tobs_max FLOAT,
+    prcp_count INTEGER NOT NULL DEFAULT 0,
+    prcp_sum FLOAT NOT NULL DEFAULT 0,
+    prcp_min FLOAT,
+    prcp_max FLOAT
+)
+"""
+
+# Aggregate columns shared by both tables, computed from measurement rows
+AGGREGATES = """
+    count(tobs), coalesce(sum(tobs), 0), min(tobs), max(tobs),
+    count(prcp), coalesce(sum(prcp), 0), min(prcp), max(prcp)
+"""
+
+# Running min / max that ignores NULL on either side (SQLite's scalar min() returns NULL if any argument is NULL)
+def _merge_min(col, value):
+    return f"CASE WHEN {value} IS NULL THEN {col} WHEN {col} IS NULL THEN {value} ELSE min({col}, {value}) END"
+
+
+def _merge_max(col, value):
+    return f"CASE WHEN {value} IS NULL THEN {col} WHEN {col} IS NULL THEN {value} ELSE max({col}, {value}) END"
+
+
+def _merge_row(table, key_col, key_expr):
+    """Statements folding NEW.tobs / NEW.prcp into the summary row keyed by key_expr."""
+
+    return f"""
+    INSERT OR IGNORE INTO {table} ({key_col}) VALUES ({key_expr});
+    UPDATE {table} SET
+        tobs_count = tobs_count + (NEW.tobs IS NOT NULL),
+        tobs_sum = tobs_sum + coalesce(NEW.tobs, 0),
+        tobs_min = {_merge_min("tobs_min", "NEW.tobs")},
+        tobs_max = {_merge_max("tobs_max", "NEW.tobs")},
+        prcp_count = prcp_count + (NEW.prcp IS NOT NULL),
+        prcp_sum = prcp_sum + coalesce(NEW.prcp, 0),
+        prcp_min = {_merge_min("prcp_min", "NEW.prcp")},
+        prcp_max = {_merge_max("prcp_max", "NEW.prcp")}
+    WHERE {key_col} = {key_expr};"""
+
+
+CREATE_INSERT_TRIGGER = f"""
+CREATE TRIGGER IF NOT EXISTS measurement_summary_insert AFTER INSERT ON measurement
+WHEN NEW.date IS NOT NULL
+BEGIN
+    {_merge_row("daily_summary", "date", "NEW.date")}
+    {_merge_row("day_of_year_normals", "month_day", "substr(NEW.date, 6, 5)")}
+END
+"""
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Build & Refresh
+###======================================================================================================================================================###
+
+def has_summaries(engine):
+    """True when both summary tables exist in the database."""
+
+    tables = inspect(engine).get_table_names()
+    return all(t in tables for t in SUMMARY_TABLES)
+
+
+def create_summaries(conn):
+    """Create the summary tables and the insert trigger if they do not exist."""
+
+    conn.execute(text(CREATE_DAILY_SUMMARY))
+    conn.execute(text(CREATE_DAY_OF_YEAR_NORMALS))
+    conn.execute(text(CREATE_INSERT_TRIGGER))
+
+
+def refresh_normals(conn, month_days=None):
+    """Recompute day_of_year_normals from daily_summary (all keys, or only the given '%m-%d' keys)."""
+
+    where = ""
+    params = {}
+    if month_days is not None:
+        keys = sorted(set(month_days))
+        if not keys:
+            return
+        names = [f"md{i}" for i in range(len(keys))]
+        where = "WHERE substr(date, 6, 5) IN (" + ", ".join(":" + n for n in names) + ")"
+        params = dict(zip(names, keys))
+        conn.execute(text("DELETE FROM day_of_year_normals WHERE month_day IN (" + ", ".join(":" + n for n in names) + ")"), params)
+    else:
+        conn.execute(text("DELETE FROM day_of_year_normals"))
+
+    # Normals are folded from the daily rows: min of mins, max of maxes, sum of sums & counts
+    conn.execute(text(f"""
+        INSERT INTO day_of_year_normals
+        SELECT substr(date, 6, 5),
+               sum(tobs_count), sum(tobs_sum), min(tobs_min), max(tobs_max),
+               sum(prcp_count), sum(prcp_sum), min(prcp_min), max(prcp_max)
+        FROM daily_summary {where}
+        GROUP BY substr(date, 6, 5)
+    """), params)
+
+
+def refresh(conn, start_date=None, end_date=None):
+    """Recompute daily_summary for start_date <= date <= end_date ('%Y-%m-%d', open ended when None), then the affected normals."""
+
+    params = {"start": start_date or "", "end": end_date or "9999-12-31"}
+    where = "date >= :start AND date <= :end"
+
+    conn.execute(text(f"DELETE FROM daily_summary WHERE {where}"), params)
+    conn.execute(text(f"""
+        INSERT INTO daily_summary
+        SELECT date, {AGGREGATES}
+        FROM measurement
+        WHERE date IS NOT NULL AND {where}
+        GROUP BY date
+    """), params)
+
+    if start_date is None and end_date is None:
+        refresh_normals(conn)
+    else:
+        month_days = conn.execute(text(f"SELECT DISTINCT substr(date, 6, 5) FROM daily_summary WHERE {where}"), params).scalars().all()
+        refresh_normals(conn, month_days)
+
+
+def build(engine):
+    """Create (if needed) and fully rebuild both summary tables."""
+
+    with engine.begin() as conn:
+        create_summaries(conn)
+        refresh(conn)
+
+
+def drop(engine):
+    """Remove the summary tables and the trigger."""
+
+    with engine.begin() as conn:
+        for trigger in SUMMARY_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        for table in SUMMARY_TABLES:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Main
+###======================================================================================================================================================###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the daily_summary and day_of_year_normals tables.")
+    parser.add_argument("command", choices=["build", "refresh", "drop"])
+    parser.add_argument("--db", help="Database URL (default: HAWAII_DB_URL or Resources/hawaii.sqlite)")
+    parser.add_argument("--start", help="refresh: first date to recompute, '%%Y-%%m-%%d'")
+    parser.add_argument("--end", help="refresh: last date to recompute, '%%Y-%%m-%%d'")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.db)
+
+    if args.command == "build":
+        build(engine)
+    elif args.command == "refresh":
+        with engine.begin() as conn:
+            create_summaries(conn)
+            refresh(conn, args.start, args.end)
+    else:
+        drop(engine)
+
+    if args.command != "drop":
+        with engine.connect() as conn:
+            days = conn.execute(text("SELECT count(*) FROM daily_summary")).scalar()
+            keys = conn.execute(text("SELECT count(*) FROM day_of_year_normals")).scalar()
+        print(f"daily_summary: {days} dates, day_of_year_normals: {keys} month-day keys")
+
+
+if __name__ == "__main__":
+    main()
+
+###======================================================================================================================================================###
@@ -0,0 +1,130 @@
+###======================================================================================================================================================###
+# Test fixtures: a small copy of the Hawaii data
+###======================================================================================================================================================###
+
+# The modules of SourceCode read HAWAII_DB_URL when they are imported, so the fixture database is built here, before any test
+# module imports them: four stations from 2016-01-01 on, taken from the Resources CSV files and loaded with ingest.py, with the
+# summary tables of summary.py and the station_id column of stations.py, as a fully migrated database has them.
+
+# Usage (from the SourceCode folder):
+#    # python -m pytest -q
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+import csv
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES_DIR = os.path.join(os.path.dirname(SOURCE_DIR), "Resources")
+sys.path.insert(0, SOURCE_DIR)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Fixture database
+###======================================================================================================================================================###
+
+FIXTURE_STATIONS = ("USC00519397", "USC00519281", "USC00513117", "USC00516128")
+FIXTURE_START = "2016-01-01"
+
+FIXTURE_DIR = tempfile.mkdtemp(prefix="hawaii-tests-")
+FIXTURE_DB = os.path.join(FIXTURE_DIR, "hawaii.sqlite")
+
+os.environ["HAWAII_DB_URL"] = "sqlite:///" + FIXTURE_DB
+# Every request reaches the queries
+os.environ["HAWAII_CACHE"] = "0"
+
+
+def write_subset(source, target, keep):
+    """Copy the header and the rows of the CSV file source for which keep(row) is true."""
+
+    with open(source, newline="", encoding="utf-8") as f, open(target, "w", newline="", encoding="utf-8") as out:
+        reader = csv.reader(f)
+        writer = csv.writer(out)
+        writer.writerow(next(reader))
+        writer.writerows(row for row in reader if keep(row))
+    return target
+
+
+def build_fixture_db():
+    import ingest
+    import summary
+    import stations
+    from sqlalchemy import create_engine
+
+    paths = [
+        write_subset(os.path.join(RESOURCES_DIR, "hawaii_stations.csv"), os.path.join(FIXTURE_DIR, "stations.csv"), lambda row: True),
+        write_subset(os.path.join(RESOURCES_DIR, "hawaii_measurements.csv"), os.path.join(FIXTURE_DIR, "measurements.csv"),
+                     lambda row: row[0] in FIXTURE_STATIONS and row[1] >= FIXTURE_START),
+    ]
+    ingest.ingest(FIXTURE_DB, paths)
+
+    engine = create_engine("sqlite:///" + FIXTURE_DB)
+    try:
+        summary.build(engine)
+        stations.migrate(engine)
+    finally:
+        engine.dispose()
+
+
+build_fixture_db()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(FIXTURE_DIR, ignore_errors=True)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Fixtures
+###======================================================================================================================================================###
+
+@pytest.fixture(scope="session")
+def flask_app():
+    import app
+    return app.app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def sql():
+    """fetchall(sql, params) on a connection of its own to the fixture database."""
+
+    import sqlite3
+    conn = sqlite3.connect(FIXTURE_DB)
+    yield lambda query, params=(): conn.execute(query, params).fetchall()
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def measurement_store():
+    import db
+    import store
+    return store.load_store(db.engine, db.Measurement)
+
+
+@pytest.fixture
+def fixture_copy(tmp_path):
+    """Path of a copy of the fixture database, free to modify."""
+
+    path = str(tmp_path / "hawaii.sqlite")
+    shutil.copy(FIXTURE_DB, path)
+    return path
+
+###======================================================================================================================================================###
@@ -0,0 +1,76 @@
+###======================================================================================================================================================###
+# Parity of the sqlite, numpy and duckdb backends of backends.py
+###======================================================================================================================================================###
+
+import pytest
+
+import db
+import store
+import stations
+import backends
+
+
+@pytest.fixture(scope="module")
+def dbapi_conn():
+    conn = db.engine.raw_connection()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def registry(dbapi_conn):
+    station_registry = stations.load_registry(dbapi_conn)
+    return lambda: station_registry
+
+
+@pytest.fixture(scope="module")
+def sqlite_backend(registry, dbapi_conn):
+    return backends.SQLiteBackend(registry, lambda: dbapi_conn)
+
+
+@pytest.fixture(scope="module", params=backends.BACKENDS)
+def backend(request, registry, dbapi_conn, measurement_store):
+    if request.param == "sqlite":
+        return backends.SQLiteBackend(registry, lambda: dbapi_conn)
+    if request.param == "numpy":
+        return backends.NumpyBackend(registry, lambda: measurement_store)
+    pytest.importorskip("duckdb")
+    return backends.DuckDBBackend(registry, db.engine)
+
+
+def test_backend_is_abstract(registry):
+    with pytest.raises(TypeError):
+        backends.Backend(registry)
+
+
+@pytest.mark.parametrize("query", [pytest.param(query, id=name) for name, query in backends.check_queries("2016-01-01", "2017-08-23")])
+def test_backend_returns_the_sqlite_rows(query, sqlite_backend, backend):
+    expected = backends._normalized(query(sqlite_backend))
+    assert backends._same(expected, backends._normalized(query(backend)))
+
+
+@pytest.mark.parametrize("method", ["precipitation", "tobs", "daily_temps"])
+def test_batch_size_streams_the_same_rows(method, backend):
+    rows = getattr(backend, method)("2016-08-23")
+    streamed = getattr(backend, method)("2016-08-23", batch_size=100)
+
+    assert not isinstance(streamed, list)
+    assert backends._same(backends._normalized(rows), backends._normalized(list(streamed)))
+
+
+def test_numpy_reads_the_current_store(registry, measurement_store):
+    current = [measurement_store]
+    backend = backends.NumpyBackend(registry, lambda: current[0])
+    assert backend.max_date() == "2017-08-23"
+
+    current[0] = store.MeasurementStore.from_rows([("USC00519281", "2017-08-24", 0.1, 80.0)])
+    assert backend.max_date() == "2017-08-24"
+    assert backend.tobs("2017-08-24") == [("2017-08-24", 80.0)]
+
+
+def test_empty_store_has_no_max_date(registry):
+    backend = backends.NumpyBackend(registry, lambda: store.MeasurementStore.from_rows([]))
+    assert backend.max_date() is None
+    assert backend.precipitation("2017-01-01") == []
+
+###======================================================================================================================================================###
@@ -0,0 +1,54 @@
+###======================================================================================================================================================###
+# cache.py: entries and data version changes
+###======================================================================================================================================================###
+
+import flask
+import pytest
+
+from cache import ResponseCache
+
+
+@pytest.fixture
+def versioned():
+    """(Flask app with a cached /data route, cache, data) where data["version"] is the data version and data["calls"] counts the views."""
+
+    data = {"version": 1, "calls": 0, "during_view": None}
+    cache = ResponseCache(lambda: data["version"], version_check=3600, enabled=True)
+    app = flask.Flask(__name__)
+
+    @app.route("/data")
+    @cache.cached
+    def view():
+        data["calls"] += 1
+        body = f"version {data['version']}"
+        # An ingest finishing while the view runs
+        if data["during_view"] is not None:
+            data["version"], data["during_view"] = data["during_view"], None
+        return body
+
+    return app.test_client(), cache, data
+
+
+def test_hits_until_the_version_changes(versioned):
+    client, cache, data = versioned
+    assert client.get("/data").get_data() == b"version 1"
+    assert client.get("/data").get_data() == b"version 1"
+    assert data["calls"] == 1
+
+    data["version"] = 2
+    cache.version_checked = 0
+    assert client.get("/data").get_data() == b"version 2"
+    assert data["calls"] == 2
+
+
+def test_body_rendered_during_a_version_change_is_not_cached(versioned):
+    client, cache, data = versioned
+    data["during_view"] = 2
+    assert client.get("/data").get_data() == b"version 1"
+    assert cache.stats()["entries"] == 0
+
+    assert client.get("/data").get_data() == b"version 2"
+    assert client.get("/data").get_data() == b"version 2"
+    assert data["calls"] == 2
+
+###======================================================================================================================================================###
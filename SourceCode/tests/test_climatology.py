@@ -0,0 +1,56 @@
+###======================================================================================================================================================###
+# climatology.py against numpy
+###======================================================================================================================================================###
+
+import numpy as np
+import pytest
+
+import climatology
+
+
+@pytest.fixture(scope="module")
+def normals(measurement_store):
+    return climatology.compute(measurement_store, smoothing=0, percentiles=(0, 10, 25, 50, 75, 90, 100))
+
+
+def cell_readings(measurement_store):
+    """{(group, month-day key): tobs readings}, group 0 being every station."""
+
+    s = measurement_store
+    valid = ~np.isnan(s.tobs)
+    tobs = s.tobs[valid].astype(np.float64)
+    keys = climatology.month_day_keys(s.day[valid])
+    stations = s.station[valid].astype(np.int64) + 1
+    cells = {}
+    for group, key, value in zip(np.concatenate([np.zeros(len(tobs), dtype=np.int64), stations]),
+                                 np.concatenate([keys, keys]), np.concatenate([tobs, tobs])):
+        cells.setdefault((int(group), int(key)), []).append(value)
+    return cells
+
+
+def test_percentiles_match_np_percentile(normals, measurement_store):
+    cells = cell_readings(measurement_store)
+    assert cells
+    for q in normals.percentiles:
+        computed = normals.stats[f"p{q}"]
+        for (group, key), values in cells.items():
+            assert computed[group, key] == pytest.approx(np.percentile(values, q), abs=1e-9), (q, group, key)
+
+
+def test_count_min_avg_max_per_cell(normals, measurement_store):
+    for (group, key), values in cell_readings(measurement_store).items():
+        assert normals.stats["count"][group, key] == len(values)
+        assert normals.stats["tmin"][group, key] == min(values)
+        assert normals.stats["tmax"][group, key] == max(values)
+        assert normals.stats["tavg"][group, key] == pytest.approx(np.mean(values))
+
+
+def test_cells_without_readings_are_empty(normals, measurement_store):
+    cells = cell_readings(measurement_store)
+    empty = [(g, k) for g in range(len(measurement_store.stations) + 1) for k in range(366) if (g, k) not in cells]
+    assert empty
+    for g, k in empty:
+        assert normals.stats["count"][g, k] == 0
+        assert np.isnan(normals.stats["p50"][g, k])
+
+###======================================================================================================================================================###
@@ -0,0 +1,42 @@
+###======================================================================================================================================================###
+# columnar.py export of unusual rows
+###======================================================================================================================================================###
+
+import os
+import sqlite3
+
+import columnar
+from engines import make_engine
+
+
+def test_export_skips_null_keys_and_keeps_folders_inside(fixture_copy, tmp_path):
+    conn = sqlite3.connect(fixture_copy)
+    conn.executemany("INSERT INTO measurement (station, date, prcp, tobs) VALUES (?, ?, ?, ?)",
+                     [("../../escaped", "2017-01-01", 0.5, 70.0), ("USC00519281", None, 0.1, 71.0), (None, "2017-01-01", 0.2, 72.0)])
+    conn.commit()
+    stored = conn.execute("SELECT count(*) FROM measurement WHERE station IS NOT NULL AND date IS NOT NULL").fetchone()[0]
+
+    export_path = tmp_path / "export"
+    engine = make_engine("sqlite:///" + fixture_copy)
+    try:
+        manifest = columnar.export(engine, str(export_path))
+    finally:
+        engine.dispose()
+
+    assert manifest["rows"] == stored
+    assert not (tmp_path / "escaped").exists()
+    for partition in manifest["partitions"]:
+        folder = os.path.realpath(export_path / partition["path"])
+        assert folder.startswith(os.path.realpath(export_path) + os.sep)
+
+    reader = columnar.ColumnarReader(str(export_path))
+    day, tobs = reader.tobs("2017-01-01", "2017-01-01", stations=["../../escaped"])
+    assert tobs.tolist() == [70.0]
+
+
+def test_station_folders_never_collide():
+    assert columnar.station_folder("USC00519281") == "USC00519281"
+    assert columnar.station_folder("A/B") != columnar.station_folder("A_B")
+    assert columnar.station_folder("..") not in ("..", ".", "")
+
+###======================================================================================================================================================###
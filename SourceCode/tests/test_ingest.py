@@ -0,0 +1,87 @@
+###======================================================================================================================================================###
+# ingest.py on a database with the summary trigger
+###======================================================================================================================================================###
+
+import sqlite3
+
+import pytest
+
+import ingest
+import summary
+import stations
+
+NEW_ROWS = [
+    ("USC00519281", "2017-08-24", "0.1", "80"),
+    ("USC00519281", "2017-08-25", "", "81"),
+    ("USC00519397", "2017-08-24", "0.0", "79"),
+    # Already stored: skipped
+    ("USC00519397", "2017-08-23", "0.0", "81"),
+]
+
+
+@pytest.fixture
+def new_csv(tmp_path):
+    path = tmp_path / "new.csv"
+    path.write_text("station,date,prcp,tobs\n" + "".join(",".join(row) + "\n" for row in NEW_ROWS))
+    return str(path)
+
+
+def triggers(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+def test_counts_only_the_inserted_rows(fixture_copy, new_csv):
+    before = sqlite3.connect(fixture_copy).execute("SELECT count(*) FROM measurement").fetchone()[0]
+    [report] = ingest.ingest(fixture_copy, [new_csv])
+
+    assert (report["read"], report["inserted"], report["rejected"]) == (4, 3, 0)
+    conn = sqlite3.connect(fixture_copy)
+    assert conn.execute("SELECT count(*) FROM measurement").fetchone()[0] == before + 3
+    assert conn.execute("SELECT rows_inserted FROM ingest_log WHERE path = ?", (new_csv,)).fetchone()[0] == 3
+
+
+def test_restores_the_trigger_and_refreshes_the_summary(fixture_copy, new_csv):
+    ingest.ingest(fixture_copy, [new_csv])
+    conn = sqlite3.connect(fixture_copy)
+
+    assert summary.SUMMARY_TRIGGERS[0] in triggers(conn)
+    # daily_summary of the new dates, as the trigger would have left it
+    expected = conn.execute("SELECT date, min(tobs), max(tobs), count(tobs) FROM measurement WHERE date >= '2017-08-23' "
+                            "GROUP BY date ORDER BY date").fetchall()
+    assert conn.execute("SELECT date, tobs_min, tobs_max, tobs_count FROM daily_summary WHERE date >= '2017-08-23' "
+                        "ORDER BY date").fetchall() == expected
+
+
+def test_reloading_the_same_file_inserts_nothing(fixture_copy, new_csv):
+    ingest.ingest(fixture_copy, [new_csv])
+    assert ingest.ingest(fixture_copy, [new_csv]) == []
+    [report] = ingest.ingest(fixture_copy, [new_csv], force=True)
+    assert report["inserted"] == 0
+
+
+def test_fills_station_id_and_restores_its_trigger(fixture_copy, new_csv):
+    ingest.ingest(fixture_copy, [new_csv])
+    conn = sqlite3.connect(fixture_copy)
+
+    assert stations.STATION_ID_TRIGGER in triggers(conn)
+    assert conn.execute("SELECT count(*) FROM measurement WHERE station_id IS NULL").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM measurement m JOIN station s ON s.id = m.station_id "
+                        "WHERE s.station != m.station").fetchone()[0] == 0
+
+
+def test_migrate_replaces_the_narrow_station_id_index(fixture_copy):
+    from sqlalchemy import create_engine
+
+    conn = sqlite3.connect(fixture_copy)
+    conn.execute(f"DROP INDEX {stations.STATION_ID_INDEX}")
+    conn.execute(f"CREATE INDEX {stations.STATION_ID_INDEX} ON measurement (station_id, date)")
+    conn.commit()
+    engine = create_engine("sqlite:///" + fixture_copy)
+    try:
+        assert stations.migrate(engine) is False
+    finally:
+        engine.dispose()
+    columns = [r[2] for r in conn.execute(f"PRAGMA index_info({stations.STATION_ID_INDEX})")]
+    assert columns == stations.STATION_ID_INDEX_COLUMNS
+
+###======================================================================================================================================================###
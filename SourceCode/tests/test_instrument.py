@@ -0,0 +1,57 @@
+###======================================================================================================================================================###
+# instrument.py: spans of nested timed helpers
+###======================================================================================================================================================###
+
+import time
+
+import flask
+import pytest
+from sqlalchemy import create_engine
+
+import instrument
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    instrument.init_app(app, create_engine("sqlite://"))
+
+    @instrument.timed("q_inner")
+    def inner():
+        time.sleep(0.05)
+        return [1, 2, 3]
+
+    @instrument.timed("q_outer")
+    def outer():
+        time.sleep(0.02)
+        return inner()
+
+    @app.route("/nested")
+    def nested():
+        return flask.jsonify(outer())
+
+    yield app.test_client()
+    instrument.reset()
+
+
+def server_timing(response):
+    phases = {}
+    for part in response.headers["Server-Timing"].split(", "):
+        name, *params = part.split(";")
+        phases[name] = dict(p.split("=", 1) for p in params)
+    return phases
+
+
+def test_nested_helpers_record_self_time(client):
+    phases = server_timing(client.get("/nested"))
+    outer, inner, total = (float(phases[name]["dur"]) for name in ("q_outer", "q_inner", "total"))
+
+    # Self time: the 50 ms of q_inner are not counted again under q_outer
+    assert 20 <= outer < inner
+    assert inner >= 50
+    # Counted once: the helpers never add up to more than the request
+    assert outer + inner <= total
+    # Rows of the outermost result only
+    assert phases["rows"]["desc"] == '"3"'
+
+###======================================================================================================================================================###
@@ -0,0 +1,81 @@
+###======================================================================================================================================================###
+# Cursor paging of the data routes (paging.py) against direct SQL on the fixture database
+###======================================================================================================================================================###
+
+import pytest
+
+YEAR_AGO = "2016-08-23"
+
+
+def rows(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return sorted(tuple(row) for row in response.get_json())
+
+
+def all_pages(client, url, limit, **params):
+    """Rows of every page of url, following the next cursors."""
+
+    data, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url, query_string={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        page = response.get_json()
+        assert len(page["data"]) <= limit
+        data += [tuple(row) for row in page["data"]]
+        pages += 1
+        cursor = page["next"]
+        if cursor is None:
+            return data, pages
+
+
+def test_pages_cover_the_whole_result_in_order(client, sql):
+    expected = sql("SELECT date, station, tobs FROM measurement WHERE date >= ? ORDER BY date, station", (YEAR_AGO,))
+    data, pages = all_pages(client, "/api/v1.0/tobs", 250)
+    assert data == expected
+    # limit + 1 rows are read per page: no trailing empty page
+    assert pages == -(-len(expected) // 250)
+
+
+def test_pages_filter_on_stations(client, sql):
+    expected = sql("SELECT date, station, prcp FROM measurement WHERE date >= ? AND prcp IS NOT NULL "
+                   "AND station IN ('USC00519281', 'USC00513117') ORDER BY date, station", (YEAR_AGO,))
+    data, _ = all_pages(client, "/api/v1.0/precipitation", 100, station="USC00519281,USC00513117")
+    assert data == expected
+
+
+def test_daily_pages_match_the_daily_route(client):
+    data, _ = all_pages(client, "/api/v1.0/20170101/20170630", 30)
+    assert sorted(data) == rows(client.get("/api/v1.0/20170101/20170630"))
+
+
+def test_cursor_of_other_filters_is_rejected(client):
+    cursor = client.get("/api/v1.0/tobs?limit=5&station=USC00519281").get_json()["next"]
+    response = client.get("/api/v1.0/tobs", query_string={"limit": 5, "cursor": cursor})
+    assert response.status_code == 400
+
+
+def test_columnar_page_carries_the_rows_and_the_cursor(client):
+    page = client.get("/api/v1.0/tobs", query_string={"limit": 50}).get_json()
+    response = client.get("/api/v1.0/tobs", query_string={"limit": 50, "format": "columnar"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/vnd.hawaii.columnar+json"
+    document = response.get_json()
+    assert document["next"] == page["next"]
+    assert document["station"] == [row[1] for row in page["data"]]
+    assert document["tobs"] == [row[2] for row in page["data"]]
+
+
+@pytest.mark.parametrize("params, headers", [
+    ({"limit": 10, "format": "csv"}, {}),
+    ({"limit": 10}, {"Accept": "text/csv"}),
+    ({"stream": "1", "format": "csv"}, {}),
+    ({"stream": "ndjson", "format": "columnar"}, {}),
+])
+def test_formats_a_page_or_stream_cannot_carry_are_not_acceptable(client, params, headers):
+    for url in ("/api/v1.0/precipitation", "/api/v1.0/tobs", "/api/v1.0/20170101", "/api/v1.0/20170101/20170131"):
+        response = client.get(url, query_string=params, headers=headers)
+        assert response.status_code == 406, url
+        assert "error" in response.get_json()
+
+###======================================================================================================================================================###
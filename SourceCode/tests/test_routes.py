@@ -0,0 +1,50 @@
+###======================================================================================================================================================###
+# Routes of app.py against direct SQL on the fixture database
+###======================================================================================================================================================###
+
+import pytest
+
+YEAR_AGO = "2016-08-23"
+
+
+def rows(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return sorted(tuple(row) for row in response.get_json())
+
+
+def approx_rows(expected):
+    return [tuple(pytest.approx(v) if isinstance(v, float) else v for v in row) for row in sorted(expected)]
+
+
+def test_precipitation_is_the_last_year_of_non_null_prcp(client, sql):
+    expected = sql("SELECT date, prcp FROM measurement WHERE date >= ? AND prcp IS NOT NULL", (YEAR_AGO,))
+    assert rows(client.get("/api/v1.0/precipitation")) == sorted(expected)
+
+
+def test_tobs_is_the_last_year_of_tobs(client, sql):
+    expected = sql("SELECT date, tobs FROM measurement WHERE date >= ?", (YEAR_AGO,))
+    assert rows(client.get("/api/v1.0/tobs")) == sorted(expected)
+
+
+def test_stations_are_the_station_table(client, sql):
+    expected = sql("SELECT station, name, latitude, longitude, elevation FROM station")
+    assert rows(client.get("/api/v1.0/stations")) == sorted(expected)
+
+
+def test_start_returns_daily_min_avg_max(client, sql):
+    expected = sql("SELECT date, min(tobs), avg(tobs), max(tobs) FROM measurement WHERE date >= '2017-06-01' GROUP BY date")
+    assert rows(client.get("/api/v1.0/20170601")) == approx_rows(expected)
+
+
+def test_start_end_returns_daily_min_avg_max(client, sql):
+    expected = sql("SELECT date, min(tobs), avg(tobs), max(tobs) FROM measurement "
+                   "WHERE date >= '2016-12-20' AND date <= '2017-01-10' GROUP BY date")
+    assert rows(client.get("/api/v1.0/20161220/20170110")) == approx_rows(expected)
+
+
+def test_malformed_dates_are_rejected(client):
+    response = client.get("/api/v1.0/2017-06-01")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+###======================================================================================================================================================###
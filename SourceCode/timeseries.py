@@ -0,0 +1,237 @@
+###======================================================================================================================================================###
+# Resampled and rolling time series of tobs / prcp
+###======================================================================================================================================================###
+
+# The API only returned per-date TMIN/TAVG/TMAX, so trend charts (the notebook) pulled every daily row into pandas. This module
+# reduces a date range to a few hundred points on the server:
+#    # the daily aggregates (count, sum, min, max of the column per date, for every station or a station filter) come from one
+#      GROUP BY date query, or from the date-sorted arrays of store.MeasurementStore with reduceat
+#    # resample(): week (starting Monday), month or year buckets, one reduceat over the bucket starts
+#    # rolling(): N-day rolling count / sum / mean on a dense calendar from prefix sums, each window is two subtractions;
+#      with a bucket the rolling value at the last day of every bucket is returned (e.g. monthly 30-day rainfall)
+# Route (see app.py): /api/v1.0/series/<start>/<end>?column=prcp&every=month&rolling=30&station=USC00519281
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import os
+
+import numpy as np
+
+import batch
+import store
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+COLUMNS = ("tobs", "prcp")
+BUCKETS = ("day", "week", "month", "year")
+# Largest rolling window in days, and most points a series may return (ask for a coarser bucket instead)
+MAX_WINDOW = int(os.environ.get("HAWAII_SERIES_MAX_WINDOW", "3660"))
+MAX_POINTS = int(os.environ.get("HAWAII_SERIES_MAX_POINTS", "10000"))
+
+RESAMPLE_FIELDS = ["date", "count", "mean", "sum", "min", "max"]
+ROLLING_FIELDS = ["date", "count", "mean", "sum"]
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Daily aggregates
+###======================================================================================================================================================###
+
+class Daily:
+    """Per-date count, sum, min and max of one column, sorted by day (day numbers of store.to_day)."""
+
+    __slots__ = ("day", "count", "total", "vmin", "vmax")
+
+    def __init__(self, day, count, total, vmin, vmax):
+        self.day = np.asarray(day, dtype=np.int64)
+        self.count = np.asarray(count, dtype=np.int64)
+        self.total = np.asarray(total, dtype=np.float64)
+        self.vmin = np.asarray(vmin, dtype=np.float64)
+        self.vmax = np.asarray(vmax, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.day)
+
+
+def daily_sql(dbapi_conn, column, start, end, stations=None):
+    """Daily aggregates of column ("tobs" or "prcp", never taken from the request) over [start, end] in one GROUP BY date.
+
+    The station filter is on the code: ix_measurement_date_station (date, station, prcp, tobs) covers the whole query.
+    """
+
+    clauses, params = ["date >= ?", "date <= ?"], [start, end]
+    if stations:
+        clauses.append(f"station IN ({', '.join(['?'] * len(stations))})")
+        params += stations
+    sql = (f"SELECT date, count({column}), total({column}), min({column}), max({column}) FROM measurement "
+           f"WHERE {' AND '.join(clauses)} GROUP BY date ORDER BY date")
+    rows = batch.fetch_sql(dbapi_conn, sql, params)
+    if not rows:
+        return Daily([], [], [], [], [])
+    dates, count, total, vmin, vmax = zip(*rows)
+    return Daily(store.to_days(dates), count, total,
+                 [np.nan if v is None else v for v in vmin], [np.nan if v is None else v for v in vmax])
+
+
+def daily_store(measurement_store, column, start, end, stations=None):
+    """daily_sql() over the date-sorted arrays of store.MeasurementStore."""
+
+    s = measurement_store
+    lo, hi = s.day_range(store.to_day(start), store.to_day(end))
+    day = s.day[lo:hi]
+    values = getattr(s, column)[lo:hi]
+    if stations:
+        keep = np.isin(s.station[lo:hi], [s.station_index[c] for c in stations if c in s.station_index])
+        day, values = day[keep], values[keep]
+    if len(day) == 0:
+        return Daily([], [], [], [], [])
+
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    valid = ~np.isnan(values)
+    return Daily(day[starts],
+                 np.add.reduceat(valid.astype(np.int64), starts),
+                 np.add.reduceat(np.where(valid, values, 0).astype(np.float64), starts),
+                 np.fmin.reduceat(values, starts),
+                 np.fmax.reduceat(values, starts))
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Buckets
+###======================================================================================================================================================###
+
+def bucket_starts(day, every):
+    """First day of the bucket of every day number ("day", "week" from Monday, "month" or "year")."""
+
+    day = np.asarray(day, dtype=np.int64)
+    if every == "day":
+        return day
+    if every == "week":
+        # Day 0 (1970-01-01) is a Thursday
+        return day - (day + 3) % 7
+    unit = "M" if every == "month" else "Y"
+    return day.astype("datetime64[D]").astype(f"datetime64[{unit}]").astype("datetime64[D]").astype(np.int64)
+
+
+def _value(x):
+    """float, or None for NaN (no reading)."""
+
+    return None if np.isnan(x) else float(x)
+
+
+def resample(daily, every):
+    """[(date, count, mean, sum, min, max)] per bucket. mean, sum, min and max are None for buckets without readings."""
+
+    if not len(daily):
+        return []
+    keys = bucket_starts(daily.day, every)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    count = np.add.reduceat(daily.count, starts)
+    total = np.add.reduceat(daily.total, starts)
+    vmin = np.fmin.reduceat(daily.vmin, starts)
+    vmax = np.fmax.reduceat(daily.vmax, starts)
+
+    result = []
+    for i, s in enumerate(starts):
+        n = int(count[i])
+        if n == 0:
+            result.append((store.to_date_str(keys[s]), 0, None, None, None, None))
+        else:
+            result.append((store.to_date_str(keys[s]), n, float(total[i] / n), float(total[i]), _value(vmin[i]), _value(vmax[i])))
+    return result
+
+
+def rolling(daily, window, start, end, every="day"):
+    """[(date, count, mean, sum)] of the window days ending on each date of [start, end].
+
+    daily must cover [start - window + 1, end]. Days without readings add nothing to the window; with every other than
+    "day" only the last date of each bucket (that has data) is returned.
+    """
+
+    if not len(daily):
+        return []
+    first, last = store.to_day(start) - window + 1, store.to_day(end)
+    # Dense calendar, missing days count as 0 readings
+    position = daily.day - first
+    count = np.zeros(last - first + 1, dtype=np.int64)
+    total = np.zeros(last - first + 1, dtype=np.float64)
+    count[position] = daily.count
+    total[position] = daily.total
+
+    # Prefix sums: the window ending on day i is cs[i + 1] - cs[i + 1 - window]
+    cs_count = np.r_[0, np.cumsum(count)]
+    cs_total = np.r_[0.0, np.cumsum(total)]
+    ends = np.arange(window, len(count) + 1)
+    win_count = cs_count[ends] - cs_count[ends - window]
+    win_total = cs_total[ends] - cs_total[ends - window]
+    days = first + ends - 1
+
+    # Only days with data, the last one of each bucket when resampling
+    keep = np.zeros(len(days), dtype=bool)
+    keep[daily.day[daily.day >= days[0]] - days[0]] = True
+    if every != "day":
+        keys = bucket_starts(days[keep], every)
+        last_of_bucket = np.r_[keys[1:] != keys[:-1], True]
+        keep[np.flatnonzero(keep)[~last_of_bucket]] = False
+
+    result = []
+    for d, n, t in zip(days[keep], win_count[keep], win_total[keep]):
+        n = int(n)
+        result.append((store.to_date_str(d), n, float(t / n) if n else None, float(t) if n else None))
+    return result
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Request parameters
+###======================================================================================================================================================###
+
+def requested_series(args):
+    """(column, every, window, stations) of ?column=&every=&rolling=&station=. Raises ValueError."""
+
+    column = args.get("column", "tobs")
+    if column not in COLUMNS:
+        raise ValueError(f"column must be one of {', '.join(COLUMNS)}")
+    every = args.get("every", "month")
+    if every not in BUCKETS:
+        raise ValueError(f"every must be one of {', '.join(BUCKETS)}")
+
+    window = None
+    if "rolling" in args:
+        try:
+            window = int(args["rolling"])
+        except ValueError:
+            raise ValueError("rolling must be an integer number of days")
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError(f"rolling must be between 1 and {MAX_WINDOW} days")
+
+    stations = sorted({s.strip() for value in args.getlist("station") for s in value.split(",") if s.strip()}) or None
+    return column, every, window, stations
+
+
+def series_window(start, end, every):
+    """Normalized [start, end] of the route. Raises ValueError when it is reversed or would return too many points."""
+
+    start, end = batch.normalize_date(start), batch.normalize_date(end)
+    if end < start:
+        raise ValueError("end must not be before start")
+    days = store.to_day(end) - store.to_day(start) + 1
+    per_point = {"day": 1, "week": 7, "month": 28, "year": 365}[every]
+    if days // per_point > MAX_POINTS:
+        raise ValueError(f"more than {MAX_POINTS} points: use a coarser every= bucket or a shorter range")
+    return start, end
+
+###======================================================================================================================================================###
@@ -0,0 +1,256 @@
+###======================================================================================================================================================###
+# Content negotiation: response compression and compact wire formats
+###======================================================================================================================================================###
+
+# Compression (every route): bodies of at least HAWAII_COMPRESS_MIN_BYTES are sent with Content-Encoding br (when the brotli
+# package is installed) or gzip, whichever the client's Accept-Encoding prefers. The response cache (cache.py) keeps the
+# compressed variants of each entry next to the plain body, so a cached response is compressed once, not on every hit.
+
+# Formats (the row routes: /precipitation, /stations, /tobs, /<start>, /<start>/<end>), chosen with ?format= or the Accept header:
+#    # json       application/json, the default: the arrays of rows returned so far
+#    # columnar   application/vnd.hawaii.columnar+json: {"fields": [...], "start": first date, "date": [day offsets from start],
+#                 "<field>": [values], ...}, one array per column, dates as small integers
+#    # msgpack    application/msgpack: the columnar document as MessagePack (needs the msgpack package)
+#    # csv        text/csv with a header row
+#    # arrow      application/vnd.apache.arrow.stream: an Arrow IPC stream, dates as date32 (needs the pyarrow package)
+# Responses vary on Accept and Accept-Encoding, the cache key includes the negotiated format.
+# Pages (paging.py) are json, columnar or msgpack: the columnar document carries the "next" cursor too. csv and arrow have no
+# place for it, so a page in those formats (and a streamed response in any format but json) is answered with a 406.
+
+# Configuration (environment):
+#    # HAWAII_COMPRESS=0                  disable compression
+#    # HAWAII_COMPRESS_MIN_BYTES          smallest body compressed (default 1024)
+#    # HAWAII_GZIP_LEVEL                  (default 6)
+#    # HAWAII_BROTLI_QUALITY              (default 5)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Import Dependencies
+###======================================================================================================================================================###
+
+import io
+import os
+import csv
+import gzip
+import json
+
+import numpy as np
+from flask import request
+
+# Optional encoders
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Configuration
+###======================================================================================================================================================###
+
+COMPRESS_ENABLED = os.environ.get("HAWAII_COMPRESS", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.environ.get("HAWAII_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("HAWAII_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("HAWAII_BROTLI_QUALITY", "5"))
+
+# Format name -> mimetype, json first: it is the answer to */* and to a missing Accept header
+MIMETYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.hawaii.columnar+json",
+    "msgpack": "application/msgpack",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Formats a page can be sent in (they carry its next cursor)
+PAGE_FORMATS = ("json", "columnar", "msgpack")
+
+# Formats whose encoder package is missing
+UNAVAILABLE = {name for name, module in (("msgpack", msgpack), ("arrow", pyarrow)) if module is None}
+
+# Preferred first when the client accepts both equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Negotiation
+###======================================================================================================================================================###
+
+class NotAcceptable(ValueError):
+    """The requested format cannot be produced (unknown, or its package is not installed)."""
+
+
+def requested_format():
+    """Format name from ?format=, else the best match of the Accept header among the available formats (json by default).
+
+    Raises NotAcceptable for an unknown or unavailable ?format=.
+    """
+
+    name = request.args.get("format")
+    if name is not None:
+        name = name.lower()
+        if name not in MIMETYPES:
+            raise NotAcceptable(f"format must be one of {', '.join(MIMETYPES)}")
+        if name in UNAVAILABLE:
+            raise NotAcceptable(f"format {name} is not available on this server")
+        return name
+
+    offered = [mimetype for name, mimetype in MIMETYPES.items() if name not in UNAVAILABLE]
+    # application/x-msgpack is still common
+    if "msgpack" not in UNAVAILABLE and "application/x-msgpack" in request.accept_mimetypes:
+        offered.append("application/x-msgpack")
+    best = request.accept_mimetypes.best_match(offered, default="application/json")
+    if best == "application/x-msgpack":
+        return "msgpack"
+    return next(name for name, mimetype in MIMETYPES.items() if mimetype == best)
+
+
+def requested_encoding():
+    """'br', 'gzip' or None (identity) from the Accept-Encoding header."""
+
+    if not COMPRESS_ENABLED:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Formats
+###======================================================================================================================================================###
+
+def _columns(rows, fields):
+    """Column lists of the rows (None stays None)."""
+
+    if not rows:
+        return [[] for _ in fields]
+    return [list(column) for column in zip(*rows)]
+
+
+def columnar(rows, fields):
+    """Columnar document: one list per field; a leading date column becomes day offsets from "start"."""
+
+    columns = _columns(rows, fields)
+    document = {"fields": list(fields)}
+    if fields[0] == "date":
+        days = np.array(columns[0], dtype="datetime64[D]").astype(np.int64)
+        first = int(days.min()) if len(days) else 0
+        document["start"] = str(np.datetime64(first, "D")) if len(days) else None
+        columns[0] = (days - first).tolist()
+    for field, column in zip(fields, columns):
+        document[field] = column
+    return document
+
+
+def encode_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(fields)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def encode_arrow(rows, fields):
+    columns = _columns(rows, fields)
+    arrays = []
+    for field, column in zip(fields, columns):
+        if field == "date":
+            arrays.append(pyarrow.array(np.array(column, dtype="datetime64[D]"), type=pyarrow.date32()))
+        else:
+            arrays.append(pyarrow.array(column))
+    table = pyarrow.Table.from_arrays(arrays, names=list(fields))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(rows, fields, name):
+    """(body, mimetype) of the rows (tuples in fields order) in a format other than json."""
+
+    if name == "columnar":
+        body = json.dumps(columnar(rows, fields), separators=(",", ":")) + "\n"
+    elif name == "msgpack":
+        body = msgpack.packb(columnar(rows, fields))
+    elif name == "csv":
+        body = encode_csv(rows, fields)
+    elif name == "arrow":
+        body = encode_arrow(rows, fields)
+    else:
+        raise NotAcceptable(f"format {name} has no encoder")
+    return body, MIMETYPES[name]
+
+
+def encode_page(rows, fields, next_cursor, name):
+    """(body, mimetype) of a page in columnar or msgpack: the columnar document plus its "next" cursor."""
+
+    if name not in ("columnar", "msgpack"):
+        raise NotAcceptable(f"pages are available as {', '.join(PAGE_FORMATS)}, not {name}")
+    document = columnar(rows, fields)
+    document["next"] = next_cursor
+    if name == "msgpack":
+        return msgpack.packb(document), MIMETYPES[name]
+    return json.dumps(document, separators=(",", ":")) + "\n", MIMETYPES[name]
+
+###======================================================================================================================================================###
+
+
+###======================================================================================================================================================###
+# Compression
+###======================================================================================================================================================###
+
+def compress(body, encoding):
+    """body compressed with 'br' or 'gzip'."""
+
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0: identical bodies give identical bytes (stable ETags)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def vary(response):
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
+def _after_request(response):
+    """Compress the plain bodies that the response cache did not already serve compressed."""
+
+    vary(response)
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers):
+        return response
+    encoding = requested_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    """Register the compression hook (after instrument.init_app, so /metrics records the bytes sent)."""
+
+    app.after_request(_after_request)
+    return app
+
+###======================================================================================================================================================###